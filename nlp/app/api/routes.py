@@ -1,115 +1,138 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from datetime import datetime
+import asyncio
 import json
-import os
+import threading
 
-from app.core.config import settings
-from app.core.logger import log
-from app.schemas.support_ticket import ProcessedEmail, HealthResponse, StatsResponse
-from app.models.sentiment_model import SentimentAnalyzer
-from app.models.classifier_model import Classifier
+from app.schemas.support_ticket import ProcessedEmail, HealthResponse, StatsResponse, SearchHit
+from app.models.registry import registry
+from app.services.record_store import record_store
+from app.services.stats_aggregator import stats_aggregator
 
 router = APIRouter()
 
+# Модели, которые API-процесс загружает в lifespan и отдаёт в /health
+API_MODELS = ("sentiment", "classifier")
+
 def load_records() -> List[dict]:
-    """Загрузка обработанных записей"""
-    if os.path.exists(settings.records_file):
-        try:
-            with open(settings.records_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            log.error(f"Ошибка загрузки записей: {e}")
-    return []
+    """Загрузка обработанных записей (из индексированного хранилища)"""
+    return record_store.all()
 
 @router.get("/health", response_model=HealthResponse, tags=["System"])
 async def health_check():
-    """Проверка здоровья API"""
-    models_status = {}
-    try:
-        SentimentAnalyzer()
-        models_status['sentiment'] = 'ok'
-    except:
-        models_status['sentiment'] = 'error'
-    
-    try:
-        Classifier()
-        models_status['classifier'] = 'ok'
-    except:
-        models_status['classifier'] = 'error'
-    
+    """Проверка здоровья API (только чтение состояния реестра моделей)"""
+    models_status = registry.status(API_MODELS)
+    all_ready = all(m['state'] == 'ready' for m in models_status.values())
+
     return HealthResponse(
-        status="healthy",
+        status="healthy" if all_ready else "degraded",
         timestamp=datetime.now().isoformat(),
         models=models_status
     )
 
 @router.get("/tickets", response_model=List[ProcessedEmail], tags=["Tickets"])
 async def get_tickets(
+    response: Response,
     limit: int = Query(50, ge=1, le=500),
     sentiment: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
-    search: Optional[str] = Query(None)
+    search: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None, description="Курсор из заголовка X-Next-Cursor")
+):
+    """Получение обработанных обращений с фильтрацией (новые сначала)"""
+    try:
+        records, next_cursor = record_store.query(
+            sentiment=sentiment,
+            category=category,
+            limit=limit,
+            cursor=cursor,
+            search=search
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    return [ProcessedEmail(**r) for r in records]
+
+@router.get("/tickets/search", response_model=List[SearchHit], tags=["Tickets"])
+async def search_tickets(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=200)
 ):
-    """Получение обработанных обращений с фильтрацией"""
-    records = load_records()
-    
-    # Фильтрация
-    if sentiment:
-        records = [r for r in records if r.get('sentiment') == sentiment]
-    if category:
-        records = [r for r in records if r.get('category') == category]
-    if search:
-        search_lower = search.lower()
-        records = [r for r in records if 
-                   search_lower in str(r.get('description', '')).lower() or
-                   search_lower in str(r.get('fio', '')).lower() or
-                   search_lower in str(r.get('object_name', '')).lower()]
-    
-    # Сортировка по дате (новые сначала)
-    records.sort(key=lambda x: x.get('processed_at', ''), reverse=True)
-    
-    return [ProcessedEmail(**r) for r in records[:limit]]
+    """Полнотекстовый поиск по обращениям с ранжированием и подсветкой"""
+    return [
+        SearchHit(ticket=ProcessedEmail(**record), score=round(score, 4), highlights=highlights)
+        for record, score, highlights in record_store.search(q, limit=limit)
+    ]
 
 @router.get("/tickets/{email_id}", response_model=ProcessedEmail, tags=["Tickets"])
 async def get_ticket(email_id: str):
     """Получение конкретного обращения по ID"""
-    records = load_records()
-    for record in records:
-        if record.get('email_id') == email_id:
-            return ProcessedEmail(**record)
-    raise HTTPException(status_code=404, detail="Обращение не найдено")
+    record = record_store.get(email_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Обращение не найдено")
+    return ProcessedEmail(**record)
 
 @router.get("/stats", response_model=StatsResponse, tags=["Analytics"])
-async def get_stats():
-    """Статистика обработанных обращений"""
-    records = load_records()
-    
-    by_sentiment = {}
-    by_category = {}
-    
-    for r in records:
-        sent = r.get('sentiment', 'unknown')
-        cat = r.get('category', 'unknown')
-        by_sentiment[sent] = by_sentiment.get(sent, 0) + 1
-        by_category[cat] = by_category.get(cat, 0) + 1
-    
+async def get_stats(rebuild: bool = Query(False, description="Пересчитать по всем записям")):
+    """Статистика обработанных обращений (агрегаты, поддерживаемые при записи)"""
+    if rebuild or not stats_aggregator.load():
+        stats_aggregator.rebuild(record_store.all())
+
+    stats = stats_aggregator.snapshot()
     return StatsResponse(
-        total_processed=len(records),
-        by_sentiment=by_sentiment,
-        by_category=by_category,
-        last_updated=datetime.now().isoformat()
+        total_processed=stats['total_processed'],
+        by_sentiment=stats['by_sentiment'],
+        by_category=stats['by_category'],
+        by_response_method=stats['by_response_method'],
+        by_device_type=stats['by_device_type'],
+        by_day=stats['by_day'],
+        last_updated=stats['last_updated'] or datetime.now().isoformat()
     )
 
 @router.post("/tickets/{email_id}/response", tags=["Tickets"])
 async def get_response(email_id: str):
     """Получение сгенерированного ответа для обращения"""
-    records = load_records()
-    for record in records:
-        if record.get('email_id') == email_id:
-            return {
-                'subject': record.get('response_subject'),
-                'body': record.get('response_body'),
-                'method': record.get('response_method')
-            }
-    raise HTTPException(status_code=404, detail="Обращение не найдено")
\ No newline at end of file
+    record = record_store.get(email_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Обращение не найдено")
+    return {
+        'subject': record.get('response_subject'),
+        'body': record.get('response_body'),
+        'method': record.get('response_method')
+    }
+
+@router.post("/tickets/{email_id}/response/stream", tags=["Tickets"])
+async def stream_response(email_id: str):
+    """
+    Повторная генерация ответа с потоковой выдачей (Server-Sent Events):
+    события delta с фрагментами текста, затем done с итоговым ответом
+    """
+    record = record_store.get(email_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Обращение не найдено")
+    try:
+        # Генератор не входит в API_MODELS — загружается при первом запросе
+        generator = await asyncio.to_thread(registry.get, "response_generator")
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Генератор ответов недоступен: {e}")
+
+    async def events():
+        # События читаются из синхронного генератора в потоке; при отключении
+        # клиента задача отменяется, и cancel останавливает model.generate
+        cancel = threading.Event()
+        stream = generator.stream(record, cancel=cancel)
+        try:
+            while True:
+                event = await asyncio.to_thread(next, stream, None)
+                if event is None:
+                    break
+                yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            cancel.set()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -17,6 +17,14 @@ class Settings(BaseSettings):
     smtp_use_tls: bool = True
     smtp_ssl_verify: bool = True          # False — только для внутренних серверов!
     smtp_ssl_ca_cert: Optional[str] = None  # Путь к CA-сертификату
+    smtp_batch_size: int = Field(10)      # Ответов за одну SMTP-сессию
+    
+    # Очередь исходящих писем
+    outbox_dir: Path = Path(__file__).parent.parent.parent / "data" / "outbox"
+    outbox_max_attempts: int = Field(8)        # После — в dead/
+    outbox_backoff_base: float = Field(30.0)   # Сек до первого повтора, дальше ×2
+    outbox_backoff_max: float = Field(3600.0)
+    outbox_rate_per_minute: float = Field(20.0)  # Лимит писем в минуту на SMTP-провайдера
     
     # Отправитель
     from_email: str = "support@eriskip.ru"
@@ -27,9 +35,33 @@ class Settings(BaseSettings):
     sentiment_name: str = Field("blanchefort/rubert-base-cased-sentiment")
     response_name: str = Field("Qwen/Qwen2.5-0.5B-Instruct")
     #summarization_name: str = Field("cointegrated/rubert-tiny2")
+    embedding_name: str = Field("cointegrated/rubert-tiny2")
     
     device: str = Field("cpu")
+    # torch — fp32; torch_int8 — динамическое int8-квантование PyTorch;
+    # onnx_int8 — int8 ONNX Runtime (нужен optimum[onnxruntime], для LLM — torch_int8)
+    inference_backend: str = Field("torch")
+    onnx_cache_dir: Path = Path(__file__).parent.parent.parent / "data" / "onnx"
     max_length: int = Field(512)
+    sentiment_batch_size: int = Field(16)
+    classifier_batch_size: int = Field(32)  # Пар (письмо, категория) за один forward pass
+    llm_prefix_cache: bool = True           # KV-кэш неизменного начала промпта генератора
+    llm_batch_size: int = Field(4)          # Ответов, декодируемых LLM одновременно
+
+    # Семантический кэш ответов: готовый ответ на почти одинаковый вопрос
+    response_cache_enabled: bool = True
+    response_cache_file: Path = Path(__file__).parent.parent.parent / "data" / "response_cache.json"
+    response_cache_threshold: float = Field(0.92)  # Минимальная косинусная близость описаний
+    response_cache_max_entries: int = Field(2000)
+    response_cache_ttl: float = Field(7 * 86400)    # Сек жизни ответа в кэше
+
+    # Уровень эмбеддингов между keywords и NLI
+    embedding_enabled: bool = True
+    embedding_margin: float = Field(0.05)  # Минимальный отрыв top-1 от top-2 по косинусу
+    embedding_use_history: bool = True
+    embedding_history_limit: int = Field(50)  # Исторических примеров на категорию
+    embedding_history_min_confidence: float = Field(0.8)
+    embedding_temperature: float = Field(0.05)  # Температура softmax по близостям к прототипам
 
     # === Сервер ===
     host: str = Field("0.0.0.0")
@@ -39,10 +71,33 @@ class Settings(BaseSettings):
     log_level: str = Field("INFO")
 
     records_file: Path = Path(__file__).parent.parent.parent / "data" / "records.json"
+    records_compact_every: int = Field(1000)  # Записей в журнале до слияния в снимок
+    stats_file: Path = Path(__file__).parent.parent.parent / "data" / "stats.json"
 
     # === Интервалы ===
     poll_interval: int = Field(60)
-    processed_file: str = Field("processed_emails.json")
+    processed_file: str = Field("processed_emails.json")  # Старый формат, переносится при запуске
+    processed_store_file: Path = Path(__file__).parent.parent.parent / "data" / "processed_ids.log"
+    processed_ttl_days: int = Field(180)
+
+    # IMAP-сессия
+    imap_idle_enabled: bool = True
+    imap_idle_timeout: int = Field(300)          # Сек; серверы обрывают IDLE через ~30 мин
+    imap_reconnect_max_delay: int = Field(300)   # Потолок задержки переподключения, сек
+    imap_state_file: Path = Path(__file__).parent.parent.parent / "data" / "imap_state.json"
+    imap_fetch_max_bytes: int = Field(262144)    # Тело в первом FETCH; письма крупнее дозапрашиваются целиком
+    imap_fetch_retries: int = Field(5)           # Попыток получить письмо, прежде чем пропустить его
+
+    # === Конвейер EmailWorker ===
+    pipeline_enabled: bool = True
+    pipeline_queue_size: int = Field(32)     # Ёмкость очереди перед каждой стадией
+    pipeline_parse_workers: int = Field(2)
+    pipeline_infer_batch: int = Field(16)    # Писем за один вызов тональности/классификатора
+    pipeline_send_workers: int = Field(4)
+
+    # Пул процессов инференса (0 — модели в процессе EmailWorker)
+    inference_workers: int = Field(0)
+    inference_threads_per_worker: int = Field(0)  # 0 — cpu_count // inference_workers
 
     # === MySQL Database ===
     db_host: str = Field("db")
@@ -50,6 +105,12 @@ class Settings(BaseSettings):
     db_user: str = Field("root")
     db_pass: str = Field("root")
     db_name: str = Field("enigma_db")
+    db_batch_size: int = Field(100)       # Тикетов в одной транзакции
+    db_write_behind: bool = True          # Конвейер пишет в БД фоном, пачками
+    db_flush_interval: float = Field(2.0) # Сек: наибольшая задержка записи пачки
+    db_queue_size: int = Field(1000)      # Записей в буфере до обратного давления
+    db_cache_size: int = Field(10000)     # Записей в кэше каждого справочника
+    db_cache_ttl: int = Field(600)        # Сек до перечитывания малых справочников
 
     class Config:
         env_file = ".env"
@@ -2,19 +2,25 @@ import imaplib
 import email
 from email.header import decode_header
 from datetime import datetime
-import json
-import os
 import asyncio
 import re
+import threading
+import time
+from collections import deque
+from pathlib import Path
 
 from app.core.config import settings
 from app.core.logger import log
-from app.models.sentiment_model import SentimentAnalyzer
-from app.models.classifier_model import Classifier
-from app.models.summarizer_model import SummarizerModel
-from app.services.parser import Parser
-from app.models.response_generator import ResponseGenerator
+from app.models.registry import registry
+from app.services.async_db_writer import AsyncTicketWriter
 from app.services.email_sender import EmailSender
+from app.services.imap_session import ImapSession, UidWatermark
+from app.services.inference_pool import InferencePool, InferencePoolError, predict_batch
+from app.services.outbox import Outbox
+from app.services.pipeline import Pipeline, Stage
+from app.services.processed_store import ProcessedIdStore
+from app.services.record_log import record_log
+from app.services.stats_aggregator import stats_aggregator
 
 
 class EmailWorker:    
@@ -28,15 +34,42 @@ class EmailWorker:
         self.smtp_server = settings.smtp_server
         self.smtp_port = settings.smtp_port
         
-        self.processed_file = settings.processed_file
-        self.processed_ids = self._load_processed_ids()
+        self.processed_ids = ProcessedIdStore(
+            settings.processed_store_file,
+            ttl_seconds=settings.processed_ttl_days * 86400,
+            legacy_json=Path(settings.processed_file),
+        )
+        self._in_flight = set()       # UID полученных, но ещё не прошедших конвейер писем
+        self._stopping = threading.Event()
+        self._fatal_error = None      # Сбой, после которого воркер останавливается
+        
+        self.uid_watermark = UidWatermark(settings.imap_state_file)
+        self._fetch_cursor = self.uid_watermark.last_uid  # Наибольший уже полученный UID
+        self._fetch_retry = {}        # UID, которые не удалось получить -> число попыток
+        self._uid_lock = threading.Lock()
+        
+        self.imap_session = ImapSession(
+            self.imap_server, self.imap_port, self.email_user, self.email_password, self.folder,
+            idle_enabled=settings.imap_idle_enabled,
+            max_backoff=settings.imap_reconnect_max_delay,
+        )
+        self._seen_queue = deque()    # Обработаны, отметить прочитанными при следующем опросе
+        self._reconcile_stats()
         
         log.info("Инициализация моделей...")
-        self.sentiment = SentimentAnalyzer()
-        self.classifier = Classifier()
-        self.summarizer = SummarizerModel()
-        self.parser = Parser()
-        self.response_generator = ResponseGenerator()
+        self.summarizer = registry.get("summarizer")
+        self.parser = registry.get("parser")
+        self.inference_pool = None
+        self.db_writer = None         # Отложенная запись в БД (только в режиме конвейера)
+        if settings.inference_workers > 0:
+            # Нейросетевые модели живут в процессах пула, здесь не загружаются
+            self.sentiment = self.classifier = self.response_generator = None
+            self.inference_pool = InferencePool(settings.inference_workers, settings.inference_threads_per_worker)
+            self.inference_pool.start()
+        else:
+            self.sentiment = registry.get("sentiment")
+            self.classifier = registry.get("classifier")
+            self.response_generator = registry.get("response_generator")
         log.success("Все модели загружены")
 
         self.sender = EmailSender(
@@ -48,42 +81,27 @@ class EmailWorker:
 
             use_tls=settings.smtp_use_tls,
             ssl_verify=settings.smtp_ssl_verify,
-            ssl_ca_cert=settings.smtp_ssl_ca_cert
+            ssl_ca_cert=settings.smtp_ssl_ca_cert,
+            pool_size=settings.pipeline_send_workers,
         )   
+        # Ответы уходят через очередь на диске: SMTP не тормозит обработку
+        self.outbox = Outbox(
+            settings.outbox_dir,
+            self.sender,
+            max_attempts=settings.outbox_max_attempts,
+            backoff_base=settings.outbox_backoff_base,
+            backoff_max=settings.outbox_backoff_max,
+            rate_per_minute=settings.outbox_rate_per_minute,
+            batch_size=settings.smtp_batch_size,
+        )
+        self.outbox.start()
     
-    def _load_processed_ids(self) -> set:
-        """Загрузка ID обработанных писем"""
-        if os.path.exists(self.processed_file):
-            try:
-                with open(self.processed_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    log.info(f"Загружено {len(data)} ID обработанных писем")
-                    return set(data)
-            except Exception as e:
-                log.warning(f"Ошибка загрузки: {e}")
-                return set()
-        log.info("Файл обработанных писем не найден")
-        return set()
-    
-    def _save_processed_ids(self):
-        """Сохранение ID обработанных писем"""
-        try:
-            with open(self.processed_file, 'w', encoding='utf-8') as f:
-                json.dump(list(self.processed_ids), f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            log.error(f"Ошибка сохранения: {e}")
-    
-    def connect(self) -> imaplib.IMAP4_SSL:
-        """Подключение к почте"""
-        log.info(f"Подключение к {self.imap_server}:{self.imap_port}...")
-        try:
-            imap = imaplib.IMAP4_SSL(self.imap_server, self.imap_port, timeout=30)
-            imap.login(self.email_user, self.email_password)
-            log.success("Авторизация успешна")
-            return imap
-        except Exception as e:
-            log.error(f"Ошибка подключения: {e}")
-            raise
+    def _reconcile_stats(self):
+        """Пересчёт агрегатов статистики, если они расходятся с журналом записей"""
+        records = record_log.read_all()
+        if not stats_aggregator.load() or stats_aggregator.total != len(records):
+            stats_aggregator.rebuild(records)
+            stats_aggregator.save()
     
     def decode_subject(self, subject: str) -> str:
         """Декодирование темы письма"""
@@ -148,9 +166,148 @@ class EmailWorker:
         
         return body
     
-    def process_email(self, email_id: str, msg: email.message.Message) -> dict:
-        """Обработка одного письма через конвейер моделей"""
+    # =========================================================================
+    # СТАДИИ ОБРАБОТКИ (общие для конвейера и последовательного режима)
+    # =========================================================================
+    
+    def _fetch_new(self, limit: int = 10) -> list:
+        """
+        Стадия fetch: пакетная отметка прочитанными обработанных писем и
+        получение новых непрочитанных (UID выше уже полученных)
+        
+        Returns:
+            Список заданий {'uid', 'email_id', 'processed_key', 'msg'}
+        """
+        session = self.imap_session
+        jobs = []
+        
+        try:
+            session.ensure()
+            if self.uid_watermark.sync(session.uidvalidity):
+                # UID прежнего состояния папки недействительны
+                self._seen_queue.clear()
+                with self._uid_lock:
+                    self._fetch_cursor = 0
+                    self._fetch_retry.clear()
+            
+            # Письма, прошедшие конвейер с прошлого опроса, — одной командой
+            seen = []
+            while self._seen_queue:
+                seen.append(self._seen_queue.popleft())
+            if seen:
+                try:
+                    session.mark_seen(seen)
+                except (imaplib.IMAP4.abort, OSError):
+                    self._seen_queue.extendleft(seen)
+                    raise
+                except Exception as e:
+                    log.warning(f"Не удалось отметить письма прочитанными: {e}")
+            
+            uids = session.search_unseen(self._fetch_cursor)
+            log.info(f"Найдено {len(uids)} новых непрочитанных писем")
+            # Письма, которые не удалось получить в прошлый раз, — первыми
+            with self._uid_lock:
+                retry = sorted(self._fetch_retry)
+            uids = sorted(set(retry) | set(uids))[:limit]
+            if not uids:
+                return []
+            
+            # Заголовки и начало тела всей пачки — одним UID FETCH; PEEK не
+            # ставит \Seen, письмо отмечается прочитанным только после обработки
+            max_bytes = settings.imap_fetch_max_bytes
+            fetched = session.fetch(uids, f'(UID RFC822.SIZE BODY.PEEK[HEADER] BODY.PEEK[TEXT]<0.{max_bytes}>)')
+            messages, truncated = {}, []
+            for uid in uids:
+                data = fetched.get(uid)
+                if data is None or 'BODY[HEADER]' not in data:
+                    continue
+                raw = data['BODY[HEADER]'] + (data.get('BODY[TEXT]') or b'')
+                messages[uid] = email.message_from_bytes(raw)
+                if (data['size'] or 0) > len(raw):
+                    truncated.append(uid)
+            
+            # Обрезанное тело дало бы неполный текст и испорченные base64/QP-части —
+            # крупные письма дозапрашиваются целиком
+            if truncated:
+                for uid, data in session.fetch(truncated, '(UID BODY.PEEK[])').items():
+                    if 'BODY[]' in data:
+                        messages[uid] = email.message_from_bytes(data['BODY[]'])
+        except (imaplib.IMAP4.abort, OSError):
+            session.reset()
+            raise
+        
+        with self._uid_lock:
+            for uid in uids:
+                if uid not in messages:
+                    self._fetch_failed(uid)
+                    continue
+                self._fetch_retry.pop(uid, None)
+                processed_key = self._processed_key(uid)
+                message_id = (messages[uid]['Message-ID'] or '').strip() or None
+                # Message-ID ловит то же письмо под другим UID (перемещение, повторная доставка)
+                if processed_key in self.processed_ids or (message_id and message_id in self.processed_ids):
+                    log.debug(f"Письмо UID {uid} уже обработано")
+                    self._seen_queue.append(uid)
+                    continue
+                self._in_flight.add(uid)
+                jobs.append({
+                    'uid': uid,
+                    'email_id': str(uid),
+                    'processed_key': processed_key,
+                    'message_id': message_id,
+                    'msg': messages[uid],
+                })
+            self._fetch_cursor = max(self._fetch_cursor, uids[-1])
+        self._commit_watermark()
         
+        return jobs
+    
+    def _fetch_failed(self, uid: int):
+        """
+        Письмо не получено: UID остаётся в списке повторов (курсор его уже
+        прошёл) и держит отметку, пока попытки не исчерпаны
+        """
+        attempts = self._fetch_retry.get(uid, 0) + 1
+        if attempts >= settings.imap_fetch_retries:
+            self._fetch_retry.pop(uid, None)
+            log.error(f"Письмо UID {uid} не удалось получить за {attempts} попыток, пропущено")
+        else:
+            self._fetch_retry[uid] = attempts
+            log.warning(f"Не удалось получить письмо UID {uid} (попытка {attempts}), повтор при следующем опросе")
+    
+    def _processed_key(self, uid: int) -> str:
+        """Ключ письма в processed_ids: UID действителен только вместе с UIDVALIDITY"""
+        return f"{self.imap_session.uidvalidity}:{uid}"
+    
+    def _commit_watermark(self):
+        """Сохранение отметки: все письма с UID не выше неё прошли конвейер"""
+        with self._uid_lock:
+            pending = self._in_flight | self._fetch_retry.keys()
+            committed = min(pending) - 1 if pending else self._fetch_cursor
+            self.uid_watermark.advance(committed)
+    
+    def _wait_for_mail(self, poll_interval: int):
+        """
+        Ожидание новых писем: IDLE в открытой сессии, без поддержки IDLE — пауза.
+        Ожидание прерывается, когда есть письма для отметки прочитанными.
+        """
+        interrupt = lambda: bool(self._seen_queue) or self._stopping.is_set()
+        if self.imap_session.supports_idle:
+            try:
+                if self.imap_session.idle(settings.imap_idle_timeout, interrupt=interrupt):
+                    log.info("Сервер сообщил о новых письмах")
+            except Exception as e:
+                log.warning(f"IDLE прерван: {e}")
+                self.imap_session.reset()
+            return
+        
+        deadline = time.monotonic() + poll_interval
+        while time.monotonic() < deadline and not interrupt():
+            time.sleep(min(1.0, deadline - time.monotonic()))
+    
+    def _parse_job(self, job: dict) -> dict:
+        """Стадия parse: заголовки, тело, суть вопроса и извлечение данных"""
+        email_id, msg = job['email_id'], job['msg']
         subject = self.decode_subject(msg['Subject'])
         sender_name, sender_email = self.decode_sender(msg['From'])
         date = msg['Date']
@@ -168,133 +325,281 @@ class EmailWorker:
         log.info(f"   Дата: {date}")
         log.info(f"{'='*60}")
         
-        # === КОНВЕЙЕР МОДЕЛЕЙ ===
-        
-        # 1. Анализ тональности
-        log.info("Анализ тональности...")
-        sentiment_result = self.sentiment.predict(text)
-        log.info(f"   Тональность: {sentiment_result['sentiment']} ({sentiment_result['confidence']:.0%})")
-
-        # 2. Классификация запроса
-        log.info("Классификация запроса...")
-        classifier_result = self.classifier.predict(text, subject)
-        log.info(f"   Категория: {classifier_result['category']} ({classifier_result['confidence']:.0%})")
-
-        # 3. Суть вопроса
-        log.info("Формирование сути вопроса...")
+        # Суть вопроса
         summarizer_result = self.summarizer.summarize(text, subject)
         log.info(f"   Суть: {summarizer_result['summary'][:100]}...")
         
-        # 4. Парсинг данных (ФИО, телефоны, модели, номера)
-        log.info("Извлечение данных...")
+        # Парсинг данных (ФИО, телефоны, модели, номера)
         parser_result = self.parser.parse_all(text, subject, sender_name)
         
-        # === ФОРМИРОВАНИЕ ЗАПИСИ ДЛЯ ВЕБ-ТАБЛИЦЫ ===
-        record = {
-            'email_id': email_id,
+        job.update({
+            'subject': subject,
+            'sender_name': sender_name,
+            'sender_email': sender_email,
             'date': date,
             'text': text,
-            'fio': parser_result['fio'] or sender_name,
-            'object_name': parser_result['object_name'],
-            'phone': parser_result['phones'][0] if parser_result['phones'] else None,
-            'email': parser_result['emails'][0] if parser_result['emails'] else sender_email,
-            'serial_numbers': parser_result['serial_numbers'],
-            'device_type': parser_result['device_types'][0] if parser_result['device_types'] else None,
-            'description': summarizer_result['summary'],
-            'sentiment': sentiment_result['sentiment'],
-            'sentiment_confidence': sentiment_result['confidence'],
-            'category': classifier_result['category'],
-            'category_confidence': classifier_result['confidence'],
-            'processed_at': datetime.now().isoformat(),
-        }
-        
-        log.info(f"   ФИО: {record['fio']}")
-        log.info(f"   Объект: {record['object_name']}")
-        log.info(f"   Телефон: {record['phone']}")
-        log.info(f"   Email: {record['email']}")
-        log.info(f"   Приборы: {record['device_type']}")
-        log.info(f"   Серийные номера: {record['serial_numbers']}")
-        
-        self.processed_ids.add(email_id)
-        self._save_processed_ids()
-        
-        log.success(f"Письмо #{email_id} успешно обработано")
-
-        log.info("Генерация ответа...")
-        response = self.response_generator.generate(record)
-        record['response_body'] = response['body']
-        record['response_subject'] = response['subject']
-        record['response_method'] = response['method']
-
-        from app.services.database_writer import DatabaseWriter
-        DatabaseWriter.save_ticket(record)  
-        
-        log.info("Отправка письма...")
-        success = self.sender.send(
-            to_email=record['email'],
-            subject=record['response_subject'],
-            text=record['response_body'],
-        )
-        if success:
-            log.info("Письмо отправлено")
+            'summary': summarizer_result['summary'],
+            'parsed': parser_result,
+        })
+        return job
+    
+    def _predict_batch(self, jobs: list) -> tuple:
+        """Пакетные тональность и классификация — локально или в пуле процессов"""
+        texts = [job['text'] for job in jobs]
+        subjects = [job['subject'] for job in jobs]
+        
+        if self.inference_pool:
+            return self.inference_pool.infer(texts, subjects)
+        return predict_batch(self.sentiment, self.classifier, texts, subjects)
+    
+    def _infer_jobs(self, jobs: list) -> list:
+        """Стадия infer: тональность и классификация пачкой, формирование записи"""
+        sentiments, categories = self._predict_batch(jobs)
+        
+        for job, sentiment_result, classifier_result in zip(jobs, sentiments, categories):
+            parser_result = job['parsed']
+            
+            # === ФОРМИРОВАНИЕ ЗАПИСИ ДЛЯ ВЕБ-ТАБЛИЦЫ ===
+            record = {
+                'email_id': job['email_id'],
+                'date': job['date'],
+                'text': job['text'],
+                'fio': parser_result['fio'] or job['sender_name'],
+                'object_name': parser_result['object_name'],
+                'phone': parser_result['phones'][0] if parser_result['phones'] else None,
+                'email': parser_result['emails'][0] if parser_result['emails'] else job['sender_email'],
+                'serial_numbers': parser_result['serial_numbers'],
+                'device_type': parser_result['device_types'][0] if parser_result['device_types'] else None,
+                'description': job['summary'],
+                'sentiment': sentiment_result['sentiment'],
+                'sentiment_confidence': sentiment_result['confidence'],
+                'category': classifier_result['category'],
+                'category_confidence': classifier_result['confidence'],
+                'category_method': classifier_result['method'],
+                'processed_at': datetime.now().isoformat(),
+            }
+            job['record'] = record
+            
+            log.info(f"Письмо #{job['email_id']}: {record['sentiment']} ({record['sentiment_confidence']:.0%}), "
+                     f"{record['category']} ({record['category_confidence']:.0%}), "
+                     f"ФИО: {record['fio']}, телефон: {record['phone']}, прибор: {record['device_type']}")
+        
+        # Письмо считается обработанным до генерации и отправки ответа:
+        # после сбоя оно не будет обработано повторно (не более одного раза).
+        # Ключи пачки дописываются одним fsync
+        keys = []
+        for job in jobs:
+            keys.append(job.get('processed_key', job['email_id']))
+            keys.append(job.get('message_id'))
+        self.processed_ids.add_many(keys)
+        return jobs
+    
+    def _generate_jobs(self, jobs: list) -> list:
+        """Стадия generate: ответы клиентам (LLM декодирует пачку вместе)"""
+        records = [job['record'] for job in jobs]
+        if self.inference_pool:
+            responses = self.inference_pool.generate_batch(records)
+        else:
+            responses = self.response_generator.generate_batch(records)
+        for record, response in zip(records, responses):
+            record['response_body'] = response['body']
+            record['response_subject'] = response['subject']
+            record['response_method'] = response['method']
+        return jobs
+    
+    def _persist_jobs(self, jobs: list) -> list:
+        """Стадия persist: БД, журнал записей API и статистика"""
+        records = [job['record'] for job in jobs]
+        if self.db_writer is not None:
+            # Запись в БД — фоном, пачками; ждём только при переполнении буфера
+            self.db_writer.put_threadsafe(records)
         else:
-            log.error("Ошибка отправки")
-        return record
+            from app.services.database_writer import DatabaseWriter
+            DatabaseWriter.save_tickets(records)
+        self._save_to_api_storage(records)
+        return jobs
+    
+    def _send_jobs(self, jobs: list) -> list:
+        """Стадия send: постановка ответов в очередь исходящих (отправляет фоновый поток)"""
+        for job in jobs:
+            self.outbox.enqueue(
+                to_email=job['record']['email'],
+                subject=job['record']['response_subject'],
+                text=job['record']['response_body'],
+                email_id=job['email_id'],
+            )
+            log.success(f"Письмо #{job['email_id']} успешно обработано, ответ в очереди")
+        return jobs
+    
+    def _job_finished(self, job: dict, error: Exception = None):
+        """
+        Задание покинуло конвейер: прочитанным письмо отмечается только без
+        ошибки, отметка UID сдвигается в любом случае (ошибочное письмо
+        остаётся непрочитанным в ящике и повторно не обрабатывается).
+        
+        Исключение — недоступный пул инференса: письмо остаётся в обработке
+        и держит отметку, воркер останавливается, и после перезапуска
+        письма с этого места будут получены снова (прошедшие стадию infer
+        уже учтены в processed_ids и, как при любом сбое, пропускаются).
+        """
+        uid = job.get('uid')
+        if isinstance(error, InferencePoolError):
+            if self._fatal_error is None:
+                log.critical(f"🛑 Пул инференса недоступен, воркер останавливается: {error}")
+            self._fatal_error = error
+            self._stopping.set()
+            return
+        if uid is None:
+            return
+        with self._uid_lock:
+            self._in_flight.discard(uid)
+        if error is None:
+            self._seen_queue.append(uid)
+        self._commit_watermark()
+    
+    # =========================================================================
+    # ПОСЛЕДОВАТЕЛЬНЫЙ РЕЖИМ
+    # =========================================================================
+    
+    def process_email(self, email_id: str, msg: email.message.Message) -> dict:
+        """Обработка одного письма всеми стадиями подряд"""
+        job = self._parse_job({'email_id': email_id, 'msg': msg})
+        if job is None:
+            return None
+        job = self._infer_jobs([job])[0]
+        job = self._generate_jobs([job])[0]
+        job = self._persist_jobs([job])[0]
+        return self._send_jobs([job])[0]['record']
     
     def fetch_and_process(self, limit: int = 10) -> list:
-        """Получение и обработка непрочитанных писем"""
+        """Получение и последовательная обработка непрочитанных писем"""
         log.info(f"Получение непрочитанных писем (лимит: {limit})...")
         
-        imap = self.connect()
         processed_records = []
+        jobs = []
+        for job in self._fetch_new(limit):
+            try:
+                parsed = self._parse_job(job)
+                if parsed is None:
+                    self._job_finished(job)
+                else:
+                    jobs.append(parsed)
+            except Exception as e:
+                log.error(f"Ошибка обработки письма #{job['email_id']}: {e}")
+                self._job_finished(job, e)
+        
+        generated = []
+        if jobs:
+            try:
+                self._infer_jobs(jobs)
+                # Ответы всей пачки — одним батчем LLM
+                generated = self._generate_jobs(jobs)
+            except Exception as e:
+                log.error(f"Ошибка анализа и генерации ответов: {e}")
+                for job in jobs:
+                    self._job_finished(job, e)
+                if self._fatal_error is not None:
+                    raise
+        persisted = []
+        for job in generated:
+            try:
+                persisted.extend(self._persist_jobs([job]))
+            except Exception as e:
+                log.error(f"Ошибка обработки письма #{job['email_id']}: {e}")
+                self._job_finished(job, e)
+        
+        for job in persisted:
+            try:
+                self._send_jobs([job])
+            except Exception as e:
+                log.error(f"Ошибка постановки ответа на письмо #{job['email_id']} в очередь: {e}")
+                self._job_finished(job, e)
+                continue
+            processed_records.append(job['record'])
+            self._job_finished(job)
+        
+        log.success(f"Обработано {len(processed_records)} писем")
+        log.info(f"Очередь исходящих: {self.outbox.stats()}")
+        self._log_inference_stats()
+        return processed_records
+    
+    def _log_inference_stats(self):
+        if self.inference_pool:
+            log.info(f"Пул инференса: {self.inference_pool.stats()}")
+        else:
+            log.info(f"Доли уровней классификации: {self.classifier.tier_shares()}")
+    
+    # =========================================================================
+    # КОНВЕЙЕР
+    # =========================================================================
+    
+    def _build_pipeline(self) -> Pipeline:
+        queue_size = settings.pipeline_queue_size
+        # С пулом процессов инференс и генерация идут параллельно в каждом процессе
+        model_workers = self.inference_pool.workers if self.inference_pool else 1
+        return Pipeline(
+            [
+                Stage("parse", self._parse_job, concurrency=settings.pipeline_parse_workers, queue_size=queue_size),
+                Stage("infer", self._infer_jobs, concurrency=model_workers,
+                      batch_size=settings.pipeline_infer_batch, queue_size=queue_size),
+                Stage("generate", self._generate_jobs, concurrency=model_workers,
+                      batch_size=settings.llm_batch_size, queue_size=queue_size),
+                Stage("persist", self._persist_jobs, batch_size=settings.pipeline_infer_batch, queue_size=queue_size),
+                Stage("send", self._send_jobs, batch_size=settings.smtp_batch_size, queue_size=queue_size),
+            ],
+            on_finished=self._job_finished,
+        )
+    
+    async def run_pipeline(self, poll_interval: int = 60, limit: int = 10):
+        """
+        Конвейерный режим: fetch → parse → infer → generate → persist → send.
+        
+        Пока одни письма ждут SMTP/MySQL, другие проходят инференс;
+        переполненная очередь медленной стадии останавливает получение писем.
+        """
+        if settings.db_write_behind:
+            self.db_writer = AsyncTicketWriter(
+                flush_size=settings.db_batch_size,
+                flush_interval=settings.db_flush_interval,
+                queue_size=settings.db_queue_size,
+            )
+            self.db_writer.start()
+        pipeline = self._build_pipeline()
+        pipeline.start()
         
         try:
-            imap.select(self.folder)
-            log.info(f"Папка: {self.folder}")
-            
-            status, messages = imap.search(None, 'UNSEEN')
-            
-            if status != 'OK':
-                log.warning("Нет непрочитанных писем")
-                return []
-            
-            email_ids = messages[0].split()[:limit]
-            log.info(f"Найдено {len(email_ids)} непрочитанных писем")
-            
-            for email_id in email_ids:
+            while True:
+                if self._fatal_error is not None:
+                    raise self._fatal_error
                 try:
-                    if email_id.decode() in self.processed_ids:
-                        log.debug(f"Письмо #{email_id.decode()} уже обработано")
-                        imap.store(email_id, '+FLAGS', '\\Seen')
-                        continue
-                    
-                    status, msg_data = imap.fetch(email_id, '(RFC822)')
-                    
-                    if status != 'OK':
-                        log.warning(f"Не удалось получить письмо #{email_id.decode()}")
-                        continue
-                    
-                    raw_email = msg_data[0][1]
-                    msg = email.message_from_bytes(raw_email)
-                    
-                    record = self.process_email(email_id.decode(), msg)
-                    
-                    if record:
-                        processed_records.append(record)
-                    
-                    imap.store(email_id, '+FLAGS', '\\Seen')
-                    
+                    jobs = await asyncio.to_thread(self._fetch_new, limit)
+                    self.imap_session.backoff.reset()
                 except Exception as e:
-                    log.error(f"Ошибка обработки письма #{email_id.decode()}: {e}")
+                    delay = self.imap_session.backoff.next_delay()
+                    log.error(f"Ошибка получения писем: {e}, повтор через {delay:.0f} сек")
+                    await asyncio.sleep(delay)
                     continue
-            
-            log.success(f"Обработано {len(processed_records)} писем")
-            
+                
+                for job in jobs:
+                    await pipeline.submit(job)
+                
+                if jobs:
+                    log.info(f"Стадии конвейера: {pipeline.stats()}")
+                    log.info(f"Очередь исходящих: {self.outbox.stats()}")
+                    if self.db_writer is not None:
+                        log.info(f"Запись в БД: {self.db_writer.stats()}")
+                    self._log_inference_stats()
+                else:
+                    log.debug("Нет новых писем, ожидание...")
+                    await asyncio.to_thread(self._wait_for_mail, poll_interval)
         finally:
-            imap.close()
-            imap.logout()
-        
-        return processed_records
+            # Выход из IDLE, чтобы поток fetch не держал завершение
+            self._stopping.set()
+            await pipeline.stop()
+            if self.db_writer is not None:
+                # Всё, что прошло persist, дописывается в БД до выхода
+                await self.db_writer.stop()
+                self.db_writer = None
     
     def run(self, poll_interval: int = 60):
         """Основной цикл работы"""
@@ -302,45 +607,50 @@ class EmailWorker:
         log.info(f"   Почта: {self.email_user}")
         log.info(f"   Сервер: {self.imap_server}:{self.imap_port}")
         log.info(f"   Интервал опроса: {poll_interval} сек")
+        log.info(f"   Режим: {'конвейер' if settings.pipeline_enabled else 'последовательный'}")
         log.info("-" * 60)
         
+        try:
+            self._run_loop(poll_interval)
+        finally:
+            self.imap_session.close()
+            self.outbox.stop()
+            self.sender.close()
+            if self.inference_pool:
+                self.inference_pool.shutdown()
+    
+    def _run_loop(self, poll_interval: int):
+        if settings.pipeline_enabled:
+            try:
+                asyncio.run(self.run_pipeline(poll_interval))
+            except KeyboardInterrupt:
+                log.info("Остановка по команде пользователя")
+            return
+        
         while True:
             try:
                 records = self.fetch_and_process(limit=10)
+                self.imap_session.backoff.reset()
                 
                 if not records:
-                    log.debug(f"Нет новых писем, ждем {poll_interval} сек...")
-                else:
-                    # Сохранение в общее хранилище для API
-                    self._save_to_api_storage(records)
-                
-                for i in range(poll_interval):
-                    asyncio.run(asyncio.sleep(1))
+                    log.debug("Нет новых писем, ожидание...")
+                    self._wait_for_mail(poll_interval)
                     
             except KeyboardInterrupt:
                 log.info("Остановка по команде пользователя")
                 break
+            except InferencePoolError:
+                raise
             except Exception as e:
-                log.error(f"Критическая ошибка: {e}")
-                asyncio.run(asyncio.sleep(10))
+                delay = self.imap_session.backoff.next_delay()
+                log.error(f"Критическая ошибка: {e}, повтор через {delay:.0f} сек")
+                time.sleep(delay)
     
     def _save_to_api_storage(self, records: list):
-        """Сохранение записей в хранилище для API"""
-        storage_file = "data/records.json"
-        
-        existing = []
-        if os.path.exists(storage_file):
-            try:
-                with open(storage_file, 'r', encoding='utf-8') as f:
-                    existing = json.load(f)
-            except:
-                existing = []
-        
-        existing.extend(records)
-        
-        os.makedirs(os.path.dirname(storage_file), exist_ok=True)
-        with open(storage_file, 'w', encoding='utf-8') as f:
-            json.dump(existing, f, ensure_ascii=False, indent=2)
+        """Дозапись записей в журнал хранилища для API"""
+        record_log.append(records)
+        stats_aggregator.add(records)
+        stats_aggregator.save()
         
         log.success(f"Сохранено {len(records)} записей в API хранилище")
 
@@ -3,7 +3,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.core.config import settings
 from app.core.logger import log
-from app.api.routes import router
+from app.api.routes import router, API_MODELS
+from app.models.registry import registry
 import os
 import json
 
@@ -13,6 +14,8 @@ async def lifespan(app: FastAPI):
     log.info("Запуск API сервера...")
     log.info(f"Host: {settings.host}:{settings.port}")
     init_records_file()
+    log.info("Загрузка моделей в реестр...")
+    registry.load_all(API_MODELS)
     yield
     log.info("Завершение работы API сервера")
 
@@ -37,6 +40,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Роуты
@@ -0,0 +1,125 @@
+"""
+Бэкенды инференса трансформерных моделей: fp32 PyTorch, динамическое
+int8-квантование PyTorch и int8 ONNX Runtime
+"""
+
+import platform
+from pathlib import Path
+from typing import Tuple
+
+import torch
+from transformers import AutoModelForCausalLM, AutoModelForSequenceClassification, AutoTokenizer
+
+from app.core.config import settings
+from app.core.logger import log
+
+TORCH = "torch"
+TORCH_INT8 = "torch_int8"
+ONNX_INT8 = "onnx_int8"
+BACKENDS = (TORCH, TORCH_INT8, ONNX_INT8)
+
+ONNX_FILE = "model_quantized.onnx"
+
+
+def resolve_backend(backend: str, device: str) -> str:
+    """Проверка имени бэкенда; int8-бэкенды работают только на CPU"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд инференса {backend!r}, допустимые: {', '.join(BACKENDS)}")
+    if backend != TORCH and device != "cpu":
+        log.warning(f"Бэкенд {backend} работает только на CPU, на {device} используется {TORCH}")
+        return TORCH
+    return backend
+
+
+def quantize_torch(model):
+    """Динамическое int8-квантование Linear-слоёв (веса int8, активации квантуются на лету)"""
+    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.eval()
+    return model
+
+
+def onnx_model_dir(model_name: str) -> Path:
+    return settings.onnx_cache_dir / model_name.replace("/", "--")
+
+
+def _quantization_config():
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return AutoQuantizationConfig.arm64(is_static=False, per_channel=False)
+    # avx2 — самый переносимый набор инструкций для x86
+    return AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+
+
+def export_onnx_int8(model_name: str) -> Path:
+    """
+    Экспорт классификатора последовательностей в ONNX и динамическое
+    int8-квантование. Результат кэшируется в onnx_cache_dir, повторный
+    вызов только возвращает путь.
+    """
+    try:
+        from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    except ImportError as e:
+        raise RuntimeError(f"Для бэкенда {ONNX_INT8} нужны пакеты optimum[onnxruntime]: {e}")
+
+    target = onnx_model_dir(model_name) / "int8"
+    if (target / ONNX_FILE).exists():
+        return target
+
+    fp32_dir = onnx_model_dir(model_name) / "fp32"
+    log.info(f"Экспорт {model_name} в ONNX: {fp32_dir}")
+    ORTModelForSequenceClassification.from_pretrained(model_name, export=True).save_pretrained(fp32_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(fp32_dir)
+
+    log.info(f"Динамическое int8-квантование {model_name}: {target}")
+    quantizer = ORTQuantizer.from_pretrained(fp32_dir)
+    quantizer.quantize(save_dir=target, quantization_config=_quantization_config())
+    AutoTokenizer.from_pretrained(fp32_dir).save_pretrained(target)
+    return target
+
+
+def load_sequence_classifier(model_name: str, backend: str) -> Tuple[object, object]:
+    """
+    Модель и токенизатор классификатора последовательностей.
+
+    Модели всех бэкендов принимают тензоры PyTorch и возвращают .logits,
+    поэтому pipeline и пакетный инференс работают с ними одинаково.
+    """
+    if backend == ONNX_INT8:
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+
+        model_dir = export_onnx_int8(model_name)
+        model = ORTModelForSequenceClassification.from_pretrained(model_dir, file_name=ONNX_FILE)
+        return model, AutoTokenizer.from_pretrained(model_dir)
+
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+    if backend == TORCH_INT8:
+        model = quantize_torch(model)
+    return model, AutoTokenizer.from_pretrained(model_name)
+
+
+def load_causal_lm(model_name: str, backend: str) -> Tuple[object, object]:
+    """
+    Модель и токенизатор LLM.
+
+    Генератор сам управляет KV-кэшем (кэш префикса, непрерывный батчинг),
+    а ONNX-модели DynamicCache не принимают, поэтому для LLM onnx_int8
+    заменяется динамическим int8-квантованием PyTorch.
+    """
+    if backend == ONNX_INT8:
+        log.warning(f"Для LLM бэкенд {ONNX_INT8} не поддерживается, используется {TORCH_INT8}")
+        backend = TORCH_INT8
+
+    model = AutoModelForCausalLM.from_pretrained(model_name)
+    model.eval()
+    if backend == TORCH_INT8:
+        model = quantize_torch(model)
+    return model, AutoTokenizer.from_pretrained(model_name)
+
+
+def pipeline_device(backend: str, device: str) -> dict:
+    """Аргумент device для transformers.pipeline (ONNX-модель сама выбирает провайдера)"""
+    if backend == ONNX_INT8:
+        return {}
+    return {"device": -1 if device == "cpu" else 0}
@@ -75,6 +75,12 @@ ALL_PRODUCTS = []
 for category, products in ERIS_PRODUCTS.items():
     ALL_PRODUCTS.extend(products)
 
+# Модель → категория (первая категория, в которой модель встречается)
+PRODUCT_CATEGORY = {}
+for category, products in ERIS_PRODUCTS.items():
+    for product in products:
+        PRODUCT_CATEGORY.setdefault(product, category)
+
 # Синонимы и альтернативные названия
 PRODUCT_SYNONYMS = {
     "ДГС ЭРИС-230": ["ДГС230", "ЭРИС-230", "ДГС-230", "230"],
@@ -0,0 +1,233 @@
+"""
+Пакетная генерация LLM с непрерывным батчингом
+"""
+
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import torch
+import torch.nn.functional as F
+from transformers import (
+    DynamicCache,
+    LogitsProcessorList,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
+
+from app.models.generation_stop import StopChecker
+from app.models.prompt_cache import PromptPrefixCache
+
+
+class _Row:
+    """Одна последовательность в батче"""
+
+    __slots__ = ("index", "ids", "generated", "stop_reason")
+
+    def __init__(self, index: int, ids: List[int]):
+        self.index = index
+        self.ids = ids            # Промпт + сгенерированное (для штрафа за повторы)
+        self.generated: List[int] = []
+        self.stop_reason: Optional[str] = None  # STOP / GARBAGE от stop_checker
+
+
+class ContinuousBatcher:
+    """
+    Декодирование нескольких промптов одним батчем.
+
+    Промпты выровнены по правому краю (left padding): KV-кэш батча —
+    тензоры [batch, heads, длина, dim] с нулями слева, attention_mask
+    отмечает настоящие позиции, position_ids считаются по строке. Как
+    только последовательность завершилась (EOS или max_new_tokens), её
+    строка удаляется из кэша (так же — при стоп-последовательности или
+    мусоре в хвосте, если задан stop_checker), а на освободившееся место встаёт следующий
+    ожидающий промпт (непрерывный батчинг) — батч не ждёт самого длинного
+    ответа. Prefill нового промпта идёт отдельно, с KV-кэшем префикса,
+    если он есть.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size: int = 4, max_new_tokens: int = 400,
+                 eos_token_id=None, do_sample: bool = True, temperature: float = 1.0,
+                 top_p: float = 1.0, top_k: int = 0, repetition_penalty: float = 1.0,
+                 prefix_cache: Optional[PromptPrefixCache] = None,
+                 stop_checker: Optional[StopChecker] = None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_new_tokens = max_new_tokens
+        self.prefix_cache = prefix_cache
+        self.stop_checker = stop_checker
+
+        eos = eos_token_id if eos_token_id is not None else tokenizer.eos_token_id
+        self.eos_token_ids = set(eos if isinstance(eos, (list, tuple)) else [eos])
+        if tokenizer.eos_token_id is not None:
+            self.eos_token_ids.add(tokenizer.eos_token_id)
+
+        self.do_sample = do_sample
+        self.processors = LogitsProcessorList()
+        if repetition_penalty and repetition_penalty != 1.0:
+            self.processors.append(RepetitionPenaltyLogitsProcessor(repetition_penalty))
+        if do_sample:
+            if temperature and temperature != 1.0:
+                self.processors.append(TemperatureLogitsWarper(temperature))
+            if top_k:
+                self.processors.append(TopKLogitsWarper(top_k))
+            if top_p and top_p < 1.0:
+                self.processors.append(TopPLogitsWarper(top_p))
+
+    # =========================================================================
+    # ПУБЛИЧНЫЙ ВЫЗОВ
+    # =========================================================================
+
+    def run(self, prompts: Sequence[Tuple[str, str]]) -> List[Optional[str]]:
+        """
+        Args:
+            prompts: пары (неизменное начало, данные письма)
+
+        Returns:
+            Сгенерированные продолжения в порядке prompts; None — строка
+            остановлена на мусоре в хвосте (ответ отбрасывается целиком,
+            как в генерации по одному письму)
+        """
+        results: Dict[int, Optional[str]] = {}
+        waiting = deque(enumerate(prompts))
+        rows: List[_Row] = []
+        keys: List[torch.Tensor] = []     # По слою: [batch, heads, длина, dim]
+        values: List[torch.Tensor] = []
+        mask: Optional[torch.Tensor] = None  # [batch, длина]
+        pending: List[int] = []          # Следующий входной токен каждой строки
+
+        with torch.inference_mode():
+            while waiting or rows:
+                # Свободные места занимают ожидающие промпты
+                while waiting and len(rows) < self.max_batch_size:
+                    index, (prefix, suffix) = waiting.popleft()
+                    row, row_cache, logits = self._prefill(index, prefix, suffix)
+                    token = self._sample(row, logits)
+                    if self._finished(row, token):
+                        results[index] = self._decode(row)
+                        continue
+                    keys, values, mask = self._insert(keys, values, mask, row_cache)
+                    rows.append(row)
+                    pending.append(token)
+
+                if not rows:
+                    continue
+
+                logits, keys, values, mask = self._decode_step(keys, values, mask, pending)
+
+                keep = []
+                for i, row in enumerate(rows):
+                    token = self._sample(row, logits[i])
+                    if self._finished(row, token):
+                        results[row.index] = self._decode(row)
+                    else:
+                        pending[i] = token
+                        keep.append(i)
+
+                if not keep:
+                    rows, pending, keys, values, mask = [], [], [], [], None
+                elif len(keep) < len(rows):
+                    rows = [rows[i] for i in keep]
+                    pending = [pending[i] for i in keep]
+                    keys, values, mask = self._select(keys, values, mask, keep)
+
+        return [results[i] for i in range(len(prompts))]
+
+    # =========================================================================
+    # ШАГИ
+    # =========================================================================
+
+    def _prefill(self, index: int, prefix: str, suffix: str) -> Tuple[_Row, DynamicCache, torch.Tensor]:
+        """Прогон одного промпта: строка, её KV-кэш и логиты последней позиции"""
+        suffix_ids = self.tokenizer(suffix, add_special_tokens=False)["input_ids"]
+        if self.prefix_cache is not None:
+            input_ids, cache = self.prefix_cache.encode(prefix, suffix)
+            ids = input_ids[0].tolist()
+            new_ids = input_ids[:, input_ids.shape[1] - len(suffix_ids):]
+        else:
+            ids = self.tokenizer(prefix)["input_ids"] + suffix_ids
+            cache = DynamicCache()
+            new_ids = torch.tensor([ids], device=self.model.device)
+
+        output = self.model(input_ids=new_ids, past_key_values=cache, use_cache=True)
+        return _Row(index, ids), output.past_key_values, output.logits[0, -1]
+
+    def _insert(self, keys: List[torch.Tensor], values: List[torch.Tensor], mask: Optional[torch.Tensor],
+                cache: DynamicCache) -> Tuple[List[torch.Tensor], List[torch.Tensor], torch.Tensor]:
+        """Добавление строки в батч с выравниванием длины паддингом слева"""
+        length = cache.key_cache[0].shape[-2]
+        row_mask = torch.ones((1, length), dtype=torch.long, device=self.model.device)
+        if mask is None:
+            return list(cache.key_cache), list(cache.value_cache), row_mask
+
+        width = mask.shape[1]
+        row_keys, row_values = list(cache.key_cache), list(cache.value_cache)
+        if length < width:
+            pad = width - length
+            row_keys = [F.pad(k, (0, 0, pad, 0)) for k in row_keys]
+            row_values = [F.pad(v, (0, 0, pad, 0)) for v in row_values]
+            row_mask = F.pad(row_mask, (pad, 0))
+        elif length > width:
+            pad = length - width
+            keys = [F.pad(k, (0, 0, pad, 0)) for k in keys]
+            values = [F.pad(v, (0, 0, pad, 0)) for v in values]
+            mask = F.pad(mask, (pad, 0))
+
+        keys = [torch.cat([k, rk]) for k, rk in zip(keys, row_keys)]
+        values = [torch.cat([v, rv]) for v, rv in zip(values, row_values)]
+        return keys, values, torch.cat([mask, row_mask])
+
+    def _select(self, keys: List[torch.Tensor], values: List[torch.Tensor], mask: torch.Tensor,
+                keep: List[int]) -> Tuple[List[torch.Tensor], List[torch.Tensor], torch.Tensor]:
+        """Оставшиеся строки; общий для всех паддинг слева отрезается"""
+        index = torch.tensor(keep, device=mask.device)
+        mask = mask.index_select(0, index)
+        start = int((mask.sum(0) == 0).long().cumprod(0).sum())
+        keys = [k.index_select(0, index)[:, :, start:] for k in keys]
+        values = [v.index_select(0, index)[:, :, start:] for v in values]
+        return keys, values, mask[:, start:]
+
+    def _decode_step(self, keys: List[torch.Tensor], values: List[torch.Tensor], mask: torch.Tensor,
+                     pending: List[int]) -> Tuple[torch.Tensor, List[torch.Tensor], List[torch.Tensor], torch.Tensor]:
+        """Один токен для каждой строки батча: логиты [batch, vocab] и обновлённые кэш и маска"""
+        cache = DynamicCache()
+        for layer, (k, v) in enumerate(zip(keys, values)):
+            cache.update(k, v, layer)
+
+        input_ids = torch.tensor(pending, device=self.model.device).unsqueeze(1)
+        position_ids = mask.sum(1, keepdim=True)  # Настоящих токенов в строке до нового
+        mask = F.pad(mask, (0, 1), value=1)
+        output = self.model(
+            input_ids=input_ids,
+            attention_mask=mask,
+            position_ids=position_ids,
+            past_key_values=cache,
+            use_cache=True,
+        )
+        cache = output.past_key_values
+        return output.logits[:, -1], list(cache.key_cache), list(cache.value_cache), mask
+
+    def _sample(self, row: _Row, logits: torch.Tensor) -> int:
+        scores = self.processors(torch.tensor([row.ids], device=logits.device), logits.unsqueeze(0).float())
+        if self.do_sample:
+            token = int(torch.multinomial(torch.softmax(scores, dim=-1), 1)[0, 0])
+        else:
+            token = int(scores.argmax(-1)[0])
+        row.ids.append(token)
+        row.generated.append(token)
+        return token
+
+    def _finished(self, row: _Row, token: int) -> bool:
+        if token in self.eos_token_ids or len(row.generated) >= self.max_new_tokens:
+            return True
+        # Стоп-последовательность или мусор в хвосте — строка освобождает место
+        if self.stop_checker is not None:
+            row.stop_reason = self.stop_checker.check(row.generated)
+        return row.stop_reason is not None
+
+    def _decode(self, row: _Row) -> Optional[str]:
+        if row.stop_reason == StopChecker.GARBAGE:
+            return None
+        return self.tokenizer.decode(row.generated, skip_special_tokens=True)
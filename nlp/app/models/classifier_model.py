@@ -1,86 +1,192 @@
+import importlib
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+import torch
 from transformers import pipeline
 from app.core.config import settings
 from app.core.logger import log
+from app.models.backends import load_sequence_classifier, pipeline_device, resolve_backend
+from app.models.base import classifier_keyword
 from app.models.base.classifier_keyword import keywords
+from app.models.embedding_classifier import EmbeddingClassifier
+from app.services.keyword_matcher import KeywordMatch, KeywordMatcher
+from app.services.record_log import record_log
 
 class Classifier:
+    HYPOTHESIS_TEMPLATE = "Это запрос в категорию {}."
+    MAX_INPUT_CHARS = 512
+
     def __init__(self):
         self.model_name = settings.classifier_name
         self.device = settings.device
+        self.backend = resolve_backend(settings.inference_backend, self.device)
+        self.batch_size = settings.classifier_batch_size
         self.categories = list(keywords.keys())
         self.keywords = keywords
-        
+        self.keyword_matcher = KeywordMatcher(keywords)
+
         self.pipeline = None
+        self.load_error: Optional[str] = None  # NLI-модель не загрузилась (работают keywords и эмбеддинги)
+        self.entailment_id: Optional[int] = None
+        self._hypothesis_ids: Dict[str, List[int]] = {}
+        self.last_inference_at = None
+        self.tier_counts: Counter = Counter()
         self._load_model()
 
+        self.embedder: Optional[EmbeddingClassifier] = None
+        if settings.embedding_enabled:
+            self._load_embedder()
+
     def _load_model(self):
-        log.info(f"Загрузка классификатора {self.model_name} на устройство {self.device}...")
+        log.info(f"Загрузка классификатора {self.model_name} на устройство {self.device} ({self.backend})...")
         try:
+            model, tokenizer = load_sequence_classifier(self.model_name, self.backend)
             self.pipeline = pipeline(
                 "zero-shot-classification",
-                model=self.model_name,
-                tokenizer=self.model_name,
-                device=-1 if self.device == "cpu" else 0,
-                hypothesis_template="Это запрос в категорию {}.",
+                model=model,
+                tokenizer=tokenizer,
+                **pipeline_device(self.backend, self.device),
+                hypothesis_template=self.HYPOTHESIS_TEMPLATE,
                 multi_label=False
             )
+            self._prepare_hypotheses()
             log.success(f"Классификатор {self.model_name} успешно загружен")
         except Exception as e:
             log.error(f"Ошибка загрузки классификатора: {e}")
             self.pipeline = None
+            self.load_error = f"NLI-модель не загружена: {e}"
+
+    def _load_embedder(self):
+        """Быстрый уровень: прототипы категорий из keywords и истории обращений"""
+        try:
+            self.embedder = EmbeddingClassifier(self.keywords)
+            history = record_log.iter_newest() if settings.embedding_use_history else []
+            self.embedder.build_prototypes(history)
+        except Exception as e:
+            log.error(f"Ошибка инициализации уровня эмбеддингов: {e}")
+            self.embedder = None
+
+    def _prepare_hypotheses(self):
+        """Токенизация гипотез «Это запрос в категорию {}.» один раз на все письма"""
+        id2label = self.pipeline.model.config.id2label
+        self.entailment_id = next(
+            (i for i, label in id2label.items() if label.lower().startswith("entail")), 0
+        )
+        tokenizer = self.pipeline.tokenizer
+        self._hypothesis_ids = {
+            category: tokenizer.encode(self.HYPOTHESIS_TEMPLATE.format(category), add_special_tokens=False)
+            for category in self.categories
+        }
+
+    def reload_keywords(self, new_keywords: Optional[Dict[str, List[str]]] = None):
+        """
+        Горячая перезагрузка словаря ключевых слов
+        (без аргумента — повторный импорт app.models.base.classifier_keyword)
+        """
+        if new_keywords is None:
+            new_keywords = importlib.reload(classifier_keyword).keywords
+
+        categories_changed = list(new_keywords.keys()) != self.categories
+        self.keyword_matcher.reload(new_keywords)
+        self.keywords = new_keywords
+        self.categories = list(new_keywords.keys())
+
+        if categories_changed and self.pipeline:
+            self._prepare_hypotheses()
+        if self.embedder:
+            self.embedder.keywords = new_keywords
+            self.embedder.categories = self.categories
+            self.embedder.build_prototypes(record_log.iter_newest() if settings.embedding_use_history else [])
+
+    def keyword_matches(self, text: str, subject: str = "") -> Dict[str, List[KeywordMatch]]:
+        """Вхождения ключевых слов по категориям (позиции — в строке «тема + текст»)"""
+        return self.keyword_matcher.matches_by_label(subject + " " + text)
 
     def _classify_by_keywords(self, text: str, subject: str = "") -> tuple:
-        """Классификация по ключевым словам"""
-        combined = (subject + " " + text).lower()
-        
+        """Классификация по ключевым словам (один проход автомата по тексту)"""
+        counts = self.keyword_matcher.count_by_label(subject + " " + text)
+
         best_category = "другое"
         best_score = 0.0
-        
-        for category, words in self.keywords.items():
-            matches = sum(1 for word in words if word in combined)
+
+        for category in self.keywords:
+            matches = counts.get(category, 0)
             if matches > 0:
                 score = min(matches / 3.0, 1.0)  # 3+ совпадения = 100%
                 if score > best_score:
                     best_score = score
                     best_category = category
-        
+
         return best_category, best_score, "keywords"
 
-    def _classify_by_model(self, text: str, subject: str = "") -> tuple:
+    def _classify_batch_by_model(self, inputs: List[str]) -> List[tuple]:
+        """
+        Zero-shot классификация пачки текстов.
+
+        Премиса каждого письма токенизируется один раз и склеивается с заранее
+        токенизированными гипотезами; все пары (письмо, категория) сортируются
+        по длине и прогоняются через NLI-модель пакетами по batch_size.
+        Итог совпадает с zero-shot pipeline при multi_label=False:
+        softmax по entailment-логитам категорий.
+        """
         if not self.pipeline:
-            return "другое", 0.2, "fallback"
-        
+            return [("другое", 0.2, "fallback")] * len(inputs)
+
         try:
-            input_text = f"{subject} {text}"[:512]
-            result = self.pipeline(input_text, candidate_labels=self.categories)
-            
-            label = result['labels'][0]
-            score = result['scores'][0]
-            
-            return label, score, "model"
+            tokenizer = self.pipeline.tokenizer
+            model = self.pipeline.model
+            max_length = tokenizer.model_max_length if tokenizer.model_max_length < 10**6 else settings.max_length
+            self.last_inference_at = time.time()
+
+            features = []
+            for text in inputs:
+                premise_ids = tokenizer.encode(text, add_special_tokens=False)
+                for category in self.categories:
+                    hypothesis_ids = self._hypothesis_ids[category]
+                    # Усечение только премисы (как truncation="only_first" в pipeline)
+                    budget = max_length - len(hypothesis_ids) - tokenizer.num_special_tokens_to_add(pair=True)
+                    premise = premise_ids[:max(budget, 0)]
+                    feature = {
+                        'input_ids': tokenizer.build_inputs_with_special_tokens(premise, hypothesis_ids),
+                    }
+                    if 'token_type_ids' in tokenizer.model_input_names:
+                        feature['token_type_ids'] = tokenizer.create_token_type_ids_from_sequences(premise, hypothesis_ids)
+                    feature['attention_mask'] = [1] * len(feature['input_ids'])
+                    features.append(feature)
+
+            entailment = torch.empty(len(features))
+            order = sorted(range(len(features)), key=lambda i: len(features[i]['input_ids']))
+            for start in range(0, len(order), self.batch_size):
+                bucket = order[start:start + self.batch_size]
+                batch = tokenizer.pad([features[i] for i in bucket], padding=True, return_tensors="pt").to(model.device)
+                with torch.inference_mode():
+                    logits = model(**batch).logits
+                entailment[bucket] = logits[:, self.entailment_id].float().cpu()
+
+            probs = torch.softmax(entailment.view(len(inputs), len(self.categories)), dim=-1)
+            scores, indices = probs.max(dim=-1)
+            return [
+                (self.categories[index], score, "model")
+                for score, index in zip(scores.tolist(), indices.tolist())
+            ]
         except Exception as e:
             log.error(f"Ошибка модели: {e}")
-            return "другое", 0.2, "fallback"
+            return [("другое", 0.2, "fallback")] * len(inputs)
 
-    def predict(self, text: str, subject: str = "") -> dict:
-        """
-        Гибридная классификация:
-        1. Сначала keywords (быстро и точно при совпадении)
-        2. Если keywords не дали уверенности — модель
-        3. Возвращаем лучший результат
-        """
-        kw_category, kw_score, kw_method = self._classify_by_keywords(text, subject)
-        
-        if kw_score >= 0.5:
+    def _combine(self, keyword_result: tuple, model_result: Optional[tuple]) -> dict:
+        """Выбор между keywords и моделью"""
+        kw_category, kw_score, _ = keyword_result
+
+        if model_result is None:
             log.debug(f"Классификация по keywords: {kw_category} ({kw_score:.2%})")
             return {
                 'category': kw_category,
                 'confidence': round(kw_score, 4),
                 'method': 'keywords'
             }
-        
-        model_category, model_score, model_method = self._classify_by_model(text, subject)
-        
+
+        model_category, model_score, _ = model_result
         if model_score > kw_score:
             log.debug(f"Классификация по модели: {model_category} ({model_score:.2%})")
             return {
@@ -96,5 +202,83 @@ class Classifier:
                 'method': 'keywords'
             }
 
+    def _classify_by_embeddings(self, inputs: List[str]) -> List[Optional[tuple]]:
+        """Уровень эмбеддингов: None — отрыв мал, решение за NLI"""
+        if not self.embedder or not self.embedder.ready:
+            return [None] * len(inputs)
+        try:
+            results = self.embedder.predict_batch(inputs)
+        except Exception as e:
+            log.error(f"Ошибка уровня эмбеддингов: {e}")
+            return [None] * len(inputs)
+        return [
+            (category, score, "embedding") if self.embedder.is_confident(margin) else None
+            for category, score, margin in results
+        ]
+
+    def _embedding_result(self, result: tuple) -> dict:
+        category, score, _ = result
+        log.debug(f"Классификация по эмбеддингам: {category} ({score:.2%})")
+        return {
+            'category': category,
+            'confidence': round(score, 4),
+            'method': 'embedding'
+        }
+
+    def predict(self, text: str, subject: str = "") -> dict:
+        """
+        Гибридная классификация:
+        1. Сначала keywords (быстро и точно при совпадении)
+        2. Если keywords не дали уверенности — эмбеддинги (если отрыв достаточен)
+        3. Иначе — NLI-модель, возвращаем лучший результат
+        """
+        return self.predict_batch([text], [subject])[0]
+
+    def predict_batch(self, texts: List[str], subjects: Optional[List[str]] = None) -> List[dict]:
+        """
+        Гибридная классификация пачки писем: каждый уровень вызывается
+        один раз на всю пачку и только для писем, не решённых предыдущим
+        """
+        subjects = subjects or [""] * len(texts)
+        kw_results = [self._classify_by_keywords(t, s) for t, s in zip(texts, subjects)]
+        results: List[Optional[dict]] = [None] * len(texts)
+
+        pending = []
+        for i, kw_result in enumerate(kw_results):
+            if kw_result[1] >= 0.5:
+                results[i] = self._combine(kw_result, None)
+            else:
+                pending.append(i)
+
+        inputs = {i: f"{subjects[i]} {texts[i]}"[:self.MAX_INPUT_CHARS] for i in pending}
+        if pending:
+            embedded = self._classify_by_embeddings([inputs[i] for i in pending])
+            for i, result in zip(pending, embedded):
+                if result is not None:
+                    results[i] = self._embedding_result(result)
+            pending = [i for i in pending if results[i] is None]
+
+        if pending:
+            model_results = self._classify_batch_by_model([inputs[i] for i in pending])
+            for i, model_result in zip(pending, model_results):
+                results[i] = self._combine(kw_results[i], model_result)
+
+        self.tier_counts.update(result['method'] for result in results)
+        return results
+
+    def tier_shares(self) -> Dict[str, float]:
+        """Доля писем, решённых каждым уровнем классификации"""
+        total = sum(self.tier_counts.values())
+        if not total:
+            return {}
+        return {method: round(count / total, 4) for method, count in self.tier_counts.items()}
+
+    def stats(self) -> Dict:
+        return {
+            'classified': sum(self.tier_counts.values()),
+            'tier_counts': dict(self.tier_counts),
+            'tier_shares': self.tier_shares(),
+        }
+
     def __call__(self, text: str, subject: str = "") -> dict:
-        return self.predict(text, subject)
\ No newline at end of file
+        return self.predict(text, subject)
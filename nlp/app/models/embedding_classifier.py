@@ -0,0 +1,126 @@
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from app.core.config import settings
+from app.core.logger import log
+
+
+class EmbeddingClassifier:
+    """
+    Быстрый уровень классификации между keywords и NLI-моделью.
+
+    Для каждой категории строится прототип — нормированное среднее эмбеддингов
+    её ключевых фраз и размеченных исторических обращений. Письмо относится к
+    ближайшему прототипу по косинусной близости за один проход энкодера;
+    если отрыв от второй категории меньше margin, решение отдаётся NLI.
+
+    Из истории берутся только метки уровней keywords и NLI: собственные
+    решения уровня эмбеддингов закрепляли бы его же ошибки. Примеры
+    берутся из последних обращений — журнал целиком не читается.
+    """
+
+    MAX_EXAMPLE_CHARS = 300
+    HISTORY_METHODS = ("keywords", "model")
+    HISTORY_SCAN_FACTOR = 20
+
+    def __init__(self, keywords: Dict[str, List[str]]):
+        self.model_name = settings.embedding_name
+        self.device = settings.device
+        self.margin = settings.embedding_margin
+        self.temperature = settings.embedding_temperature
+        self.history_limit = settings.embedding_history_limit
+        self.keywords = keywords
+        self.categories = list(keywords.keys())
+
+        self.model = None
+        self.prototypes: Optional[np.ndarray] = None
+        self._load_model()
+
+    def _load_model(self):
+        log.info(f"Загрузка энкодера {self.model_name} на устройство {self.device}...")
+        try:
+            self.model = SentenceTransformer(self.model_name, device=self.device)
+            log.success(f"Энкодер {self.model_name} успешно загружен")
+        except Exception as e:
+            log.error(f"Ошибка загрузки энкодера: {e}")
+            self.model = None
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=settings.classifier_batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+
+    def build_prototypes(self, history: Iterable[dict] = ()) -> None:
+        """
+        Построение прототипов категорий
+
+        Args:
+            history: обработанные записи от новых к старым; берутся уверенно
+                размеченные, не больше history_limit на категорию. Просмотр
+                заканчивается, когда набраны все категории или просмотрено
+                HISTORY_SCAN_FACTOR × history_limit × число категорий записей
+        """
+        if not self.model:
+            return
+
+        examples: Dict[str, List[str]] = {category: list(words) for category, words in self.keywords.items()}
+        added = {category: 0 for category in self.categories}
+        full = 0
+        scan_limit = self.HISTORY_SCAN_FACTOR * self.history_limit * len(self.categories)
+        for record in islice(history, scan_limit):
+            category = record.get('category')
+            if category not in examples or added[category] >= self.history_limit:
+                continue
+            if record.get('category_method') not in self.HISTORY_METHODS:
+                continue
+            if (record.get('category_confidence') or 0) < settings.embedding_history_min_confidence:
+                continue
+            text = f"{record.get('description') or ''} {record.get('text') or ''}".strip()
+            if text:
+                examples[category].append(text[:self.MAX_EXAMPLE_CHARS])
+                added[category] += 1
+                full += added[category] == self.history_limit
+                if full == len(added):
+                    break
+
+        prototypes = []
+        for category in self.categories:
+            vectors = self._encode(examples[category])
+            centroid = vectors.mean(axis=0)
+            prototypes.append(centroid / (np.linalg.norm(centroid) or 1.0))
+        self.prototypes = np.stack(prototypes)
+        log.info(f"Прототипы категорий построены (исторических примеров: {sum(added.values())})")
+
+    @property
+    def ready(self) -> bool:
+        return self.model is not None and self.prototypes is not None
+
+    def predict_batch(self, inputs: List[str]) -> List[Tuple[str, float, float]]:
+        """
+        Returns:
+            [(категория, вероятность, отрыв косинусной близости от второй категории)]
+
+            Вероятность — softmax близостей ко всем прототипам с температурой
+            embedding_temperature: в той же шкале, что уверенность keywords
+            и NLI (сырой косинус у всех категорий близок и не сравним с ними)
+        """
+        if not self.ready or not inputs:
+            return []
+
+        similarities = self._encode(inputs) @ self.prototypes.T
+        logits = similarities / self.temperature
+        probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+        probs /= probs.sum(axis=1, keepdims=True)
+        top2 = np.argsort(-similarities, axis=1)[:, :2]
+        results = []
+        for row, prob, (best, second) in zip(similarities, probs, top2):
+            results.append((self.categories[best], float(prob[best]), float(row[best] - row[second])))
+        return results
+
+    def is_confident(self, margin: float) -> bool:
+        return margin >= self.margin
@@ -0,0 +1,112 @@
+"""
+Досрочная остановка генерации LLM по стоп-последовательностям и мусорным паттернам
+"""
+
+import re
+import threading
+from typing import Iterable, Optional, Sequence
+
+import torch
+from transformers import StoppingCriteria
+
+
+class StopChecker:
+    """
+    Проверка хвоста сгенерированного текста.
+
+    Декодируются только последние window_tokens токенов: стоп-последовательности
+    и мусорные паттерны короткие, а более раннее совпадение уже остановило
+    бы генерацию на предыдущем шаге.
+    """
+
+    STOP = "stop"
+    GARBAGE = "garbage"
+    CANCELLED = "cancelled"
+
+    def __init__(self, tokenizer, stop_sequences: Iterable[str], garbage_patterns: Iterable[str],
+                 window_tokens: int = 48):
+        self.tokenizer = tokenizer
+        self.stop_sequences = list(stop_sequences)
+        self.garbage_res = [re.compile(pattern, re.I) for pattern in garbage_patterns]
+        self.window_tokens = window_tokens
+
+    def check(self, token_ids: Sequence[int]) -> Optional[str]:
+        """STOP / GARBAGE, если генерацию пора прекратить, иначе None"""
+        if not token_ids:
+            return None
+        tail = self.tokenizer.decode(list(token_ids[-self.window_tokens:]), skip_special_tokens=True)
+        if any(stop in tail for stop in self.stop_sequences):
+            return self.STOP
+        tail = tail.lower()
+        if any(garbage.search(tail) for garbage in self.garbage_res):
+            return self.GARBAGE
+        return None
+
+
+class StopOnSequences(StoppingCriteria):
+    """
+    StoppingCriteria для model.generate(): проверка после каждого токена.
+
+    Длина промпта определяется при первом вызове (во входе уже есть
+    один новый токен), поэтому критерий подходит и для pipeline, и для
+    generate() с KV-кэшем префикса. reason — причина остановки первой
+    строки батча (None, если генерация дошла до EOS или лимита).
+    Установленный cancel останавливает все строки (клиент отключился).
+    """
+
+    def __init__(self, checker: StopChecker, cancel: Optional[threading.Event] = None):
+        self.checker = checker
+        self.cancel = cancel
+        self.prompt_length: Optional[int] = None
+        self.reason: Optional[str] = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if self.cancel is not None and self.cancel.is_set():
+            self.reason = StopChecker.CANCELLED
+            return torch.ones(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        if self.prompt_length is None:
+            self.prompt_length = input_ids.shape[1] - 1
+        reasons = [self.checker.check(row[self.prompt_length:].tolist()) for row in input_ids]
+        if self.reason is None:
+            self.reason = reasons[0]
+        return torch.tensor([reason is not None for reason in reasons], dtype=torch.bool, device=input_ids.device)
+
+
+class StreamTextFilter:
+    """
+    Фильтр потока текста для клиента: обрезает вывод на первой
+    стоп-последовательности и придерживает хвост, который может оказаться
+    её началом (частичный "\\n--" не показывается клиенту)
+    """
+
+    def __init__(self, stop_sequences: Iterable[str]):
+        self.stop_sequences = list(stop_sequences)
+        self.hold = max((len(stop) for stop in self.stop_sequences), default=1) - 1
+        self.text = ""
+        self.emitted = 0
+        self.stopped = False
+
+    def feed(self, chunk: str) -> str:
+        """Новая часть текста, которую уже можно показать"""
+        if self.stopped or not chunk:
+            return ""
+        search_from = max(self.emitted - self.hold, 0)
+        self.text += chunk
+
+        cuts = [pos for pos in (self.text.find(stop, search_from) for stop in self.stop_sequences) if pos >= 0]
+        if cuts:
+            self.text = self.text[:min(cuts)]
+            self.stopped = True
+            end = len(self.text)
+        else:
+            end = max(len(self.text) - self.hold, self.emitted)
+
+        delta = self.text[self.emitted:end]
+        self.emitted = end
+        return delta
+
+    def flush(self) -> str:
+        """Остаток после окончания генерации"""
+        delta = self.text[self.emitted:]
+        self.emitted = len(self.text)
+        return delta
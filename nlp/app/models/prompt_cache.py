@@ -0,0 +1,90 @@
+"""
+KV-кэш неизменного начала промпта LLM
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import torch
+from transformers import DynamicCache
+
+from app.core.logger import log
+
+
+class PromptPrefixCache:
+    """
+    Начало промпта (правила и контекст компании) одинаково у всех писем
+    одной категории, поэтому его токены и KV-кэш вычисляются один раз, а
+    generate() прогоняет через модель только хвост с данными письма.
+
+    Префикс и хвост токенизируются раздельно: так токены префикса в кэше
+    и во входе generate() гарантированно совпадают. Кэш префикса
+    копируется на каждый вызов — generate() дописывает в него
+    ключи/значения новых токенов.
+    """
+
+    def __init__(self, model, tokenizer, max_entries: int = 8):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.prefill_seconds = 0.0
+
+    def get(self, prefix: str) -> Tuple[List[int], DynamicCache]:
+        """Токены префикса и его KV-кэш (вычисляется при первом обращении)"""
+        with self._lock:
+            entry = self._entries.get(prefix)
+            if entry is not None:
+                self._entries.move_to_end(prefix)
+                self.hits += 1
+                return entry
+
+            started = time.perf_counter()
+            prefix_ids = self.tokenizer(prefix)["input_ids"]
+            input_ids = torch.tensor([prefix_ids], device=self.model.device)
+            with torch.inference_mode():
+                output = self.model(input_ids=input_ids, past_key_values=DynamicCache(), use_cache=True)
+            entry = (prefix_ids, output.past_key_values)
+
+            self._entries[prefix] = entry
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.misses += 1
+            self.prefill_seconds += time.perf_counter() - started
+            log.info(f"KV-кэш префикса промпта: {len(prefix_ids)} токенов за {time.perf_counter() - started:.2f} сек")
+            return entry
+
+    def encode(self, prefix: str, suffix: str) -> Tuple[torch.Tensor, DynamicCache]:
+        """Вход generate(): полные токены промпта и копия кэша префикса"""
+        prefix_ids, cache = self.get(prefix)
+        suffix_ids = self.tokenizer(suffix, add_special_tokens=False)["input_ids"]
+        input_ids = torch.tensor([prefix_ids + suffix_ids], device=self.model.device)
+        return input_ids, copy.deepcopy(cache)
+
+    def generate(self, prefix: str, suffix: str, **generate_kwargs) -> str:
+        """Генерация продолжения prefix + suffix; возвращает только новый текст"""
+        input_ids, cache = self.encode(prefix, suffix)
+        with torch.inference_mode():
+            output = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=cache,
+                **generate_kwargs,
+            )
+        return self.tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'prefill_seconds': round(self.prefill_seconds, 3),
+            }
@@ -0,0 +1,169 @@
+"""
+Реестр моделей: один экземпляр каждой модели на процесс
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import psutil
+
+from app.core.logger import log
+
+
+class ModelEntry:
+    """
+    Состояние одной зарегистрированной модели.
+
+    Модель, которая при сбое загрузки работает на запасном пути
+    (Classifier без NLI, генератор без LLM), сообщает об этом атрибутом
+    load_error: запись получает состояние ERROR, но экземпляр остаётся
+    доступен через get() и повторно не загружается.
+    """
+
+    NOT_LOADED = "not_loaded"
+    LOADING = "loading"
+    READY = "ready"
+    ERROR = "error"
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self.instance: Any = None
+        self.state = self.NOT_LOADED
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.memory_mb: Optional[float] = None
+        self.loaded_at: Optional[str] = None
+
+    def status(self) -> Dict:
+        last_inference = getattr(self.instance, "last_inference_at", None)
+        metrics = getattr(self.instance, "stats", None)
+        return {
+            "state": self.state,
+            "load_seconds": self.load_seconds,
+            "memory_mb": self.memory_mb,
+            "loaded_at": self.loaded_at,
+            "last_inference_at": (
+                datetime.fromtimestamp(last_inference).isoformat() if last_inference else None
+            ),
+            "error": self.error,
+            "metrics": metrics() if callable(metrics) else None,
+        }
+
+
+class ModelRegistry:
+    """
+    Процессный реестр моделей.
+
+    Модели загружаются один раз (в lifespan API или при старте EmailWorker)
+    и дальше выдаются через get(); health-check читает только status().
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, ModelEntry] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        """Регистрация фабрики модели (без загрузки)"""
+        if name not in self._entries:
+            self._entries[name] = ModelEntry(name, factory)
+
+    def load(self, name: str) -> Any:
+        """Загрузка модели, если она ещё не загружена"""
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Модель '{name}' не зарегистрирована")
+
+        with self._lock:
+            if entry.instance is not None:
+                return entry.instance
+
+            entry.state = ModelEntry.LOADING
+            entry.error = None
+            process = psutil.Process()
+            rss_before = process.memory_info().rss
+            started = time.perf_counter()
+            try:
+                entry.instance = entry.factory()
+            except Exception as e:
+                entry.state = ModelEntry.ERROR
+                entry.error = str(e)
+                log.error(f"Ошибка загрузки модели '{name}': {e}")
+                raise
+
+            entry.load_seconds = round(time.perf_counter() - started, 3)
+            entry.memory_mb = round(
+                max(process.memory_info().rss - rss_before, 0) / (1024 * 1024), 1
+            )
+            entry.loaded_at = datetime.now().isoformat()
+            failure = getattr(entry.instance, "load_error", None)
+            if failure:
+                entry.state = ModelEntry.ERROR
+                entry.error = failure
+                log.error(f"Модель '{name}' загружена частично: {failure}")
+                return entry.instance
+            entry.state = ModelEntry.READY
+            log.info(
+                f"Модель '{name}' в реестре: {entry.load_seconds} сек, ~{entry.memory_mb} МБ"
+            )
+            return entry.instance
+
+    def load_all(self, names: Optional[Iterable[str]] = None) -> None:
+        """Загрузка набора моделей; ошибки фиксируются в статусе, а не пробрасываются"""
+        for name in names or list(self._entries):
+            try:
+                self.load(name)
+            except Exception:
+                continue
+
+    def get(self, name: str) -> Any:
+        """Получение экземпляра модели (загружает при первом обращении)"""
+        entry = self._entries.get(name)
+        if entry is not None and entry.instance is not None:
+            return entry.instance
+        return self.load(name)
+
+    def is_ready(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return entry is not None and entry.state == ModelEntry.READY
+
+    def status(self, names: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        """Снимок состояния моделей — без обращения к самим моделям"""
+        selected = names or list(self._entries)
+        return {name: self._entries[name].status() for name in selected if name in self._entries}
+
+
+def _register_default_models(registry: ModelRegistry) -> None:
+    """Регистрация моделей конвейера (импорт внутри фабрик — без загрузки torch заранее)"""
+
+    def sentiment():
+        from app.models.sentiment_model import SentimentAnalyzer
+        return SentimentAnalyzer()
+
+    def classifier():
+        from app.models.classifier_model import Classifier
+        return Classifier()
+
+    def summarizer():
+        from app.models.summarizer_model import SummarizerModel
+        return SummarizerModel()
+
+    def parser():
+        from app.services.parser import Parser
+        return Parser()
+
+    def response_generator():
+        from app.models.response_generator import ResponseGenerator
+        return ResponseGenerator()
+
+    registry.register("sentiment", sentiment)
+    registry.register("classifier", classifier)
+    registry.register("summarizer", summarizer)
+    registry.register("parser", parser)
+    registry.register("response_generator", response_generator)
+
+
+registry = ModelRegistry()
+_register_default_models(registry)
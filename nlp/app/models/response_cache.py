@@ -0,0 +1,334 @@
+"""
+Семантический кэш ответов LLM
+"""
+
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.logger import log
+from app.services.record_log import write_json_atomic
+
+# Формы обращения по ФИО: полное, "Имя Отчество", "Фамилия Имя"
+FIO_PLACEHOLDERS = {
+    "⟨fio⟩": lambda parts: parts,
+    "⟨io⟩": lambda parts: parts[1:],
+    "⟨fi⟩": lambda parts: parts[:2],
+}
+_GREETING_RE = re.compile(rf"Уважаем(?:ый|ая)(?:\(ая\))?(?=\s+(?:{'|'.join(FIO_PLACEHOLDERS)}))")
+
+
+class SemanticResponseCache:
+    """
+    Повторное использование проверенных ответов на почти одинаковые вопросы.
+
+    Ключ — (категория, тип устройства) и эмбеддинг краткого описания
+    проблемы: внутри ключа ищется ближайший сохранённый вопрос, и при
+    косинусной близости не ниже threshold возвращается его ответ.
+    В кэше хранятся обезличенные ответы: ФИО клиента заменяется
+    плейсхолдером и подставляется заново для нового письма. Ответы с
+    другими персональными данными клиента (телефон, email, объект) и ответы,
+    где ФИО не удалось заменить полностью, не кэшируются.
+
+    Вытеснение — LRU по числу записей и TTL от момента сохранения.
+    Кэш хранится в JSON-файле, общем для всех процессов: запись не чаще
+    save_interval секунд и при завершении процесса, с объединением
+    записей разных процессов (см. flush).
+    """
+
+    PERSONAL_FIELDS = ("phone", "email", "object_name")
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], path: Optional[Path], model_name: str,
+                 threshold: float = 0.92, max_entries: int = 2000, ttl: float = 7 * 86400,
+                 save_interval: float = 30.0):
+        self.encode = encode
+        self.path = Path(path) if path else None
+        self.model_name = model_name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.save_interval = save_interval
+
+        self._buckets: Dict[Tuple[str, str], OrderedDict] = {}
+        self._lru: OrderedDict = OrderedDict()  # id -> ключ; порядок — от давно использованных
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+        self.lookups = 0
+        self.hits = 0
+        self.stores = 0
+        self.rejected = 0
+        self.saved_seconds = 0.0
+
+        self._load()
+        if self.path:
+            atexit.register(self.flush)
+
+    # =========================================================================
+    # ПОИСК И СОХРАНЕНИЕ
+    # =========================================================================
+
+    @staticmethod
+    def _key(record: Dict) -> Tuple[str, str]:
+        return (
+            (record.get("category") or "").strip().lower(),
+            (record.get("device_type") or "").strip().lower(),
+        )
+
+    def embed(self, records: Sequence[Dict]) -> List[Optional[np.ndarray]]:
+        """Эмбеддинги описаний одним вызовом энкодера (None — описания нет)"""
+        texts = {i: (record.get("description") or "").strip() for i, record in enumerate(records)}
+        texts = {i: text for i, text in texts.items() if text}
+        vectors: List[Optional[np.ndarray]] = [None] * len(records)
+        if texts:
+            encoded = self.encode(list(texts.values()))
+            for i, vector in zip(texts, encoded):
+                vectors[i] = np.asarray(vector, dtype=np.float32)
+        return vectors
+
+    def get(self, record: Dict, vector: Optional[np.ndarray]) -> Optional[str]:
+        """Ответ на похожий вопрос с ФИО нового клиента или None"""
+        if vector is None:
+            return None
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            bucket = self._buckets.get(self._key(record))
+            if not bucket:
+                return None
+
+            for entry_id in [i for i, entry in bucket.items() if now - entry["created_at"] > self.ttl]:
+                self._remove(entry_id)
+            if not bucket:
+                return None
+
+            ids = list(bucket)
+            similarities = np.stack([bucket[i]["vector"] for i in ids]) @ vector
+            best = int(similarities.argmax())
+            if similarities[best] < self.threshold:
+                return None
+
+            entry = bucket[ids[best]]
+            entry["hits"] += 1
+            entry["last_used_at"] = now
+            self._lru.move_to_end(ids[best])
+            self.hits += 1
+            self.saved_seconds += entry["generation_seconds"]
+            self._dirty = True
+
+        log.info(f"♻️ Ответ из семантического кэша (близость {similarities[best]:.3f})")
+        return self._personalize(entry["body"], record)
+
+    def put(self, record: Dict, vector: Optional[np.ndarray], body: str, generation_seconds: float) -> bool:
+        """Сохранение проверенного ответа; False — ответ нельзя обезличить"""
+        if vector is None or not body:
+            return False
+        template = self._depersonalize(body, record)
+        if template is None:
+            with self._lock:
+                self.rejected += 1
+            return False
+
+        now = time.time()
+        key = self._key(record)
+        with self._lock:
+            entry_id = uuid.uuid4().hex
+            self._buckets.setdefault(key, OrderedDict())[entry_id] = {
+                "vector": np.asarray(vector, dtype=np.float32),
+                "body": template,
+                "created_at": now,
+                "last_used_at": now,
+                "hits": 0,
+                "generation_seconds": generation_seconds,
+            }
+            self._lru[entry_id] = key
+            while len(self._lru) > self.max_entries:
+                self._remove(next(iter(self._lru)))
+            self.stores += 1
+            self._dirty = True
+            save_due = time.monotonic() - self._saved_at >= self.save_interval
+
+        if save_due:
+            self.flush()
+        return True
+
+    def _remove(self, entry_id: str) -> None:
+        key = self._lru.pop(entry_id)
+        bucket = self._buckets[key]
+        bucket.pop(entry_id, None)
+        if not bucket:
+            del self._buckets[key]
+
+    def _depersonalize(self, body: str, record: Dict) -> Optional[str]:
+        """ФИО → плейсхолдер; None, если в ответе остались данные клиента"""
+        for field in self.PERSONAL_FIELDS:
+            value = (record.get(field) or "").strip()
+            if len(value) >= 4 and value.lower() in body.lower():
+                return None
+
+        parts = (record.get("fio") or "").split()
+        if len(parts) > 1:
+            variants = {" ".join(form(parts)): placeholder for placeholder, form in FIO_PLACEHOLDERS.items()}
+        else:
+            variants = {" ".join(parts): "⟨fio⟩"}
+        # От длинных форм к коротким: "Иванов Иван Иванович" раньше "Иван Иванович"
+        for variant in sorted(variants, key=len, reverse=True):
+            if variant:
+                body = body.replace(variant, variants[variant])
+        if any(len(part) >= 3 and part in body for part in parts):
+            return None
+        # Обращение нейтрально по роду — ФИО будет другим
+        return _GREETING_RE.sub("Уважаемый(ая)", body)
+
+    @staticmethod
+    def _personalize(template: str, record: Dict) -> str:
+        """Подстановка ФИО нового клиента в той же форме, что была в ответе"""
+        parts = (record.get("fio") or "").split()
+        for placeholder, form in FIO_PLACEHOLDERS.items():
+            # Если ФИО короче нужной формы — берётся целиком
+            name = " ".join(form(parts) if len(parts) == 3 else parts) or "Клиент"
+            template = template.replace(placeholder, name)
+        return template
+
+    # =========================================================================
+    # ФАЙЛ
+    # =========================================================================
+
+    _FIELDS = ("body", "created_at", "last_used_at", "hits", "generation_seconds")
+    LOCK_TIMEOUT = 10.0
+
+    def _load(self) -> None:
+        if not self.path:
+            return
+        items = self._read_file()
+        with self._lock:
+            self._merge(items)
+        if self._lru:
+            log.info(f"Кэш ответов загружен: {len(self._lru)} записей")
+
+    def _read_file(self) -> List[Dict]:
+        """Записи из файла; пустой список, если файла нет или он от другого энкодера"""
+        if not self.path.exists():
+            return []
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning(f"⚠️ Файл кэша ответов не прочитан: {e}")
+            return []
+        if data.get("model") != self.model_name:
+            log.info("Кэш ответов в файле построен другим энкодером — не используется")
+            return []
+        return data.get("entries", [])
+
+    def _merge(self, items: List[Dict]) -> None:
+        """Объединение с записями из файла (их сохранили и другие процессы), затем TTL и LRU"""
+        now = time.time()
+        for item in items:
+            if now - item["created_at"] > self.ttl:
+                continue
+            key = tuple(item["key"])
+            entry_id = item["id"]
+            if entry_id in self._lru:
+                entry = self._buckets[key][entry_id]
+                entry["hits"] = max(entry["hits"], item["hits"])
+                entry["last_used_at"] = max(entry["last_used_at"], item["last_used_at"])
+                continue
+            self._buckets.setdefault(key, OrderedDict())[entry_id] = {
+                **{k: item[k] for k in self._FIELDS},
+                "vector": np.asarray(item["vector"], dtype=np.float32),
+            }
+            self._lru[entry_id] = key
+
+        order = sorted(self._lru.items(), key=lambda item: self._buckets[item[1]][item[0]]["last_used_at"])
+        self._lru = OrderedDict(order)
+        while len(self._lru) > self.max_entries:
+            self._remove(next(iter(self._lru)))
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Межпроцессная блокировка файла кэша (lock-файл, создаваемый с O_EXCL):
+        чтение, объединение и запись не перемежаются между процессами.
+        Брошенный упавшим процессом lock-файл снимается по таймауту.
+        """
+        lock_path = self.path.with_name(self.path.name + ".lock")
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        deadline = time.monotonic() + self.LOCK_TIMEOUT
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                try:
+                    stale = time.time() - lock_path.stat().st_mtime > self.LOCK_TIMEOUT
+                except FileNotFoundError:
+                    continue
+                if stale or time.monotonic() > deadline:
+                    log.warning("⚠️ Lock-файл кэша ответов просрочен, снимается")
+                    lock_path.unlink(missing_ok=True)
+                    continue
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            lock_path.unlink(missing_ok=True)
+
+    def flush(self) -> None:
+        """
+        Запись кэша в файл, если он изменился.
+
+        Файл общий для всех процессов с генератором (API, воркеры пула
+        инференса): под блокировкой файл перечитывается, записи других
+        процессов добавляются в память, и записывается объединение —
+        запись одного процесса не затирает ответы, сохранённые другими.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+        try:
+            with self._file_lock():
+                items = self._read_file()
+                with self._lock:
+                    self._merge(items)
+                    entries = []
+                    for entry_id, key in self._lru.items():
+                        entry = self._buckets[key][entry_id]
+                        entries.append({
+                            "id": entry_id,
+                            "key": list(key),
+                            **{k: entry[k] for k in self._FIELDS},
+                            "vector": [round(float(x), 5) for x in entry["vector"]],
+                        })
+                    self._dirty = False
+                    self._saved_at = time.monotonic()
+                write_json_atomic(self.path, {"model": self.model_name, "entries": entries})
+        except OSError as e:
+            log.error(f"❌ Не удалось сохранить кэш ответов: {e}")
+            with self._lock:
+                self._dirty = True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._lru),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "stores": self.stores,
+                "rejected": self.rejected,
+                "saved_generation_seconds": round(self.saved_seconds, 1),
+            }
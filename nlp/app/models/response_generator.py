@@ -2,14 +2,23 @@
 Response Generator для техподдержки ООО «ЭРИС»
 """
 
-from typing import List, Dict, Optional, Tuple
+from typing import Iterator, List, Dict, Optional, Tuple
 from datetime import datetime
 import re
-from transformers import pipeline, GenerationConfig
+import threading
+import time
+from transformers import pipeline, GenerationConfig, StoppingCriteriaList, TextIteratorStreamer
 
 from app.core.config import settings
 from app.core.logger import log
+from app.models.backends import TORCH, load_causal_lm, pipeline_device, resolve_backend
 from app.models.base.knowledge_base import KNOWLEDGE_BASE, GENERATION_PROMPT
+from app.models.generation_stop import StopChecker, StopOnSequences, StreamTextFilter
+
+# Граница неизменного начала промпта: дальше идут данные письма
+PROMPT_SPLIT_MARKER = "Данные клиента:"
+_PROMPT_HEAD, _, _PROMPT_TAIL = GENERATION_PROMPT.partition(PROMPT_SPLIT_MARKER)
+_PROMPT_TAIL = PROMPT_SPLIT_MARKER + _PROMPT_TAIL
 
 
 class ResponseGenerator:
@@ -60,22 +69,100 @@ class ResponseGenerator:
     def __init__(self):
         self.knowledge_base = KNOWLEDGE_BASE
         self.generation_model: Optional[pipeline] = None
+        self.load_error: Optional[str] = None  # LLM не загрузилась (ответы по шаблонам)
+        self.prefix_cache = None
+        self.stop_checker: Optional[StopChecker] = None
+        self.response_cache = None
+        self.last_inference_at: Optional[float] = None
         self._initialize_model()
+        if self.generation_model:
+            # Генерация прерывается, как только в хвосте стоп-последовательность или мусор
+            self.stop_checker = StopChecker(self.generation_model.tokenizer, self.STOP_SEQUENCES, self.GARBAGE_PATTERNS)
+        if self.generation_model and settings.llm_prefix_cache:
+            self._initialize_prefix_cache()
+        if settings.response_cache_enabled:
+            self._initialize_response_cache()
         log.info("✅ ResponseGenerator v3.0 инициализирован")
     
     def _initialize_model(self) -> None:
         try:
-            log.info("🔄 Загрузка Qwen модели...")
+            backend = resolve_backend(settings.inference_backend, settings.device)
+            log.info(f"🔄 Загрузка Qwen модели ({backend})...")
+            model, tokenizer = load_causal_lm(settings.response_name, backend)
             self.generation_model = pipeline(
                 "text-generation",
-                model=settings.response_name,
-                device=-1 if settings.device == "cpu" else 0,
+                model=model,
+                tokenizer=tokenizer,
+                **pipeline_device(TORCH, settings.device),
                 **self.LLM_CONFIG
             )
             log.success("✅ Модель загружена")
         except Exception as e:
             log.error(f"❌ Ошибка загрузки: {e}")
             self.generation_model = None
+            self.load_error = f"LLM не загружена: {e}"
+    
+    def _initialize_prefix_cache(self) -> None:
+        """KV-кэш начала промпта: правила и контекст вычисляются один раз при старте"""
+        from app.models.prompt_cache import PromptPrefixCache
+        try:
+            self.prefix_cache = PromptPrefixCache(self.generation_model.model, self.generation_model.tokenizer)
+            self.prefix_cache.get(self._build_prompt({})[0])
+        except Exception as e:
+            log.warning(f"⚠️ KV-кэш префикса недоступен, полный промпт на каждый ответ: {e}")
+            self.prefix_cache = None
+    
+    def _initialize_response_cache(self) -> None:
+        """Семантический кэш ответов: энкодер описаний и файл с сохранёнными ответами"""
+        from sentence_transformers import SentenceTransformer
+        from app.models.response_cache import SemanticResponseCache
+        try:
+            encoder = SentenceTransformer(settings.embedding_name, device=settings.device)
+            self.response_cache = SemanticResponseCache(
+                lambda texts: encoder.encode(texts, normalize_embeddings=True, convert_to_numpy=True,
+                                             show_progress_bar=False),
+                settings.response_cache_file,
+                settings.embedding_name,
+                threshold=settings.response_cache_threshold,
+                max_entries=settings.response_cache_max_entries,
+                ttl=settings.response_cache_ttl,
+            )
+        except Exception as e:
+            log.warning(f"⚠️ Кэш ответов недоступен: {e}")
+            self.response_cache = None
+    
+    def _lookup_cached(self, records: Dict[int, Dict]) -> Tuple[Dict[int, str], Dict]:
+        """Готовые ответы из кэша и эмбеддинги описаний (для сохранения новых ответов)"""
+        if not self.response_cache or not records:
+            return {}, {}
+        try:
+            vectors = dict(zip(records, self.response_cache.embed(list(records.values()))))
+        except Exception as e:
+            log.warning(f"⚠️ Ошибка энкодера кэша ответов: {e}")
+            return {}, {}
+        cached = {i: self.response_cache.get(records[i], vectors[i]) for i in records}
+        return {i: body for i, body in cached.items() if body}, vectors
+    
+    def _store_cached(self, record_safe: Dict, vector, result: Dict, generation_seconds: float) -> None:
+        if self.response_cache and vector is not None and result["method"] == "llm_qwen":
+            self.response_cache.put(record_safe, vector, result["body"], generation_seconds)
+    
+    def _generation_kwargs(self) -> Dict:
+        """Параметры model.generate() — те же, что у pipeline"""
+        tokenizer = self.generation_model.tokenizer
+        return {
+            **self.LLM_CONFIG,
+            "pad_token_id": tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id,
+        }
+    
+    def _build_prompt(self, record: Dict) -> Tuple[str, str]:
+        """Промпт из двух частей: неизменное начало (с контекстом) и данные письма"""
+        prefix = _PROMPT_HEAD.format(context=self._build_context(record))
+        suffix = _PROMPT_TAIL.format(
+            **{k: record.get(k, "") for k in ["fio", "object_name", "phone", "email",
+                                              "device_type", "category", "sentiment", "description"]}
+        )
+        return prefix, suffix
     
     # =========================================================================
     # ИЗВЛЕЧЕНИЕ И ОЧИСТКА ОТВЕТА
@@ -295,11 +382,19 @@ class ResponseGenerator:
     # ГЕНЕРАЦИЯ ЧЕРЕЗ LLM (с защитой)
     # =========================================================================
     
-    def _generate_with_llm(self, prompt: str) -> Optional[str]:
+    def _generate_with_llm(self, prompt: str, prefix: str = "") -> Optional[str]:
         if not self.generation_model:
             return None
         
         try:
+            self.last_inference_at = time.time()
+            stop = StopOnSequences(self.stop_checker)
+            if self.prefix_cache and prefix and prompt.startswith(prefix):
+                generated_text = self._generate_cached(prompt, prefix, stop)
+                if generated_text is not None:
+                    return self._finish_llm_output(generated_text, prompt, stop)
+                stop = StopOnSequences(self.stop_checker)
+            
             # Генерация с явными параметрами
             result = self.generation_model(
                 prompt,
@@ -307,68 +402,153 @@ class ResponseGenerator:
                 temperature=self.LLM_CONFIG["temperature"],
                 do_sample=self.LLM_CONFIG["do_sample"],
                 repetition_penalty=self.LLM_CONFIG["repetition_penalty"],
+                stopping_criteria=StoppingCriteriaList([stop]),
             )
             
             if not result or not isinstance(result, list):
                 return None
             
             generated_text = result[0].get("generated_text", "")
-            if not generated_text:
-                return None
-            
-            # Извлечение и очистка
-            response = self._extract_clean_response(generated_text, prompt)
-            if not response:
-                return None
-            
-            # Быстрая проверка на адекватность
-            if self._is_garbage_response(response):
-                return None
-            
-            return response.strip()
+            return self._finish_llm_output(generated_text, prompt, stop)
             
         except Exception as e:
             log.error(f"❌ Ошибка LLM: {e}")
             return None
     
+    def _generate_cached(self, prompt: str, prefix: str, stop: StopOnSequences) -> Optional[str]:
+        """Генерация с готовым KV-кэшем префикса: prefill только данных письма"""
+        try:
+            return self.prefix_cache.generate(
+                prefix, prompt[len(prefix):],
+                stopping_criteria=StoppingCriteriaList([stop]),
+                **self._generation_kwargs(),
+            )
+        except Exception as e:
+            log.warning(f"⚠️ Ошибка генерации с KV-кэшем префикса, кэш отключён: {e}")
+            self.prefix_cache = None
+            return None
+    
+    def _generate_with_llm_batch(self, prompts: List[Tuple[str, str]]) -> List[Optional[str]]:
+        """Генерация по нескольким промптам (начало, данные письма) одним батчем"""
+        from app.models.batch_generation import ContinuousBatcher
+        try:
+            self.last_inference_at = time.time()
+            kwargs = self._generation_kwargs()
+            batcher = ContinuousBatcher(
+                self.generation_model.model,
+                self.generation_model.tokenizer,
+                max_batch_size=settings.llm_batch_size,
+                max_new_tokens=kwargs["max_new_tokens"],
+                eos_token_id=kwargs["eos_token_id"],
+                do_sample=kwargs["do_sample"],
+                temperature=kwargs["temperature"],
+                top_p=kwargs["top_p"],
+                top_k=kwargs["top_k"],
+                repetition_penalty=kwargs["repetition_penalty"],
+                prefix_cache=self.prefix_cache,
+                stop_checker=self.stop_checker,
+            )
+            started = time.perf_counter()
+            texts = batcher.run(prompts)
+            log.info(f"Пакетная генерация: {len(prompts)} ответов за {time.perf_counter() - started:.1f} сек")
+        except Exception as e:
+            log.warning(f"⚠️ Ошибка пакетной генерации, генерация по одному письму: {e}")
+            return [self._generate_with_llm(prefix + suffix, prefix) for prefix, suffix in prompts]
+        
+        responses = []
+        for text, (prefix, suffix) in zip(texts, prompts):
+            if text is None:
+                # Строка остановлена на мусоре — ответ по шаблону
+                log.info("LLM начала мусорный ответ — генерация прервана")
+                responses.append(None)
+            else:
+                responses.append(self._clean_llm_output(text, prefix + suffix))
+        return responses
+    
+    def _finish_llm_output(self, generated_text: str, prompt: str, stop: StopOnSequences) -> Optional[str]:
+        if stop.reason == StopChecker.GARBAGE:
+            log.info("LLM начала мусорный ответ — генерация прервана")
+            return None
+        return self._clean_llm_output(generated_text, prompt)
+    
+    def _clean_llm_output(self, generated_text: str, prompt: str) -> Optional[str]:
+        if not generated_text:
+            return None
+        
+        # Извлечение и очистка
+        response = self._extract_clean_response(generated_text, prompt)
+        if not response:
+            return None
+        
+        # Быстрая проверка на адекватность
+        if self._is_garbage_response(response):
+            return None
+        
+        return response.strip()
+    
     # =========================================================================
     # MAIN: ГЕНЕРАЦИЯ ОТВЕТА
     # =========================================================================
     
     def generate(self, record: Dict) -> Dict:
-        log.info(f"🔄 Генерация | Категория: {record.get('category')} | Устройство: {record.get('device_type')}")
-        
-        # Нормализация входных данных
-        record_safe = {k: (str(v).strip() if v is not None else "") for k, v in record.items()}
-        
+        return self.generate_batch([record])[0]
+    
+    def generate_batch(self, records: List[Dict]) -> List[Dict]:
+        """
+        Ответы на пачку писем: LLM декодирует их вместе (непрерывный
+        батчинг), валидация и fallback — для каждого письма отдельно
+        """
+        records_safe = []
+        pending: List[int] = []
+        for i, record in enumerate(records):
+            log.info(f"🔄 Генерация | Категория: {record.get('category')} | Устройство: {record.get('device_type')}")
+            # Нормализация входных данных
+            record_safe = {k: (str(v).strip() if v is not None else "") for k, v in record.items()}
+            records_safe.append(record_safe)
+            # Для категории "документация" LLM не нужна
+            if record_safe.get("category") != "документация":
+                pending.append(i)
+        
+        # Почти одинаковые вопросы — готовый ответ из кэша без генерации
+        cached, vectors = self._lookup_cached({i: records_safe[i] for i in pending})
+        prompts = {i: self._build_prompt(records_safe[i]) for i in pending if i not in cached}
+        
+        llm_responses: Dict[int, Optional[str]] = {}
+        generation_seconds = 0.0
+        if self.generation_model and prompts:
+            started = time.perf_counter()
+            if len(prompts) == 1:
+                (i, (prefix, suffix)), = prompts.items()
+                llm_responses[i] = self._generate_with_llm(prefix + suffix, prefix)
+            else:
+                llm_responses = dict(zip(prompts, self._generate_with_llm_batch(list(prompts.values()))))
+            generation_seconds = (time.perf_counter() - started) / len(prompts)
+        
+        results = []
+        for i, (record, record_safe) in enumerate(zip(records, records_safe)):
+            if i in cached:
+                results.append(self._compose_response(record, record_safe, cached[i], method="cache"))
+                continue
+            result = self._compose_response(record, record_safe, llm_responses.get(i))
+            if i in llm_responses:
+                self._store_cached(record_safe, vectors.get(i), result, generation_seconds)
+            results.append(result)
+        return results
+    
+    def _compose_response(self, record: Dict, record_safe: Dict, response_body: Optional[str],
+                          method: str = "llm_qwen") -> Dict:
         # Для категории "документация" — сразу используем fallback с умным поиском
         if record_safe.get("category") == "документация":
             log.info("📚 Запрос документации — используем оптимизированный fallback")
             response_body = self._generate_docs_fallback(record_safe)
             method = "fallback_docs"
-            validation_warnings = []
         else:
-            # Стандартный путь для других категорий
-            context = self._build_context(record_safe)  # Существующий метод
-            
-            prompt = GENERATION_PROMPT.format(
-                context=context,
-                **{k: record_safe.get(k, "") for k in ["fio", "object_name", "phone", "email", 
-                                                       "device_type", "category", "sentiment", "description"]}
-            )
-            
-            response_body = None
-            method = "fallback"
-            
-            if self.generation_model:
-                response_body = self._generate_with_llm(prompt)
-                if response_body:
-                    is_valid, warnings = self._validate_response(response_body, record_safe)
-                    if is_valid and not self._is_garbage_response(response_body):
-                        method = "llm_qwen"
-                    else:
-                        log.warning(f"⚠️ LLM-ответ отклонён: {warnings}")
-                        response_body = None
+            # Стандартный путь для других категорий (method — источник response_body)
+            if response_body:
+                is_valid, warnings = self._validate_response(response_body, record_safe)
+                if not is_valid or self._is_garbage_response(response_body):
+                    log.warning(f"⚠️ LLM-ответ отклонён: {warnings}")
+                    response_body = None
             
             if not response_body:
                 response_body = self._generate_fallback(record_safe)  # Существующий fallback
@@ -389,9 +569,97 @@ class ResponseGenerator:
             "generated_at": datetime.now().isoformat(),
         }
     
+    def stream(self, record: Dict, cancel: Optional[threading.Event] = None) -> Iterator[Dict]:
+        """
+        Потоковая генерация ответа
+        
+        Args:
+            cancel: событие отмены (клиент отключился) — генерация в потоке
+                останавливается на следующем токене; то же происходит, если
+                итератор закрыт, не дочитав ответ
+        
+        Yields:
+            {"event": "delta", "text": ...} — очередные фрагменты ответа LLM
+            (без стоп-последовательностей), затем {"event": "done", ...} —
+            итоговый ответ как у generate(); после валидации он может
+            заменить показанный текст шаблонным
+        """
+        log.info(f"🔄 Потоковая генерация | Категория: {record.get('category')} | Устройство: {record.get('device_type')}")
+        record_safe = {k: (str(v).strip() if v is not None else "") for k, v in record.items()}
+        
+        response_body = None
+        cached, vectors = {}, {}
+        if record_safe.get("category") != "документация":
+            cached, vectors = self._lookup_cached({0: record_safe})
+        if cached:
+            yield {"event": "delta", "text": cached[0]}
+            yield {"event": "done", **self._compose_response(record, record_safe, cached[0], method="cache")}
+            return
+        
+        started = time.perf_counter()
+        if self.generation_model and record_safe.get("category") != "документация":
+            prefix, suffix = self._build_prompt(record_safe)
+            prompt = prefix + suffix
+            cancel = cancel or threading.Event()
+            stop = StopOnSequences(self.stop_checker, cancel)
+            streamer = TextIteratorStreamer(self.generation_model.tokenizer, skip_prompt=True,
+                                            skip_special_tokens=True, timeout=300)
+            worker = threading.Thread(target=self._generate_streaming, args=(prefix, suffix, streamer, stop), daemon=True)
+            self.last_inference_at = time.time()
+            worker.start()
+            
+            text_filter = StreamTextFilter(self.STOP_SEQUENCES)
+            completed = False
+            try:
+                for chunk in streamer:
+                    delta = text_filter.feed(chunk)
+                    if delta:
+                        yield {"event": "delta", "text": delta}
+                completed = True
+            finally:
+                # Итератор закрыт или прерван — model.generate не должен декодировать впустую
+                if not completed:
+                    cancel.set()
+            worker.join()
+            if stop.reason == StopChecker.CANCELLED:
+                log.info("Потоковая генерация отменена")
+                return
+            delta = text_filter.flush()
+            if delta:
+                yield {"event": "delta", "text": delta}
+            response_body = self._finish_llm_output(text_filter.text, prompt, stop)
+        
+        result = self._compose_response(record, record_safe, response_body)
+        self._store_cached(record_safe, vectors.get(0), result, time.perf_counter() - started)
+        yield {"event": "done", **result}
+    
+    def _generate_streaming(self, prefix: str, suffix: str, streamer: TextIteratorStreamer,
+                            stop: StopOnSequences) -> None:
+        """model.generate() в отдельном потоке; токены уходят в streamer"""
+        import torch
+        try:
+            model = self.generation_model.model
+            kwargs = {"streamer": streamer, "stopping_criteria": StoppingCriteriaList([stop]), **self._generation_kwargs()}
+            if self.prefix_cache:
+                input_ids, cache = self.prefix_cache.encode(prefix, suffix)
+                kwargs["past_key_values"] = cache
+            else:
+                input_ids = self.generation_model.tokenizer(prefix + suffix, return_tensors="pt")["input_ids"].to(model.device)
+            with torch.inference_mode():
+                model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids), **kwargs)
+        except Exception as e:
+            log.error(f"❌ Ошибка потоковой генерации: {e}")
+            streamer.end()
+    
     def __call__(self, record: Dict) -> Dict:
         return self.generate(record)
     
+    def stats(self) -> Dict:
+        return {
+            "prefix_cache": self.prefix_cache.stats() if self.prefix_cache else None,
+            "response_cache": self.response_cache.stats() if self.response_cache else None,
+        }
+    
     # =========================================================================
     # ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ (сокращённо — оставляем существующие)
     # =========================================================================
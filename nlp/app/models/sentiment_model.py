@@ -1,24 +1,31 @@
+import time
+from typing import List, Optional
 import torch
 from transformers import pipeline, AutoModelForSequenceClassification, AutoTokenizer
 from app.core.config import settings
 from app.core.logger import log
+from app.models.backends import load_sequence_classifier, pipeline_device, resolve_backend
 
 class SentimentAnalyzer:
     def __init__(self):
         self.model_name = settings.sentiment_name
         self.device = settings.device
+        self.backend = resolve_backend(settings.inference_backend, self.device)
         self.max_length = settings.max_length
+        self.batch_size = settings.sentiment_batch_size
         self.pipeline = None
+        self.last_inference_at = None
         self._load_model()
 
     def _load_model(self):
-        log.info(f"Загрузка модели {self.model_name} на устройство {self.device}...")
+        log.info(f"Загрузка модели {self.model_name} на устройство {self.device} ({self.backend})...")
         try:
+            model, tokenizer = load_sequence_classifier(self.model_name, self.backend)
             self.pipeline = pipeline(
                 "sentiment-analysis",
-                model=self.model_name,
-                tokenizer=self.model_name,
-                device=-1 if self.device == "cpu" else 0,
+                model=model,
+                tokenizer=tokenizer,
+                **pipeline_device(self.backend, self.device),
                 max_length=self.max_length,
                 truncation=True
             )
@@ -27,25 +34,27 @@ class SentimentAnalyzer:
             log.error(f"Ошибка загрузки модели: {e}")
             raise RuntimeError(f"Не удалось загрузить модель: {e}")
 
+    @staticmethod
+    def _map_label(label: str) -> str:
+        # rubert-base-cased-sentiment: LABEL_0=negative, LABEL_1=neutral, LABEL_2=positive
+        if label == 'LABEL_0':
+            return 'negative'
+        if label == 'LABEL_1':
+            return 'neutral'
+        if label == 'LABEL_2':
+            return 'positive'
+        return label.lower()
+
     def predict(self, text: str, subject: str = "") -> dict:
         if not self.pipeline:
             raise RuntimeError("Модель не загружена")
         try:
             input_text = f"{subject} {text}"
+            self.last_inference_at = time.time()
             result = self.pipeline(input_text[:self.max_length])[0]
-            label = result['label']
+            sentiment = self._map_label(result['label'])
             score = result['score']
 
-            # rubert-base-cased-sentiment: LABEL_0=negative, LABEL_1=neutral, LABEL_2=positive
-            if label == 'LABEL_0':
-                sentiment = 'negative'
-            elif label == 'LABEL_1':
-                sentiment = 'neutral'
-            elif label == 'LABEL_2':
-                sentiment = 'positive'
-            else:
-                sentiment = label.lower()
-
             return {
                 'sentiment': sentiment,
                 'confidence': round(score, 4)
@@ -54,5 +63,55 @@ class SentimentAnalyzer:
             log.error(f"Ошибка при предсказании: {e}")
             raise
 
+    def predict_batch(self, texts: List[str], subjects: Optional[List[str]] = None) -> List[dict]:
+        """
+        Пакетный анализ тональности
+
+        Входы токенизируются без паддинга, сортируются по длине и режутся на
+        корзины по batch_size; каждая корзина дополняется только до своей
+        максимальной длины и проходит через модель одним forward pass.
+
+        Returns:
+            Результаты в порядке входных текстов
+        """
+        if not self.pipeline:
+            raise RuntimeError("Модель не загружена")
+        if not texts:
+            return []
+
+        subjects = subjects or [""] * len(texts)
+        inputs = [f"{subject} {text}"[:self.max_length] for text, subject in zip(texts, subjects)]
+
+        tokenizer = self.pipeline.tokenizer
+        model = self.pipeline.model
+        id2label = model.config.id2label
+
+        try:
+            encodings = tokenizer(inputs, truncation=True, max_length=self.max_length)
+            order = sorted(range(len(inputs)), key=lambda i: len(encodings['input_ids'][i]))
+            results: List[Optional[dict]] = [None] * len(inputs)
+            self.last_inference_at = time.time()
+
+            for start in range(0, len(order), self.batch_size):
+                bucket = order[start:start + self.batch_size]
+                features = [{key: encodings[key][i] for key in encodings.keys()} for i in bucket]
+                batch = tokenizer.pad(features, padding=True, return_tensors="pt").to(model.device)
+
+                with torch.inference_mode():
+                    probs = torch.softmax(model(**batch).logits, dim=-1)
+                scores, label_ids = probs.max(dim=-1)
+
+                for i, score, label_id in zip(bucket, scores.tolist(), label_ids.tolist()):
+                    results[i] = {
+                        'sentiment': self._map_label(id2label[label_id]),
+                        'confidence': round(score, 4)
+                    }
+
+            log.debug(f"Пакетная тональность: {len(inputs)} текстов, корзин: {-(-len(inputs) // self.batch_size)}")
+            return results
+        except Exception as e:
+            log.error(f"Ошибка при пакетном предсказании: {e}")
+            raise
+
     def __call__(self, text: str, subject: str = "") -> dict:
         return self.predict(text, subject)
\ No newline at end of file
@@ -2,12 +2,14 @@ import re
 from app.core.config import settings
 from app.core.logger import log
 from app.models.base.problem_keywords import PROBLEM_KEYWORDS
+from app.services.keyword_matcher import KeywordMatcher
 
 class SummarizerModel:    
     MAX_LENGTH = 200
     SENTENCES_COUNT = 2
     PROBLEM_KEYWORDS = PROBLEM_KEYWORDS
     def __init__(self):
+        self.problem_matcher = KeywordMatcher({'problem': self.PROBLEM_KEYWORDS})
         log.info("Суммаризатор инициализирован")
         log.success("Суммаризатор готов к работе")
 
@@ -25,10 +27,8 @@ class SummarizerModel:
 
     def _find_problem_sentence(self, sentences: list) -> str:
         for sentence in sentences:
-            sentence_lower = sentence.lower()
-            for keyword in self.PROBLEM_KEYWORDS:
-                if keyword in sentence_lower:
-                    return sentence
+            if self.problem_matcher.contains(sentence):
+                return sentence
         return ""
 
     def summarize(self, text: str, subject: str = "") -> dict:
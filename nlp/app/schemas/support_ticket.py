@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 
 class ProcessedEmail(BaseModel):
@@ -17,6 +17,7 @@ class ProcessedEmail(BaseModel):
     sentiment_confidence: Optional[float] = None
     category: Optional[str] = None
     category_confidence: Optional[float] = None
+    category_method: Optional[str] = None
     processed_at: str
     response_body: Optional[str] = None
     response_subject: Optional[str] = None
@@ -25,6 +26,11 @@ class ProcessedEmail(BaseModel):
     class Config:
         from_attributes = True
 
+class SearchHit(BaseModel):
+    ticket: ProcessedEmail
+    score: float
+    highlights: Dict[str, str] = Field(default_factory=dict)
+
 class HealthResponse(BaseModel):
     status: str
     timestamp: str
@@ -34,4 +40,7 @@ class StatsResponse(BaseModel):
     total_processed: int
     by_sentiment: dict
     by_category: dict
+    by_response_method: dict = Field(default_factory=dict)
+    by_device_type: dict = Field(default_factory=dict)
+    by_day: dict = Field(default_factory=dict)
     last_updated: str
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+Асинхронная запись тикетов в MySQL с отложенной (write-behind) буферизацией
+"""
+
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.core.logger import log
+
+
+class AsyncTicketWriter:
+    """
+    Буфер записей для DatabaseWriter в event loop конвейера.
+
+    put() только кладёт запись в ограниченную очередь; фоновая задача
+    собирает пачку и сбрасывает её одной транзакцией
+    (DatabaseWriter.save_tickets в пуле потоков поверх пула соединений),
+    когда набралось flush_size записей или прошло flush_interval сек с
+    первой записи пачки. Переполненная очередь задерживает put() —
+    обратное давление на стадию persist. stop() дожидается записи всего
+    поставленного.
+
+    Записи, которые не удалось сохранить, возвращаются в буфер до
+    max_retries раз, затем только логируются (они уже есть в журнале API).
+    """
+
+    def __init__(self, flush_size: int = 100, flush_interval: float = 2.0, queue_size: int = 1000,
+                 max_retries: int = 3, save: Optional[Callable[[List[Dict]], List[Optional[int]]]] = None):
+        self.flush_size = max(flush_size, 1)
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self._save = save
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._retry: List[tuple] = []
+
+        # Метрики
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.flush_seconds = 0.0
+
+    def start(self) -> None:
+        """Запуск фоновой записи (внутри работающего event loop)"""
+        if self._save is None:
+            # mysql-connector нужен только при включённой записи в БД
+            from app.services.database_writer import DatabaseWriter
+            self._save = DatabaseWriter.save_tickets
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run(), name="db-writer")
+        log.info(f"Отложенная запись в БД: пачки по {self.flush_size}, не реже раза в {self.flush_interval:g} сек")
+
+    async def put(self, record: Dict) -> None:
+        """Постановка записи; ждёт, если очередь заполнена"""
+        await self._queue.put((record, 0))
+
+    def put_threadsafe(self, records: List[Dict]) -> None:
+        """put() из потока-исполнителя стадии (блокирует поток при заполненной очереди)"""
+        async def put_all():
+            for record in records:
+                await self.put(record)
+        asyncio.run_coroutine_threadsafe(put_all(), self._loop).result()
+
+    async def stop(self) -> None:
+        """Запись всего поставленного и остановка"""
+        if self._task is None:
+            return
+        await self._queue.put(None)  # Метка конца: после неё записей нет
+        await self._task
+        self._task = None
+        log.info(f"Отложенная запись в БД остановлена: {self.stats()}")
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping or self._retry:
+            batch, self._retry = self._retry, []
+            deadline = time.monotonic() + self.flush_interval
+            while not stopping and len(batch) < self.flush_size:
+                if batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = await self._queue.get()
+                    deadline = time.monotonic() + self.flush_interval
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch: List[tuple]) -> None:
+        started = time.perf_counter()
+        records = [record for record, _ in batch]
+        try:
+            ticket_ids = await asyncio.to_thread(self._save, records)
+        except Exception as e:
+            log.error(f"Ошибка записи пачки в БД: {e}")
+            ticket_ids = [None] * len(records)
+        self.flushes += 1
+        self.flush_seconds += time.perf_counter() - started
+
+        for (record, attempts), ticket_id in zip(batch, ticket_ids):
+            if ticket_id:
+                self.written += 1
+            elif attempts + 1 < self.max_retries:
+                self._retry.append((record, attempts + 1))
+            else:
+                self.failed += 1
+                log.error(f"Запись письма #{record.get('email_id')} в БД не удалась после {attempts + 1} попыток")
+        if self._retry:
+            await asyncio.sleep(self.flush_interval)
+
+    def stats(self) -> Dict:
+        return {
+            'written': self.written,
+            'failed': self.failed,
+            'queued': self._queue.qsize() if self._queue else 0,
+            'retrying': len(self._retry),
+            'flushes': self.flushes,
+            'avg_flush_ms': round(self.flush_seconds * 1000 / self.flushes, 1) if self.flushes else None,
+        }
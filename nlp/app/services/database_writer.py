@@ -4,23 +4,71 @@ Database Writer для сохранения обработанных писем
 
 import mysql.connector
 from mysql.connector import Error, pooling
-from typing import Optional, Dict, List
+from collections import Counter, OrderedDict
+from typing import Optional, Dict, List, Tuple
 from datetime import datetime
 import re
+import threading
+import time
 
 from app.core.config import settings
 from app.core.logger import log
 
 
+class _LookupCache:
+    """Ограниченный LRU-кэш ключ → id строки справочника"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key) -> Optional[int]:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def put(self, key, value: int) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
 class DatabaseWriter:
     """
     Менеджер записи данных в базу данных MySQL
     Использует connection pooling для эффективности
+
+    ID строк справочников кэшируются в процессе: Sentiment, Categories и
+    Gas_analyzer_type читаются целиком (раз в db_cache_ttl сек), Facility,
+    Contacts и Gas_analyzer — по мере встречи. Пачка записей сохраняется
+    в одной транзакции, тикеты — одним многострочным INSERT. После отката
+    кэши сбрасываются: в них могли попасть ID отменённых вставок.
     """
-    
+
     # Пул соединений (создаётся один раз при импорте модуля)
     _connection_pool: Optional[pooling.MySQLConnectionPool] = None
-    
+
+    # Кэши справочников
+    _cache_lock = threading.Lock()
+    _dimensions: Dict[str, Dict[str, int]] = {}
+    _dimensions_loaded_at = 0.0
+    _facilities = _LookupCache(settings.db_cache_size)
+    _contacts = _LookupCache(settings.db_cache_size)
+    _gas_analyzers = _LookupCache(settings.db_cache_size)
+
+    TICKET_QUERY = """
+        INSERT INTO ticket (
+            email_id, subject, body, facility_id, contact_id,
+            sentiment_id, sentiment_confidence, category_id, category_confidence,
+            gaz_analyzer_id, generated_response, response_method, status, created_at
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
+
     @classmethod
     def _get_pool(cls) -> pooling.MySQLConnectionPool:
         """Получение или создание пула соединений"""
@@ -43,175 +91,290 @@ class DatabaseWriter:
                 log.error(f"❌ Ошибка создания пула БД: {e}")
                 raise
         return cls._connection_pool
-    
+
+    @classmethod
+    def invalidate_caches(cls) -> None:
+        """Сброс кэшей справочников (следующая запись перечитает их из БД)"""
+        with cls._cache_lock:
+            cls._dimensions = {}
+            cls._dimensions_loaded_at = 0.0
+            cls._facilities.clear()
+            cls._contacts.clear()
+            cls._gas_analyzers.clear()
+
     @classmethod
     def save_ticket(cls, record: Dict) -> Optional[int]:
         """
         Сохранение обработанного письма в таблицу ticket
-        
+
         Args:
             record: Dict с данными из EmailWorker.process_email()
-            
+
         Returns:
             int: ID созданной записи или None при ошибке
         """
+        return cls.save_tickets([record])[0]
+
+    @classmethod
+    def save_tickets(cls, records: List[Dict]) -> List[Optional[int]]:
+        """
+        Сохранение пачки писем в одной транзакции
+
+        При ошибке пачка откатывается и записи сохраняются по одной,
+        чтобы одна некорректная запись не потянула за собой остальные.
+
+        Returns:
+            ID созданных записей (None — запись не сохранена), в порядке records
+        """
+        if not records:
+            return []
+        # ID строк пакета читаются обратно по email_id — записи без него по одной
+        if len(records) > 1 and not all(record.get('email_id') for record in records):
+            return [cls._save_single(record) for record in records]
         try:
-            conn = cls._get_pool().get_connection()
-            cursor = conn.cursor()
-            
-            # 1. Сохранение или получение Facility (объект)
-            facility_id = cls._get_or_create_facility(cursor, record.get('object_name'))
-            
-            # 2. Сохранение или получение Contacts (контакты)
-            contact_id = cls._get_or_create_contact(
-                cursor, 
-                record.get('fio'),
-                record.get('email'),
-                record.get('phone')
-            )
-            
-            # 3. Получение ID sentiment и category из справочников
-            sentiment_id = cls._get_sentiment_id(cursor, record.get('sentiment'))
-            category_id = cls._get_category_id(cursor, record.get('category'))
-            
-            # 4. Сохранение газоанализатора (если указан)
-            gas_analyzer_id = None
-            if record.get('device_type') or record.get('serial_numbers'):
-                gas_analyzer_id = cls._get_or_create_gas_analyzer(
-                    cursor,
-                    record.get('device_type'),
-                    record.get('serial_numbers', [])
-                )
-            
-            # 5. Основная запись в ticket
-            query = """
-                INSERT INTO ticket (
-                    email_id, subject, body, facility_id, contact_id,
-                    sentiment_id, sentiment_confidence, category_id, category_confidence,
-                    gaz_analyzer_id, generated_response, response_method, status, created_at
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            
-            # Извлечение subject из текста письма (первая строка или email_id)
-            subject = cls._extract_subject(record.get('text', '')) or record.get('email_id', '')
-            
-            values = (
-                record.get('email_id'),
-                subject[:255],  # Ограничение VARCHAR(255)
-                record.get('text'),  # MEDIUMTEXT
-                facility_id,
-                contact_id,
-                sentiment_id,
-                record.get('sentiment_confidence'),
-                category_id,
-                record.get('category_confidence'),
-                gas_analyzer_id,
-                record.get('response_body'),  # MEDIUMTEXT
-                record.get('response_method'),
-                'processed',  # Статус после успешной записи
-                record.get('processed_at') or datetime.now()
-            )
-            
-            cursor.execute(query, values)
-            conn.commit()
-            
-            ticket_id = cursor.lastrowid
+            ticket_ids = cls._save_batch(records)
+        except Error as e:
+            if len(records) == 1:
+                log.error(f"❌ Ошибка записи в БД: {e}")
+                return [None]
+            log.warning(f"⚠️ Ошибка пакетной записи в БД, запись по одной: {e}")
+            return [cls._save_single(record) for record in records]
+
+        for ticket_id, record in zip(ticket_ids, records):
+            log.info(f"💾 Запись сохранена: ticket_id={ticket_id}, email_id={record.get('email_id')}")
+        return ticket_ids
+
+    @classmethod
+    def _save_single(cls, record: Dict) -> Optional[int]:
+        try:
+            ticket_id = cls._save_batch([record])[0]
             log.info(f"💾 Запись сохранена: ticket_id={ticket_id}, email_id={record.get('email_id')}")
-            
             return ticket_id
-            
         except Error as e:
-            log.error(f"❌ Ошибка записи в БД: {e}")
+            log.error(f"❌ Ошибка записи в БД (email_id={record.get('email_id')}): {e}")
+            return None
+
+    @classmethod
+    def _save_batch(cls, records: List[Dict]) -> List[int]:
+        """
+        Одна транзакция: справочники, затем все тикеты через executemany.
+
+        ID новых строк не вычисляются из lastrowid: коннектор склеивает
+        executemany в один многострочный INSERT не всегда (только если запрос
+        совпал с его шаблоном), а InnoDB выдаёт такой вставке ID подряд не при
+        любом innodb_autoinc_lock_mode. ID читаются обратно по email_id в той
+        же транзакции; для одной строки lastrowid точен.
+        """
+        conn = cursor = None
+        try:
+            conn = cls._get_pool().get_connection()
+            cursor = conn.cursor()
+            rows = [cls._ticket_row(cursor, record) for record in records]
+
+            if len(rows) == 1:
+                cursor.execute(cls.TICKET_QUERY, rows[0])
+                ticket_ids = [cursor.lastrowid]
+            else:
+                cursor.executemany(cls.TICKET_QUERY, rows)
+                ticket_ids = cls._inserted_ids(cursor, [row[0] for row in rows])
+            conn.commit()
+            return ticket_ids
+
+        except Error:
             if conn:
                 conn.rollback()
-            return None
-            
+            cls.invalidate_caches()
+            raise
+
         finally:
             if cursor:
                 cursor.close()
             if conn:
                 conn.close()
-    
+
+    @staticmethod
+    def _inserted_ids(cursor, email_ids: List) -> List[Optional[int]]:
+        """
+        ID только что вставленных тикетов в порядке email_ids: для каждого
+        email_id берутся его последние ID (повторно обработанное письмо
+        уже может быть в таблице)
+        """
+        wanted = Counter(email_ids)
+        placeholders = ", ".join(["%s"] * len(wanted))
+        cursor.execute(
+            f"SELECT id, email_id FROM ticket WHERE email_id IN ({placeholders}) ORDER BY id DESC",
+            list(wanted),
+        )
+        found: Dict = {}
+        for ticket_id, email_id in cursor.fetchall():
+            ids = found.setdefault(email_id, [])
+            if len(ids) < wanted[email_id]:
+                ids.append(ticket_id)
+        # Свои ID каждого email_id — по возрастанию, в порядке вставки
+        queues = {email_id: sorted(ids) for email_id, ids in found.items()}
+        return [queues[email_id].pop(0) if queues.get(email_id) else None for email_id in email_ids]
+
+    @classmethod
+    def _ticket_row(cls, cursor, record: Dict) -> Tuple:
+        """Значения строки ticket; недостающие строки справочников создаются"""
+        # 1. Сохранение или получение Facility (объект)
+        facility_id = cls._get_or_create_facility(cursor, record.get('object_name'))
+
+        # 2. Сохранение или получение Contacts (контакты)
+        contact_id = cls._get_or_create_contact(
+            cursor,
+            record.get('fio'),
+            record.get('email'),
+            record.get('phone')
+        )
+
+        # 3. Получение ID sentiment и category из справочников
+        sentiment_id = cls._get_sentiment_id(cursor, record.get('sentiment'))
+        category_id = cls._get_category_id(cursor, record.get('category'))
+
+        # 4. Сохранение газоанализатора (если указан)
+        gas_analyzer_id = None
+        if record.get('device_type') or record.get('serial_numbers'):
+            gas_analyzer_id = cls._get_or_create_gas_analyzer(
+                cursor,
+                record.get('device_type'),
+                record.get('serial_numbers', [])
+            )
+
+        # Извлечение subject из текста письма (первая строка или email_id)
+        subject = cls._extract_subject(record.get('text', '')) or record.get('email_id', '')
+
+        return (
+            record.get('email_id'),
+            subject[:255],  # Ограничение VARCHAR(255)
+            record.get('text'),  # MEDIUMTEXT
+            facility_id,
+            contact_id,
+            sentiment_id,
+            record.get('sentiment_confidence'),
+            category_id,
+            record.get('category_confidence'),
+            gas_analyzer_id,
+            record.get('response_body'),  # MEDIUMTEXT
+            record.get('response_method'),
+            'processed',  # Статус после успешной записи
+            record.get('processed_at') or datetime.now()
+        )
+
+    # =========================================================================
+    # СПРАВОЧНИКИ
+    # =========================================================================
+
+    @classmethod
+    def _dimension(cls, cursor, table: str) -> Dict[str, int]:
+        """Малые справочники целиком: {имя в нижнем регистре: id}"""
+        with cls._cache_lock:
+            expired = time.monotonic() - cls._dimensions_loaded_at > settings.db_cache_ttl
+            if not cls._dimensions or expired:
+                dimensions = {}
+                for name, column in (('Sentiment', 'name'), ('Categories', 'name'), ('Gas_analyzer_type', 'type')):
+                    cursor.execute(f"SELECT id, {column} FROM {name}")
+                    dimensions[name] = {str(value).lower(): row_id for row_id, value in cursor.fetchall()}
+                cls._dimensions = dimensions
+                cls._dimensions_loaded_at = time.monotonic()
+            return cls._dimensions[table]
+
     @classmethod
     def _get_or_create_facility(cls, cursor, name: Optional[str]) -> Optional[int]:
         """Получение или создание записи Facility"""
         if not name:
             return None
-        
-        # Поиск существующего
-        cursor.execute("SELECT id FROM Facility WHERE name = %s", (name,))
-        result = cursor.fetchone()
-        if result:
-            return result[0]
-        
-        # Создание нового
-        try:
-            cursor.execute("INSERT INTO Facility (name) VALUES (%s)", (name,))
-            return cursor.lastrowid
-        except Error:
-            return None  # Игнорируем дубликаты при конкурентной записи
-    
+
+        with cls._cache_lock:
+            facility_id = cls._facilities.get(name)
+        if facility_id is not None:
+            return facility_id
+
+        # Upsert по UNIQUE(name): LAST_INSERT_ID(id) возвращает ID и существующей строки
+        cursor.execute(
+            "INSERT INTO Facility (name) VALUES (%s) ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)",
+            (name,)
+        )
+        facility_id = cursor.lastrowid
+        with cls._cache_lock:
+            cls._facilities.put(name, facility_id)
+        return facility_id
+
     @classmethod
-    def _get_or_create_contact(cls, cursor, full_name: Optional[str], 
+    def _get_or_create_contact(cls, cursor, full_name: Optional[str],
                                email: Optional[str], phone: Optional[str]) -> Optional[int]:
         """Получение или создание записи Contacts"""
         if not full_name and not email:
             return None
-        
-        # Поиск по email (уникальный идентификатор)
+
+        # Поиск по email (уникальный идентификатор), затем по имени + телефону
+        keys = []
+        if email:
+            keys.append(('email', email))
+        if full_name and phone:
+            keys.append(('name_phone', full_name, phone))
+
+        with cls._cache_lock:
+            for key in keys:
+                contact_id = cls._contacts.get(key)
+                if contact_id is not None:
+                    return contact_id
+
+        # В Contacts нет уникального ключа — upsert невозможен, поиск запросом
+        contact_id = None
         if email:
             cursor.execute("SELECT id FROM Contacts WHERE email = %s", (email,))
             result = cursor.fetchone()
             if result:
-                return result[0]
-        
-        # Поиск по имени + телефону
-        if full_name and phone:
+                contact_id = result[0]
+
+        if contact_id is None and full_name and phone:
             cursor.execute(
-                "SELECT id FROM Contacts WHERE full_name = %s AND phone = %s", 
+                "SELECT id FROM Contacts WHERE full_name = %s AND phone = %s",
                 (full_name, phone)
             )
             result = cursor.fetchone()
             if result:
-                return result[0]
-        
+                contact_id = result[0]
+
         # Создание нового
-        try:
+        if contact_id is None:
             cursor.execute(
                 "INSERT INTO Contacts (full_name, email, phone) VALUES (%s, %s, %s)",
                 (full_name or 'Неизвестный', email, phone)
             )
-            return cursor.lastrowid
-        except Error:
-            return None
-    
+            contact_id = cursor.lastrowid
+
+        with cls._cache_lock:
+            for key in keys:
+                cls._contacts.put(key, contact_id)
+        return contact_id
+
     @classmethod
     def _get_sentiment_id(cls, cursor, sentiment: Optional[str]) -> Optional[int]:
         """Получение ID тональности из справочника"""
         if not sentiment:
             return None
-        
+
         sentiment_map = {
             'negative': 1,
-            'neutral': 2, 
+            'neutral': 2,
             'positive': 3
         }
-        
+
         sentiment_key = sentiment.lower() if isinstance(sentiment, str) else None
         if sentiment_key in sentiment_map:
             return sentiment_map[sentiment_key]
-        
-        # Попытка найти в БД
-        cursor.execute("SELECT id FROM Sentiment WHERE name = %s", (sentiment,))
-        result = cursor.fetchone()
-        return result[0] if result else 2  # Default: neutral
-    
+
+        # Поиск в справочнике из БД
+        return cls._dimension(cursor, 'Sentiment').get(str(sentiment).lower(), 2)  # Default: neutral
+
     @classmethod
     def _get_category_id(cls, cursor, category: Optional[str]) -> Optional[int]:
         """Получение ID категории из справочника"""
         if not category:
             return None
-        
+
         category_map = {
             'документация': 1,
             'калибровка': 2,
@@ -220,49 +383,48 @@ class DatabaseWriter:
             'неисправность': 3,
             'гарантия': 3
         }
-        
+
         category_key = category.lower() if isinstance(category, str) else None
         if category_key in category_map:
             return category_map[category_key]
-        
-        # Попытка найти в БД
-        cursor.execute("SELECT id FROM Categories WHERE name = %s", (category,))
-        result = cursor.fetchone()
-        return result[0] if result else 3  # Default: техподдержка
-    
+
+        # Поиск в справочнике из БД
+        return cls._dimension(cursor, 'Categories').get(str(category).lower(), 3)  # Default: техподдержка
+
     @classmethod
-    def _get_or_create_gas_analyzer(cls, cursor, device_type: Optional[str], 
+    def _get_or_create_gas_analyzer(cls, cursor, device_type: Optional[str],
                                     serial_numbers: List[str]) -> Optional[int]:
         """Получение или создание записи Gas_analyzer"""
         # Приоритет: серийный номер > тип устройства
         serial = serial_numbers[0] if serial_numbers else None
-        
-        if serial:
-            cursor.execute("SELECT id FROM Gas_analyzer WHERE serial_number = %s", (serial,))
-            result = cursor.fetchone()
-            if result:
-                return result[0]
-            
-            # Определение type_id по названию устройства
-            type_id = cls._get_gas_analyzer_type_id(cursor, device_type)
-            
-            try:
-                cursor.execute(
-                    "INSERT INTO Gas_analyzer (serial_number, type_id) VALUES (%s, %s)",
-                    (serial, type_id)
-                )
-                return cursor.lastrowid
-            except Error:
-                return None
-        
-        return None
-    
+        if not serial:
+            return None
+
+        with cls._cache_lock:
+            gas_analyzer_id = cls._gas_analyzers.get(serial)
+        if gas_analyzer_id is not None:
+            return gas_analyzer_id
+
+        # Определение type_id по названию устройства
+        type_id = cls._get_gas_analyzer_type_id(cursor, device_type)
+
+        # Upsert по UNIQUE(serial_number); тип существующей записи не меняется
+        cursor.execute(
+            "INSERT INTO Gas_analyzer (serial_number, type_id) VALUES (%s, %s) "
+            "ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)",
+            (serial, type_id)
+        )
+        gas_analyzer_id = cursor.lastrowid
+        with cls._cache_lock:
+            cls._gas_analyzers.put(serial, gas_analyzer_id)
+        return gas_analyzer_id
+
     @classmethod
     def _get_gas_analyzer_type_id(cls, cursor, device_type: Optional[str]) -> Optional[int]:
         """Получение ID типа газоанализатора"""
         if not device_type:
             return None
-        
+
         type_map = {
             'дгс эрис-230': 1,
             'дгс эрис-210': 1,
@@ -272,20 +434,25 @@ class DatabaseWriter:
             'стационарный': 3,
             'переносной': 2
         }
-        
+
         device_lower = str(device_type).lower() if device_type else ''
         for key, type_id in type_map.items():
             if key in device_lower:
                 return type_id
-        
+
+        # Типы, добавленные в справочник БД
+        for key, type_id in cls._dimension(cursor, 'Gas_analyzer_type').items():
+            if key in device_lower:
+                return type_id
+
         return 3  # Default: стационарный
-    
+
     @classmethod
     def _extract_subject(cls, text: str) -> Optional[str]:
         """Извлечение темы из текста письма"""
         if not text:
             return None
-        
+
         # Первая непустая строка как тема
         lines = [line.strip() for line in text.split('\n') if line.strip()]
         if lines:
@@ -293,25 +460,26 @@ class DatabaseWriter:
             # Удаление маркеров формата
             subject = re.sub(r'^[\*\#\-]+\s*', '', subject)
             return subject[:255] if len(subject) > 255 else subject
-        
+
         return None
-    
+
     @classmethod
     def bulk_save(cls, records: List[Dict]) -> Dict[str, int]:
         """
-        Массовое сохранение записей
-        
+        Массовое сохранение записей (пачками по db_batch_size в одной транзакции)
+
         Returns:
             Dict со статистикой: {"saved": N, "failed": M}
         """
         stats = {"saved": 0, "failed": 0}
-        
-        for record in records:
-            ticket_id = cls.save_ticket(record)
-            if ticket_id:
-                stats["saved"] += 1
-            else:
-                stats["failed"] += 1
-        
+
+        batch_size = max(settings.db_batch_size, 1)
+        for start in range(0, len(records), batch_size):
+            for ticket_id in cls.save_tickets(records[start:start + batch_size]):
+                if ticket_id:
+                    stats["saved"] += 1
+                else:
+                    stats["failed"] += 1
+
         log.info(f"📊 Массовая запись: {stats}")
-        return stats
\ No newline at end of file
+        return stats
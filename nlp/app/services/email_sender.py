@@ -3,18 +3,27 @@
 import smtplib
 import ssl
 import os
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.utils import formataddr, formatdate, make_msgid
 from email.header import Header
-from typing import Optional, List
+from typing import Dict, Optional, List, Tuple
 
 from app.core.config import settings
 from app.core.logger import log
 
 
 class EmailSender:
-    """Отправка email с поддержкой SSL/TLS и обработкой самоподписанных сертификатов"""
+    """
+    Отправка email с поддержкой SSL/TLS и обработкой самоподписанных сертификатов.
+
+    Авторизованные SMTP-сессии переиспользуются: после отправки соединение
+    возвращается в пул (до pool_size), перед повторным использованием после
+    простоя проверяется командой NOOP, слишком долго простаивавшее —
+    закрывается. SSL-контекст создаётся один раз. Методы потокобезопасны.
+    """
     
     def __init__(
         self,
@@ -26,7 +35,10 @@ class EmailSender:
         from_name: Optional[str] = None,
         use_tls: bool = True,
         ssl_verify: bool = True,
-        ssl_ca_cert: Optional[str] = None
+        ssl_ca_cert: Optional[str] = None,
+        pool_size: int = 4,
+        noop_after: float = 30.0,
+        max_idle: float = 240.0
     ):
         self.smtp_host = smtp_host
         self.smtp_port = smtp_port
@@ -39,6 +51,15 @@ class EmailSender:
         # Настройки SSL
         self.ssl_verify = ssl_verify  # Проверка сертификата (True = строгая проверка)
         self.ssl_ca_cert = ssl_ca_cert  # Путь к CA-сертификату (опционально)
+        self._ssl_context: Optional[ssl.SSLContext] = None
+        
+        # Пул сессий: (соединение, время последнего использования)
+        self.pool_size = pool_size
+        self.noop_after = noop_after  # Простой, после которого сессия проверяется NOOP
+        self.max_idle = max_idle      # Простой, после которого сессия закрывается без проверки
+        self._idle: List[Tuple[smtplib.SMTP, float]] = []
+        self._pool_lock = threading.Lock()
+        self.connections_opened = 0
     
     def _create_ssl_context(self) -> ssl.SSLContext:
         """Создание SSL-контекста с учётом настроек проверки"""
@@ -57,6 +78,124 @@ class EmailSender:
         
         return context
     
+    @property
+    def ssl_context(self) -> ssl.SSLContext:
+        """SSL-контекст (создаётся один раз)"""
+        if self._ssl_context is None:
+            self._ssl_context = self._create_ssl_context()
+        return self._ssl_context
+    
+    # =========================================================================
+    # ПУЛ СЕССИЙ
+    # =========================================================================
+    
+    def _connect(self) -> smtplib.SMTP:
+        """Новая авторизованная сессия"""
+        log.debug(f"Подключение к SMTP {self.smtp_host}:{self.smtp_port}")
+        server = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=30)
+        try:
+            if self.use_tls:
+                server.starttls(context=self.ssl_context)
+                log.debug("TLS установлен")
+            server.login(self.login, self.password)
+            log.debug("Авторизация успешна")
+        except Exception:
+            self._discard(server)
+            raise
+        self.connections_opened += 1
+        return server
+    
+    @staticmethod
+    def _is_alive(server: smtplib.SMTP) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+    
+    @staticmethod
+    def _discard(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+    
+    def _acquire(self) -> smtplib.SMTP:
+        """Сессия из пула (проверенная после простоя) или новая"""
+        while True:
+            with self._pool_lock:
+                if not self._idle:
+                    break
+                server, last_used = self._idle.pop()
+            idle = time.monotonic() - last_used
+            if idle > self.max_idle:
+                self._discard(server)
+                continue
+            if idle > self.noop_after and not self._is_alive(server):
+                log.debug("SMTP-сессия не отвечает на NOOP, переподключение")
+                self._discard(server)
+                continue
+            return server
+        return self._connect()
+    
+    def _release(self, server: smtplib.SMTP) -> None:
+        """Возврат исправной сессии в пул"""
+        with self._pool_lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append((server, time.monotonic()))
+                return
+        self._discard(server)
+    
+    def close(self) -> None:
+        """Закрытие всех простаивающих сессий"""
+        with self._pool_lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._discard(server)
+    
+    # =========================================================================
+    # ОТПРАВКА
+    # =========================================================================
+    
+    def _build_message(
+        self,
+        to_email: str,
+        subject: str,
+        text: str,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+        html: Optional[str] = None
+    ) -> Tuple[MIMEMultipart, List[str]]:
+        """Сообщение с корректными заголовками и список получателей"""
+        # 1. Создаём сообщение
+        msg = MIMEMultipart('alternative')
+        
+        # 2. КОРРЕКТНЫЕ ЗАГОЛОВКИ (RFC-compliant)
+        msg['From'] = formataddr((str(Header(self.from_name, 'utf-8')), self.from_email))
+        msg['To'] = to_email
+        msg['Subject'] = Header(subject, 'utf-8')
+        msg['Date'] = formatdate(localtime=True)
+        msg['Message-ID'] = make_msgid(domain=self.from_email.split('@')[1])
+        
+        if cc:
+            msg['Cc'] = ', '.join(cc)
+        
+        # 3. Тело письма: plain + HTML версии
+        msg.attach(MIMEText(text, 'plain', 'utf-8'))
+        if html:
+            msg.attach(MIMEText(html, 'html', 'utf-8'))
+        
+        # 4. Список получателей
+        recipients = [to_email]
+        if cc:
+            recipients.extend([c.strip() for c in cc if c.strip()])
+        if bcc:
+            recipients.extend([b.strip() for b in bcc if b.strip()])
+        
+        return msg, recipients
+    
     def send(
         self,
         to_email: str,
@@ -72,62 +211,87 @@ class EmailSender:
         Returns:
             bool: True если отправлено успешно
         """
+        return self.send_many([{
+            'to_email': to_email,
+            'subject': subject,
+            'text': text,
+            'cc': cc,
+            'bcc': bcc,
+            'html': html,
+        }])[0]
+    
+    def send_many(self, messages: List[Dict]) -> List[bool]:
+        """
+        Отправка пачки писем через одну SMTP-сессию
+        
+        Args:
+            messages: словари с аргументами send() (to_email, subject, text, ...)
+        
+        Returns:
+            Список успехов в порядке messages
+        """
+        results = [False] * len(messages)
+        if not messages:
+            return results
+        
         try:
-            # 1. Создаём сообщение
-            msg = MIMEMultipart('alternative')
-            
-            # 2. КОРРЕКТНЫЕ ЗАГОЛОВКИ (RFC-compliant)
-            msg['From'] = formataddr((str(Header(self.from_name, 'utf-8')), self.from_email))
-            msg['To'] = to_email
-            msg['Subject'] = Header(subject, 'utf-8')
-            msg['Date'] = formatdate(localtime=True)
-            msg['Message-ID'] = make_msgid(domain=self.from_email.split('@')[1])
-            
-            if cc:
-                msg['Cc'] = ', '.join(cc)
-            
-            # 3. Тело письма: plain + HTML версии
-            msg.attach(MIMEText(text, 'plain', 'utf-8'))
-            if html:
-                msg.attach(MIMEText(html, 'html', 'utf-8'))
-            
-            # 4. Список получателей
-            recipients = [to_email]
-            if cc:
-                recipients.extend([c.strip() for c in cc if c.strip()])
-            if bcc:
-                recipients.extend([b.strip() for b in bcc if b.strip()])
-            
-            # 5. SSL-контекст и отправка
-            ssl_context = self._create_ssl_context()
-            
-            log.debug(f"Отправка: {self.smtp_host}:{self.smtp_port} → {to_email}")
+            server = self._acquire()
+        except Exception as e:
+            self._log_error(e)
+            return results
+        
+        for i, message in enumerate(messages):
+            try:
+                msg, recipients = self._build_message(**message)
+            except Exception as e:
+                log.error(f"Ошибка формирования письма для {message.get('to_email')}: {e}")
+                continue
             
-            with smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=30) as server:
-                if self.use_tls:
-                    server.starttls(context=ssl_context)
-                    log.debug("TLS установлен")
+            log.debug(f"Отправка: {self.smtp_host}:{self.smtp_port} → {message['to_email']}")
+            for attempt in range(2):
+                try:
+                    server.sendmail(self.from_email, recipients, msg.as_string())
+                    results[i] = True
+                    log.success(f"Письмо отправлено: {message['to_email']} | Тема: {message['subject'][:50]}...")
+                    break
+                except smtplib.SMTPServerDisconnected as e:
+                    error = e
+                except smtplib.SMTPException as e:
+                    # Отказ по конкретному письму — сессия остаётся рабочей
+                    self._log_error(e)
+                    break
+                except OSError as e:
+                    error = e
+                except Exception as e:
+                    self._log_error(e)
+                    break
                 
-                server.login(self.login, self.password)
-                log.debug("Авторизация успешна")
-                
-                server.sendmail(self.from_email, recipients, msg.as_string())
-                log.debug("Письмо отправлено")
-            
-            log.success(f"Письмо отправлено: {to_email} | Тема: {subject[:50]}...")
-            return True
-            
-        except smtplib.SMTPAuthenticationError as e:
+                # Сессия оборвалась — одна повторная попытка в новой сессии
+                self._discard(server)
+                server = None
+                if attempt:
+                    self._log_error(error)
+                    break
+                try:
+                    server = self._connect()
+                except Exception as connect_error:
+                    self._log_error(connect_error)
+                    break
+            if server is None:
+                return results
+        
+        self._release(server)
+        return results
+    
+    @staticmethod
+    def _log_error(e: Exception) -> None:
+        if isinstance(e, smtplib.SMTPAuthenticationError):
             log.error(f"Ошибка аутентификации SMTP: {e}")
-            return False
-        except smtplib.SMTPRecipientsRefused as e:
+        elif isinstance(e, smtplib.SMTPRecipientsRefused):
             log.error(f"Получатель отклонён: {e}")
-            return False
-        except ssl.SSLError as e:
+        elif isinstance(e, ssl.SSLError):
             log.error(f"SSL ошибка: {e}")
             if "self-signed" in str(e).lower():
                 log.warning("Подсказка: установите ssl_verify=False или укажите ssl_ca_cert")
-            return False
-        except Exception as e:
-            log.error(f"Ошибка отправки: {type(e).__name__}: {e}", exc_info=True)
-            return False
\ No newline at end of file
+        else:
+            log.error(f"Ошибка отправки: {type(e).__name__}: {e}")
@@ -0,0 +1,349 @@
+"""
+Долгоживущая IMAP-сессия: IDLE, переподключение с задержкой, пакетные команды по UID
+"""
+
+import imaplib
+import json
+import random
+import re
+import select
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from app.core.logger import log
+from app.services.record_log import write_json_atomic
+
+UID_CHUNK = 500  # UID в одной команде (ограничение длины командной строки)
+
+_FETCH_START_RE = re.compile(rb'^\d+ \(')
+_UID_RE = re.compile(rb'\bUID (\d+)')
+_SIZE_RE = re.compile(rb'\bRFC822\.SIZE (\d+)')
+_SECTION_RE = re.compile(rb'(BODY\[[^\]]*\])(?:<\d+>)? \{\d+\}$')
+
+
+def uid_set(uids: Iterable[int]) -> str:
+    """Компактная запись набора UID: 3,4,5,9 → 3:5,9"""
+    ranges = []
+    for uid in sorted(set(uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+
+def parse_fetch_response(data: list) -> Dict[int, Dict]:
+    """
+    Разбор ответа imaplib на UID FETCH
+
+    Returns:
+        {uid: {'size': int | None, 'BODY[HEADER]': bytes, 'BODY[TEXT]': bytes, ...}}
+    """
+    messages: Dict[int, Dict] = {}
+    current: Optional[Dict] = None
+    for element in data:
+        head = element[0] if isinstance(element, tuple) else element
+        if not isinstance(head, bytes):
+            continue
+        if _FETCH_START_RE.match(head):
+            current = {'uid': None, 'size': None}
+        if current is None:
+            continue
+
+        uid_match = _UID_RE.search(head)
+        if uid_match:
+            current['uid'] = int(uid_match.group(1))
+            messages[current['uid']] = current
+        size_match = _SIZE_RE.search(head)
+        if size_match:
+            current['size'] = int(size_match.group(1))
+        if isinstance(element, tuple):
+            section = _SECTION_RE.search(head)
+            if section:
+                current[section.group(1).decode()] = element[1]
+    return messages
+
+
+class UidWatermark:
+    """
+    Персистентная отметка: UIDVALIDITY папки и последний UID, до которого
+    (включительно) все письма уже прошли обработку
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.uidvalidity: Optional[int] = None
+        self.last_uid = 0
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.uidvalidity = state.get('uidvalidity')
+            self.last_uid = int(state.get('last_uid') or 0)
+            log.info(f"Отметка IMAP: UIDVALIDITY={self.uidvalidity}, последний UID={self.last_uid}")
+        except Exception as e:
+            log.warning(f"Ошибка чтения отметки IMAP, чтение с начала: {e}")
+
+    def save(self) -> None:
+        write_json_atomic(self.path, {'uidvalidity': self.uidvalidity, 'last_uid': self.last_uid})
+
+    def sync(self, uidvalidity: Optional[int]) -> bool:
+        """
+        Сверка UIDVALIDITY папки; при смене UID прежних писем недействительны
+        
+        Returns:
+            True, если отметка сброшена
+        """
+        if uidvalidity is None or uidvalidity == self.uidvalidity:
+            return False
+        if self.uidvalidity is not None:
+            log.warning(f"UIDVALIDITY изменился ({self.uidvalidity} → {uidvalidity}), отметка сброшена")
+        self.uidvalidity = uidvalidity
+        self.last_uid = 0
+        self.save()
+        return True
+
+    def advance(self, uid: int) -> None:
+        if uid > self.last_uid:
+            self.last_uid = uid
+            self.save()
+
+
+class Backoff:
+    """Экспоненциальная задержка с джиттером между попытками переподключения"""
+
+    def __init__(self, initial: float = 1.0, maximum: float = 300.0, factor: float = 2.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        delay = min(self.initial * self.factor ** self.attempts, self.maximum)
+        self.attempts += 1
+        return delay * random.uniform(0.5, 1.0)
+
+    def reset(self) -> None:
+        self.attempts = 0
+
+
+class ImapSession:
+    """
+    Одно IMAP-соединение на всё время работы EmailWorker.
+
+    TLS-рукопожатие, LOGIN и SELECT выполняются только при (пере)подключении;
+    между опросами сессия ждёт почту командой IDLE (RFC 2177) — сервер сам
+    сообщает о новых письмах (* N EXISTS). Если сервер IDLE не поддерживает,
+    ожидание сводится к паузе на poll_interval в той же сессии.
+
+    Методы вызываются из одного потока (стадии fetch), поэтому блокировок нет.
+    """
+
+    READ_SLICE = 1.0  # Сек: как часто во время IDLE проверяется interrupt
+
+    def __init__(self, host: str, port: int, user: str, password: str, folder: str,
+                 timeout: int = 30, idle_enabled: bool = True, max_backoff: float = 300.0):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.folder = folder
+        self.timeout = timeout
+        self.idle_enabled = idle_enabled
+        self.backoff = Backoff(maximum=max_backoff)
+        self.uidvalidity: Optional[int] = None
+        self._imap: Optional[imaplib.IMAP4_SSL] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._imap is not None
+
+    @property
+    def supports_idle(self) -> bool:
+        return self.idle_enabled and self._imap is not None and 'IDLE' in self._imap.capabilities
+
+    def ensure(self) -> imaplib.IMAP4_SSL:
+        """Текущее соединение; при его отсутствии — подключение, вход и выбор папки"""
+        if self._imap is not None:
+            return self._imap
+
+        log.info(f"Подключение к {self.host}:{self.port}...")
+        imap = imaplib.IMAP4_SSL(self.host, self.port, timeout=self.timeout)
+        try:
+            imap.login(self.user, self.password)
+            status, _ = imap.select(self.folder)
+            if status != 'OK':
+                raise imaplib.IMAP4.error(f"Не удалось открыть папку {self.folder}")
+            _, validity = imap.response('UIDVALIDITY')
+            self.uidvalidity = int(validity[0]) if validity and validity[0] else None
+        except Exception:
+            self._shutdown(imap)
+            raise
+        log.success(f"Авторизация успешна, папка: {self.folder}")
+        self._imap = imap
+        return imap
+
+    def reset(self) -> None:
+        """Сброс соединения после ошибки (следующий ensure() подключится заново)"""
+        if self._imap is not None:
+            self._shutdown(self._imap)
+            self._imap = None
+
+    def close(self) -> None:
+        """Штатное закрытие сессии"""
+        if self._imap is None:
+            return
+        try:
+            self._imap.close()
+            self._imap.logout()
+        except Exception as e:
+            log.debug(f"Ошибка закрытия IMAP-сессии: {e}")
+        self._imap = None
+        log.info("IMAP-сессия закрыта")
+
+    @staticmethod
+    def _shutdown(imap: imaplib.IMAP4_SSL) -> None:
+        try:
+            imap.shutdown()
+        except Exception:
+            pass
+
+    # =========================================================================
+    # КОМАНДЫ ПО UID
+    # =========================================================================
+
+    def search_unseen(self, after_uid: int = 0) -> List[int]:
+        """UID непрочитанных писем с UID больше after_uid (по возрастанию)"""
+        imap = self.ensure()
+        criteria = ('UNSEEN', 'UID', f'{after_uid + 1}:*') if after_uid else ('UNSEEN',)
+        status, data = imap.uid('SEARCH', *criteria)
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"UID SEARCH завершился с {status}")
+        # Диапазон N:* всегда включает последнее письмо, даже если его UID < N
+        uids = (int(uid) for uid in (data[0] or b'').split())
+        return sorted(uid for uid in uids if uid > after_uid)
+
+    def fetch(self, uids: Iterable[int], items: str) -> Dict[int, Dict]:
+        """Пакетный UID FETCH (по UID_CHUNK писем на команду)"""
+        imap = self.ensure()
+        uids = sorted(set(uids))
+        messages: Dict[int, Dict] = {}
+        for start in range(0, len(uids), UID_CHUNK):
+            status, data = imap.uid('FETCH', uid_set(uids[start:start + UID_CHUNK]), items)
+            if status != 'OK':
+                raise imaplib.IMAP4.error(f"UID FETCH завершился с {status}")
+            messages.update(parse_fetch_response(data))
+        return messages
+
+    def mark_seen(self, uids: Iterable[int]) -> None:
+        """Пакетная отметка прочитанными одной командой UID STORE"""
+        imap = self.ensure()
+        uids = sorted(set(uids))
+        for start in range(0, len(uids), UID_CHUNK):
+            status, _ = imap.uid('STORE', uid_set(uids[start:start + UID_CHUNK]), '+FLAGS.SILENT', '(\\Seen)')
+            if status != 'OK':
+                raise imaplib.IMAP4.error(f"UID STORE завершился с {status}")
+
+    # =========================================================================
+    # IDLE
+    # =========================================================================
+
+    def idle(self, timeout: float, interrupt: Callable[[], bool] = lambda: False) -> bool:
+        """
+        Ожидание новой почты командой IDLE
+
+        Args:
+            timeout: максимальная длительность IDLE (серверы обрывают IDLE через ~30 мин)
+            interrupt: досрочный выход, если вернула True (например, есть
+                письма, которые нужно отметить прочитанными)
+
+        Returns:
+            True, если сервер сообщил о новых письмах
+        """
+        imap = self.ensure()
+        tag = imap._new_tag()
+        imap.send(tag + b" IDLE\r\n")
+
+        reader = _LineReader(imap.sock)
+        line = reader.readline(self.timeout)
+        if line is None or not line.startswith(b'+'):
+            raise imaplib.IMAP4.abort(f"Сервер не принял IDLE: {line!r}")
+
+        has_new = False
+        deadline = time.monotonic() + timeout
+        while not has_new and not interrupt():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            line = reader.readline(min(remaining, self.READ_SLICE))
+            if line is None:
+                continue
+            if line.startswith(b'* BYE'):
+                raise imaplib.IMAP4.abort(f"Сервер закрыл соединение: {line!r}")
+            if self._announces_new_mail(line):
+                has_new = True
+
+        imap.send(b"DONE\r\n")
+        while True:
+            line = reader.readline(self.timeout)
+            if line is None:
+                raise imaplib.IMAP4.abort("Нет ответа на завершение IDLE")
+            if line.startswith(tag):
+                if not line[len(tag):].lstrip().startswith(b'OK'):
+                    raise imaplib.IMAP4.abort(f"IDLE завершился ошибкой: {line!r}")
+                break
+            if self._announces_new_mail(line):
+                has_new = True
+
+        # Данные, пришедшие в одном recv с тегом, imaplib не увидит (он читает
+        # свой буферизованный файл): непрошеные "* N EXISTS" разбираются здесь,
+        # неполная строка дочитывается, чтобы не сбить разбор следующей команды
+        while reader.buffer:
+            line = reader.readline(self.timeout)
+            if line is None:
+                raise imaplib.IMAP4.abort(f"Неполная строка ответа после IDLE: {reader.buffer!r}")
+            if self._announces_new_mail(line):
+                has_new = True
+        return has_new
+
+    @staticmethod
+    def _announces_new_mail(line: bytes) -> bool:
+        return line.startswith(b'*') and (line.endswith(b'EXISTS') or line.endswith(b'RECENT'))
+
+
+class _LineReader:
+    """
+    Чтение строк ответа напрямую из сокета с таймаутом.
+
+    Буферизованный файл imaplib после таймаута остаётся в неопределённом
+    состоянии, поэтому во время IDLE сокет читается в обход него (перед
+    IDLE буфер пуст — предыдущая команда дочитана до конца).
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b""
+
+    def readline(self, timeout: float) -> Optional[bytes]:
+        deadline = time.monotonic() + timeout
+        while b"\r\n" not in self.buffer:
+            # У SSL-сокета расшифрованные данные могут ждать в самом объекте
+            pending = getattr(self.sock, 'pending', lambda: 0)()
+            if not pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                ready, _, _ = select.select([self.sock], [], [], remaining)
+                if not ready:
+                    return None
+            chunk = self.sock.recv(max(pending, 4096))
+            if not chunk:
+                raise imaplib.IMAP4.abort("Соединение закрыто сервером")
+            self.buffer += chunk
+        line, self.buffer = self.buffer.split(b"\r\n", 1)
+        return line
@@ -0,0 +1,197 @@
+"""
+Пул процессов инференса: масштабирование конвейера писем на несколько ядер
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from app.core.logger import log
+
+# Модели, которые держит каждый процесс пула
+WORKER_MODELS = ("sentiment", "classifier", "response_generator")
+STARTUP_TIMEOUT = 600  # Сек на загрузку моделей во всех процессах
+
+
+class InferencePoolError(RuntimeError):
+    """Пул инференса недоступен: процесс упал, и перезапуск не помог"""
+
+
+def predict_batch(sentiment, classifier, texts: List[str], subjects: List[str]) -> Tuple[List[dict], List[dict]]:
+    """
+    Пакетные тональность и классификация; при сбое пакетного вызова —
+    по одному письму
+    """
+    try:
+        sentiments = sentiment.predict_batch(texts)
+    except Exception as e:
+        log.warning(f"Пакетная тональность недоступна, анализ по одному письму: {e}")
+        sentiments = [sentiment.predict(text) for text in texts]
+    try:
+        categories = classifier.predict_batch(texts, subjects)
+    except Exception as e:
+        log.warning(f"Пакетная классификация недоступна, анализ по одному письму: {e}")
+        categories = [classifier.predict(text, subject) for text, subject in zip(texts, subjects)]
+    return sentiments, categories
+
+
+# =============================================================================
+# ФУНКЦИИ ДОЧЕРНЕГО ПРОЦЕССА
+# =============================================================================
+
+def _init_worker(threads: int, models: Tuple[str, ...], barrier) -> None:
+    """Ограничение потоков torch и загрузка моделей при старте процесса"""
+    # До первого импорта torch: потоки OpenMP/MKL на процесс
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+
+    from app.models.registry import registry
+    registry.load_all(models)
+    log.info(f"Процесс инференса {os.getpid()}: {threads} потоков, модели {', '.join(models)}")
+
+    # Задачи начинают приниматься, когда модели загружены во всех процессах
+    try:
+        barrier.wait(timeout=STARTUP_TIMEOUT)
+    except threading.BrokenBarrierError:
+        log.warning(f"Процесс инференса {os.getpid()}: не все процессы пула загрузились вовремя")
+
+
+def _worker_pid() -> int:
+    return os.getpid()
+
+
+def _infer(texts: List[str], subjects: List[str]) -> Tuple[List[dict], List[dict]]:
+    from app.models.registry import registry
+    return predict_batch(registry.get("sentiment"), registry.get("classifier"), texts, subjects)
+
+
+def _generate_batch(records: List[dict]) -> List[dict]:
+    from app.models.registry import registry
+    return registry.get("response_generator").generate_batch(records)
+
+
+# =============================================================================
+# КООРДИНАТОР
+# =============================================================================
+
+class InferencePool:
+    """
+    Пул процессов, каждый со своими SentimentAnalyzer, Classifier и
+    ResponseGenerator.
+
+    Процессы запускаются через spawn (fork после инициализации torch
+    небезопасен), число потоков torch в каждом — cpu_count // workers,
+    чтобы процессы не конкурировали за ядра. Вызовы infer()/generate_batch()
+    блокирующие и потокобезопасны: стадии конвейера вызывают их из
+    нескольких потоков, и задания распределяются по свободным процессам.
+    Учёт processed_ids остаётся в родительском процессе.
+
+    Если процесс пула завершился аварийно (например, убит OOM killer),
+    весь ProcessPoolExecutor становится непригодным: пул перезапускается,
+    и вызов повторяется один раз. Не помогло — InferencePoolError.
+    """
+
+    def __init__(self, workers: int, threads_per_worker: int = 0, models: Tuple[str, ...] = WORKER_MODELS):
+        self.workers = max(workers, 1)
+        self.threads = threads_per_worker or max((os.cpu_count() or 1) // self.workers, 1)
+        self.models = models
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._restart_lock = threading.Lock()
+        self._restarts = 0
+        self._calls: Counter = Counter()
+        self._items: Counter = Counter()
+        self._busy_seconds: Counter = Counter()
+
+    def start(self) -> None:
+        """Запуск процессов и ожидание загрузки моделей во всех"""
+        log.info(f"Запуск пула инференса: {self.workers} процессов × {self.threads} потоков...")
+        started = time.perf_counter()
+        context = multiprocessing.get_context("spawn")
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.threads, self.models, context.Barrier(self.workers)),
+        )
+        # Пока ни один процесс не свободен, каждая задача запускает новый;
+        # ответ приходит только после загрузки моделей во всех процессах
+        futures = [self._executor.submit(_worker_pid) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+        log.success(f"Пул инференса готов за {time.perf_counter() - started:.1f} сек")
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            log.info("Пул инференса остановлен")
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        """Перезапуск упавшего пула; вызвавшие одновременно потоки перезапускают его один раз"""
+        with self._restart_lock:
+            if self._executor is not broken:
+                return
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            with self._lock:
+                self._restarts += 1
+            try:
+                self.start()
+            except Exception as e:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = None
+                raise InferencePoolError(f"Не удалось перезапустить пул инференса: {e}") from e
+
+    def _call(self, name: str, func, *args, items: int = 1):
+        started = time.perf_counter()
+        try:
+            # Вторая попытка — в перезапущенном пуле
+            for attempt in range(2):
+                executor = self._executor
+                if executor is None:
+                    raise InferencePoolError("Пул инференса не запущен")
+                try:
+                    return executor.submit(func, *args).result()
+                except BrokenProcessPool as e:
+                    if attempt:
+                        raise InferencePoolError(f"Пул инференса упал и после перезапуска: {e}") from e
+                    log.error(f"❌ Процесс пула инференса завершился аварийно ({e}), перезапуск пула")
+                    self._restart(executor)
+        finally:
+            with self._lock:
+                self._calls[name] += 1
+                self._items[name] += items
+                self._busy_seconds[name] += time.perf_counter() - started
+
+    def infer(self, texts: List[str], subjects: List[str]) -> Tuple[List[dict], List[dict]]:
+        """Тональность и классификация пачки писем в одном из процессов"""
+        return self._call("infer", _infer, texts, subjects, items=len(texts))
+
+    def generate_batch(self, records: List[dict]) -> List[dict]:
+        """Пакетная генерация ответов в одном из процессов"""
+        return self._call("generate", _generate_batch, records, items=len(records))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'threads_per_worker': self.threads,
+                'restarts': self._restarts,
+                'calls': dict(self._calls),
+                'items': dict(self._items),
+                'busy_seconds': {name: round(value, 3) for name, value in self._busy_seconds.items()},
+            }
@@ -0,0 +1,190 @@
+"""
+Многошаблонный поиск ключевых фраз (автомат Ахо–Корасик)
+"""
+
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Tuple
+
+from app.core.logger import log
+
+
+class KeywordMatch(NamedTuple):
+    """Вхождение ключевой фразы в текст"""
+    label: str
+    phrase: str
+    start: int
+    end: int
+
+
+class _Automaton(NamedTuple):
+    delta: List[Dict[str, int]]          # Переходы с уже учтёнными fail-ссылками (ДКА)
+    outputs: List[Tuple[int, ...]]       # Номера шаблонов, заканчивающихся в состоянии
+    patterns: List[Tuple[str, str, int]] # (метка, фраза, длина) по номеру шаблона
+
+
+class KeywordMatcher:
+    """
+    Автомат Ахо–Корасик по словарю {метка: [фразы]}.
+
+    Строится один раз, находит все вхождения всех фраз за один проход по
+    тексту — стоимость не зависит от размера словаря. Словарь можно
+    перезагрузить на лету через reload(): новый автомат подменяется
+    атомарно, параллельные поиски дорабатывают на старом.
+
+    При word_boundaries=True вхождение засчитывается, только если рядом с
+    буквенно-цифровыми краями фразы нет букв/цифр (чтобы «230» не находилось
+    внутри телефонного номера).
+    """
+
+    def __init__(self, patterns: Mapping[str, Iterable[str]], normalize: Callable[[str], str] = str.lower,
+                 word_boundaries: bool = False):
+        self.normalize = normalize
+        self.word_boundaries = word_boundaries
+        self._reload_lock = threading.Lock()
+        self._automaton = self._build(patterns)
+
+    def _build(self, patterns: Mapping[str, Iterable[str]]) -> _Automaton:
+        goto: List[Dict[str, int]] = [{}]
+        terminal: List[List[int]] = [[]]
+        entries: List[Tuple[str, str, int]] = []
+
+        for label, phrases in patterns.items():
+            for phrase in phrases:
+                key = self.normalize(phrase)
+                if not key:
+                    continue
+                state = 0
+                for ch in key:
+                    nxt = goto[state].get(ch)
+                    if nxt is None:
+                        nxt = len(goto)
+                        goto[state][ch] = nxt
+                        goto.append({})
+                        terminal.append([])
+                    state = nxt
+                terminal[state].append(len(entries))
+                entries.append((label, phrase, len(key)))
+
+        # BFS: fail-ссылки, объединение выходов и достройка переходов до ДКА
+        fail = [0] * len(goto)
+        outputs: List[Tuple[int, ...]] = [()] * len(goto)
+        delta: List[Dict[str, int]] = [dict(edges) for edges in goto]
+        outputs[0] = tuple(terminal[0])
+        queue = deque()
+        for ch, nxt in goto[0].items():
+            queue.append(nxt)
+        while queue:
+            state = queue.popleft()
+            outputs[state] = tuple(terminal[state]) + outputs[fail[state]]
+            for ch, fallback in delta[fail[state]].items():
+                delta[state].setdefault(ch, fallback)
+            for ch, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state]].get(ch, 0) if state else 0
+                queue.append(nxt)
+
+        log.debug(f"Автомат ключевых фраз: {len(entries)} фраз, {len(goto)} состояний")
+        return _Automaton(delta, outputs, entries)
+
+    def reload(self, patterns: Mapping[str, Iterable[str]]) -> None:
+        """Перестроение автомата под новый словарь"""
+        automaton = self._build(patterns)
+        with self._reload_lock:
+            self._automaton = automaton
+        log.info(f"Словарь ключевых фраз перезагружен: {len(automaton.patterns)} фраз")
+
+    # =========================================================================
+    # ПОИСК
+    # =========================================================================
+
+    def iter_matches(self, text: str) -> Iterator[KeywordMatch]:
+        """Все вхождения (в том числе перекрывающиеся) за один проход"""
+        automaton = self._automaton
+        delta, outputs, patterns = automaton.delta, automaton.outputs, automaton.patterns
+        normalized = self.normalize(text)
+        state = 0
+        for i, ch in enumerate(normalized):
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                for index in outputs[state]:
+                    label, phrase, length = patterns[index]
+                    start, end = i + 1 - length, i + 1
+                    if self.word_boundaries and not self._on_boundaries(normalized, start, end):
+                        continue
+                    yield KeywordMatch(label, phrase, start, end)
+
+    @staticmethod
+    def _on_boundaries(text: str, start: int, end: int) -> bool:
+        if text[start].isalnum() and start > 0 and text[start - 1].isalnum():
+            return False
+        if text[end - 1].isalnum() and end < len(text) and text[end].isalnum():
+            return False
+        return True
+
+    def find_all(self, text: str) -> List[KeywordMatch]:
+        return list(self.iter_matches(text))
+
+    @staticmethod
+    def longest(matches: Iterable[KeywordMatch]) -> List[KeywordMatch]:
+        """
+        Непересекающиеся вхождения по правилу leftmost-longest: из
+        начинающихся раньше — самое длинное, вложенные и пересекающиеся
+        с уже выбранным отбрасываются
+        """
+        selected: List[KeywordMatch] = []
+        for match in sorted(matches, key=lambda m: (m.start, m.start - m.end)):
+            if not selected or match.start >= selected[-1].end:
+                selected.append(match)
+        return selected
+
+    def matches_by_label(self, text: str) -> Dict[str, List[KeywordMatch]]:
+        """Вхождения, сгруппированные по метке"""
+        grouped: Dict[str, List[KeywordMatch]] = {}
+        for match in self.iter_matches(text):
+            grouped.setdefault(match.label, []).append(match)
+        return grouped
+
+    @staticmethod
+    def _distinct(matches: Iterable[KeywordMatch]) -> Dict[str, set]:
+        distinct: Dict[str, set] = {}
+        for match in matches:
+            distinct.setdefault(match.label, set()).add(match.phrase)
+        return distinct
+
+    def count_by_label(self, text: str) -> Dict[str, int]:
+        """
+        Число различных фраз каждой метки, встретившихся в тексте
+        (то же, что sum(1 for word in words if word in text))
+        """
+        if self.word_boundaries:
+            counts: Dict[str, int] = {}
+            for label, phrases in self._distinct(self.iter_matches(text)).items():
+                counts[label] = len(phrases)
+            return counts
+
+        automaton = self._automaton
+        delta, outputs = automaton.delta, automaton.outputs
+        state = 0
+        seen = set()
+        for ch in self.normalize(text):
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                seen.update(outputs[state])
+        counts: Dict[str, int] = {}
+        for index in seen:
+            label = automaton.patterns[index][0]
+            counts[label] = counts.get(label, 0) + 1
+        return counts
+
+    def contains(self, text: str) -> bool:
+        """Есть ли в тексте хотя бы одна фраза"""
+        if self.word_boundaries:
+            return next(self.iter_matches(text), None) is not None
+
+        delta, outputs = self._automaton.delta, self._automaton.outputs
+        state = 0
+        for ch in self.normalize(text):
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                return True
+        return False
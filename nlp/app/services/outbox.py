@@ -0,0 +1,273 @@
+"""
+Очередь исходящих писем на диске с фоновой отправкой
+
+Раскладка (на примере data/outbox):
+    pending/<id>.json — письма, ожидающие отправки (вместе с числом попыток)
+    dead/<id>.json    — письма, исчерпавшие попытки (dead letter)
+"""
+
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.core.logger import log
+from app.services.email_sender import EmailSender
+from app.services.record_log import write_json_atomic
+
+
+class TokenBucket:
+    """Ограничение частоты: rate_per_minute писем, всплеск до burst"""
+
+    def __init__(self, rate_per_minute: float, burst: Optional[int] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(int(rate_per_minute), 1))
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, wanted: int) -> int:
+        """Сколько из wanted писем можно отправить прямо сейчас"""
+        self._refill()
+        granted = min(wanted, int(self.tokens))
+        self.tokens -= granted
+        return granted
+
+    def wait_time(self) -> float:
+        """Сек до появления следующего токена"""
+        self._refill()
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Outbox:
+    """
+    Исходящие ответы сначала сохраняются на диск (enqueue — запись одного
+    файла с fsync), а отправляет их фоновый поток пачками через
+    EmailSender.send_many. Медленный или недоступный SMTP больше не
+    тормозит обработку писем, а неотправленные ответы переживают перезапуск.
+
+    Неудачная отправка откладывается с экспоненциальной задержкой
+    (backoff_base · 2^(попытка-1), не больше backoff_max, с джиттером);
+    после max_attempts письмо уходит в dead/. Частота отправки ограничена
+    для каждого SMTP-провайдера (хоста) отдельно.
+
+    Гарантия — «хотя бы один раз»: сбой между отправкой и удалением файла
+    приведёт к повторной отправке после перезапуска.
+    """
+
+    WAIT_SLICE = 5.0  # Сек: наибольшая пауза фонового потока без новых писем
+
+    def __init__(self, directory: Path, sender: EmailSender, max_attempts: int = 8,
+                 backoff_base: float = 30.0, backoff_max: float = 3600.0,
+                 rate_per_minute: float = 20.0, batch_size: int = 10):
+        self.directory = Path(directory)
+        self.pending_dir = self.directory / "pending"
+        self.dead_dir = self.directory / "dead"
+        self.sender = sender
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_per_minute = rate_per_minute
+        self.batch_size = batch_size
+
+        self.pending_dir.mkdir(parents=True, exist_ok=True)
+        self.dead_dir.mkdir(parents=True, exist_ok=True)
+
+        self._items: Dict[str, dict] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Метрики
+        self.sent = 0
+        self.failed_attempts = 0
+        self.dead_lettered = len(os.listdir(self.dead_dir))
+        self._latencies_ms = deque(maxlen=200)
+
+        self._load()
+
+    @property
+    def provider(self) -> str:
+        return self.sender.smtp_host
+
+    def _load(self) -> None:
+        for name in sorted(os.listdir(self.pending_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(self.pending_dir / name, 'r', encoding='utf-8') as f:
+                    item = json.load(f)
+                self._items[item['id']] = item
+            except Exception as e:
+                log.warning(f"Пропущен повреждённый файл очереди {name}: {e}")
+        if self._items:
+            log.info(f"В очереди исходящих {len(self._items)} неотправленных писем")
+
+    # =========================================================================
+    # ПОСТАНОВКА
+    # =========================================================================
+
+    def enqueue(self, to_email: str, subject: str, text: str, email_id: Optional[str] = None) -> str:
+        """Сохранение письма в очередь (возвращается после fsync)"""
+        item_id = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        item = {
+            'id': item_id,
+            'provider': self.provider,
+            'to_email': to_email,
+            'subject': subject,
+            'text': text,
+            'email_id': email_id,
+            'created_at': time.time(),
+            'attempts': 0,
+            'next_attempt_at': 0.0,
+            'last_error': None,
+        }
+        write_json_atomic(self.pending_dir / f"{item_id}.json", item)
+        with self._lock:
+            self._items[item_id] = item
+        self._wake.set()
+        return item_id
+
+    # =========================================================================
+    # ФОНОВАЯ ОТПРАВКА
+    # =========================================================================
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-sender", daemon=True)
+        self._thread.start()
+        log.info(f"Очередь исходящих запущена ({self.rate_per_minute:g} писем/мин на провайдера)")
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Остановка фонового потока; неотправленное остаётся на диске"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._thread = None
+        log.info(f"Очередь исходящих остановлена, не отправлено: {self.depth}")
+
+    def _bucket(self, provider: str) -> TokenBucket:
+        bucket = self._buckets.get(provider)
+        if bucket is None:
+            bucket = self._buckets[provider] = TokenBucket(self.rate_per_minute)
+        return bucket
+
+    def _due(self) -> tuple:
+        """Готовые к отправке письма (старые первыми) и время до ближайшего отложенного"""
+        now = time.time()
+        with self._lock:
+            items = sorted(self._items.values(), key=lambda i: i['id'])
+        due = [item for item in items if item['next_attempt_at'] <= now]
+        later = [item['next_attempt_at'] - now for item in items if item['next_attempt_at'] > now]
+        return due, min(later, default=self.WAIT_SLICE)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                due, wait = self._due()
+                if due:
+                    provider = due[0]['provider']
+                    batch = [item for item in due if item['provider'] == provider][:self.batch_size]
+                    bucket = self._bucket(provider)
+                    granted = bucket.take(len(batch))
+                    if granted:
+                        self._send(batch[:granted])
+                        continue
+                    wait = bucket.wait_time()
+                self._wake.wait(min(max(wait, 0.05), self.WAIT_SLICE))
+                self._wake.clear()
+            except Exception as e:
+                log.error(f"Ошибка очереди исходящих: {e}")
+                self._stop.wait(self.WAIT_SLICE)
+
+    def _send(self, batch: List[dict]) -> None:
+        started = time.perf_counter()
+        results = self.sender.send_many([
+            {'to_email': item['to_email'], 'subject': item['subject'], 'text': item['text']}
+            for item in batch
+        ])
+        per_message_ms = (time.perf_counter() - started) * 1000 / len(batch)
+
+        for item, success in zip(batch, results):
+            if success:
+                self._latencies_ms.append(per_message_ms)
+                self.sent += 1
+                self._remove(item)
+                log.info(f"Ответ на письмо #{item['email_id']} отправлен")
+            else:
+                self.failed_attempts += 1
+                self._reschedule(item)
+
+    def _remove(self, item: dict) -> None:
+        with self._lock:
+            self._items.pop(item['id'], None)
+        try:
+            (self.pending_dir / f"{item['id']}.json").unlink()
+        except FileNotFoundError:
+            pass
+
+    def _reschedule(self, item: dict) -> None:
+        item['attempts'] += 1
+        item['last_error'] = f"Попытка {item['attempts']} не удалась"
+        path = self.pending_dir / f"{item['id']}.json"
+
+        if item['attempts'] >= self.max_attempts:
+            write_json_atomic(self.dead_dir / f"{item['id']}.json", item)
+            self._remove(item)
+            self.dead_lettered += 1
+            log.error(
+                f"Ответ на письмо #{item['email_id']} ({item['to_email']}) не отправлен "
+                f"за {item['attempts']} попыток — перемещён в {self.dead_dir}"
+            )
+            return
+
+        delay = min(self.backoff_base * 2 ** (item['attempts'] - 1), self.backoff_max)
+        item['next_attempt_at'] = time.time() + delay * random.uniform(0.8, 1.2)
+        write_json_atomic(path, item)
+        log.warning(
+            f"Ответ на письмо #{item['email_id']} не отправлен (попытка {item['attempts']}), "
+            f"повтор через {delay:.0f} сек"
+        )
+
+    # =========================================================================
+    # МЕТРИКИ
+    # =========================================================================
+
+    @property
+    def depth(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            created = [item['created_at'] for item in self._items.values()]
+            depth = len(created)
+        latencies = sorted(self._latencies_ms)
+        return {
+            'depth': depth,
+            'oldest_seconds': round(time.time() - min(created), 1) if created else None,
+            'sent': self.sent,
+            'failed_attempts': self.failed_attempts,
+            'dead_lettered': self.dead_lettered,
+            'send_latency_ms': {
+                'avg': round(sum(latencies) / len(latencies), 1),
+                'p95': round(latencies[max(int(len(latencies) * 0.95) - 1, 0)], 1),
+            } if latencies else None,
+        }
@@ -1,16 +1,185 @@
 import re
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, NamedTuple, Optional, Tuple
 from app.core.logger import log
 
 from app.models.base.products import (
-    ERIS_PRODUCTS, 
     ALL_PRODUCTS, 
+    PRODUCT_CATEGORY,
     PRODUCT_SYNONYMS,
     SERIAL_NUMBER_PATTERNS
 )
+from app.services.keyword_matcher import KeywordMatcher
+
+# =============================================================================
+# БАНК РЕГУЛЯРНЫХ ВЫРАЖЕНИЙ (компилируется один раз при импорте)
+# =============================================================================
+
+SPAN_SERIAL = "serial"
+SPAN_PHONE = "phone"
+SPAN_EMAIL = "email"
+SPAN_FIO = "fio"
+SPAN_ORGANIZATION = "organization"
+
+
+class Span(NamedTuple):
+    """Типизированный фрагмент письма"""
+    kind: str
+    value: str
+    start: int
+    end: int
+
+
+# Шаблоны серийных номеров в порядке приоритета (первый найденный номер
+# уходит в БД, поэтому порядок шаблонов сохраняется)
+SERIAL_RES = tuple(re.compile(pattern, re.IGNORECASE) for pattern in SERIAL_NUMBER_PATTERNS)
+SERIAL_CLEAN_RE = re.compile(r'[^0-9a-fA-F]')
+
+# Российские телефоны. Опережающая проверка отсекает позиции, с которых
+# номер начаться не может (всё до первой цифры в шаблоне необязательно),
+# и не меняет результата
+PHONE_RE = re.compile(r"""
+    (?=[\s\-+(]{0,2}\d) # Не дальше двух символов до первой цифры
+    (?:\+7|7|8)?      # Код страны
+    [\s\-]?           # Разделитель
+    (?:\(?\d{3}\)?)   # Код города в скобках или без
+    [\s\-]?           # Разделитель
+    \d{3}             # Первые 3 цифры
+    [\s\-]?           # Разделитель
+    \d{2}             # Следующие 2 цифры
+    [\s\-]?           # Разделитель
+    \d{2}             # Последние 2 цифры
+""", re.VERBOSE)
+
+EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+
+# ФИО (формат: ФИО: ... или в начале письма)
+FIO_RE = re.compile(r"""
+    (?:ФИО|От[:\s]|Фамилия[:\s])?   # Префикс
+    \s*
+    ([А-ЯЁ][а-яё]+                  # Фамилия
+    \s+[А-ЯЁ][а-яё]+                # Имя
+    \s+[А-ЯЁ][а-яё]+)               # Отчество
+""", re.IGNORECASE | re.VERBOSE)
+
+# Организации: шаблоны по убыванию приоритета
+ORGANIZATION_RES = (
+    re.compile(r'(?:ООО|АО|ЗАО|ПАО|ИП)\s*["«]?([А-ЯЁ][а-яё\-\s]+)["»"]?', re.IGNORECASE),
+    re.compile(r'(?:предприятие|объект|организация|компания)[:\s]+([А-ЯЁ][а-яё\-\s]+)', re.IGNORECASE),
+)
+
+# Цифры, «приклеенные» к числовому синониму модели: 8-912-230-41-55, (415) 12 34
+NUMBER_LEFT_RE = re.compile(r'(?:\d[-().]|\d\s)$')
+NUMBER_RIGHT_RE = re.compile(r'^(?:[-().]\d|\s\d)')
+# Дефис или скобка вплотную к цифрам с одной стороны — телефон
+PHONE_LEFT_RE = re.compile(r'\d[-()]$')
+PHONE_RIGHT_RE = re.compile(r'^[-()]\d')
+
+
+class SpanExtractor:
+    """
+    Извлечение серийных номеров, телефонов, email, ФИО и организации.
+
+    Все выражения скомпилированы при импорте; каждый шаблон проходит текст
+    один раз. Типы сканируются независимо, потому что их фрагменты законно
+    перекрываются (телефон 89122304155 — ещё и «8+ цифр подряд»).
+    Повторы отбрасываются через множества.
+    """
+
+    def serial_numbers(self, text: str) -> List[Span]:
+        if not text:
+            return []
+        found = []
+        for pattern in SERIAL_RES:
+            for match in pattern.finditer(text):
+                # Очистка номера от лишних символов
+                number = SERIAL_CLEAN_RE.sub('', match.group())
+                if number:
+                    found.append(Span(SPAN_SERIAL, number, match.start(), match.end()))
+        return self._unique(found)
+
+    def phones(self, text: str) -> List[Span]:
+        if not text:
+            return []
+        spans = []
+        for match in PHONE_RE.finditer(text):
+            raw = match.group()
+            value = raw.strip()
+            if value:
+                offset = len(raw) - len(raw.lstrip())
+                spans.append(Span(SPAN_PHONE, value, match.start() + offset, match.start() + offset + len(value)))
+        return self._unique(spans)
+
+    def emails(self, text: str) -> List[Span]:
+        if not text or '@' not in text:
+            return []
+        return self._unique(Span(SPAN_EMAIL, m.group(), m.start(), m.end()) for m in EMAIL_RE.finditer(text))
+
+    def fio(self, text: str) -> Optional[Span]:
+        match = FIO_RE.search(text) if text else None
+        if not match:
+            return None
+        return self._stripped_group(SPAN_FIO, match)
+
+    def object_name(self, text: str) -> Optional[Span]:
+        if not text:
+            return None
+        for pattern in ORGANIZATION_RES:
+            match = pattern.search(text)
+            if match:
+                return self._stripped_group(SPAN_ORGANIZATION, match)
+        return None
+
+    def extract(self, text: str) -> List[Span]:
+        """Все фрагменты письма: серийные номера, телефоны, email, ФИО, организация"""
+        spans = self.serial_numbers(text) + self.phones(text) + self.emails(text)
+        for single in (self.fio(text), self.object_name(text)):
+            if single is not None:
+                spans.append(single)
+        return spans
+
+    @staticmethod
+    def _stripped_group(kind: str, match: re.Match) -> Span:
+        raw = match.group(1)
+        value = raw.strip()
+        start = match.start(1) + len(raw) - len(raw.lstrip())
+        return Span(kind, value, start, start + len(value))
+
+    @staticmethod
+    def _unique(spans) -> List[Span]:
+        seen = set()
+        unique = []
+        for span in spans:
+            if span.value not in seen:
+                seen.add(span.value)
+                unique.append(span)
+        return unique
+
+
+EXTRACTOR = SpanExtractor()
+
+
+def _build_device_matcher() -> tuple:
+    """
+    Автомат по всем названиям и синонимам моделей (метка — каноническая модель)
+    и порядок моделей в каталоге для сохранения прежней сортировки результата
+    """
+    patterns = {}
+    for model in ALL_PRODUCTS:
+        patterns.setdefault(model, {})[model] = None
+    for model, synonyms in PRODUCT_SYNONYMS.items():
+        for synonym in synonyms:
+            patterns.setdefault(model, {})[synonym] = None
+
+    order = {}
+    for model in list(ALL_PRODUCTS) + list(PRODUCT_SYNONYMS):
+        order.setdefault(model, len(order))
+
+    return KeywordMatcher(patterns, normalize=str.upper, word_boundaries=True), order
 
 
 class Parser:
+    DEVICE_MATCHER, CATALOGUE_ORDER = _build_device_matcher()
+
     def __init__(self):
         log.info("Parser инициализирован")
         log.success(f"Загружено {len(ALL_PRODUCTS)} моделей")
@@ -20,44 +189,74 @@ class Parser:
         Поиск моделей приборов в тексте
         
         Returns:
-            Список найденных моделей с категорией
+            Список найденных моделей с категорией и упоминаниями
+            (позиции в строке "тема + пробел + текст", без вложенных)
         """
         if not text:
             return []
         
-        combined = (subject + " " + text).upper()
-        found_models = []
-        
-        for model in ALL_PRODUCTS:
-            if model.upper() in combined:
-                category = self._get_category(model)
-                found_models.append({
-                    'model': model,
-                    'category': category,
-                    'method': 'exact'
-                })
-                log.debug(f"Найдена модель: {model} ({category})")
-        
-        for model, synonyms in PRODUCT_SYNONYMS.items():
-            for synonym in synonyms:
-                if synonym.upper() in combined:
-                    if not any(m['model'] == model for m in found_models):
-                        category = self._get_category(model)
-                        found_models.append({
-                            'model': model,
-                            'category': category,
-                            'method': 'synonym'
-                        })
-                        log.debug(f"Найдена модель по синониму: {model} ({synonym})")
+        combined = subject + " " + text
+        found: Dict[str, Dict] = {}
+        
+        # Один проход автомата по тексту: все упоминания всех моделей и синонимов.
+        # Из вложенных совпадений ("ДГС ЭРИС-230" ⊃ "ЭРИС-230" ⊃ "230") — самое длинное
+        matches = self.DEVICE_MATCHER.longest(
+            match for match in self.DEVICE_MATCHER.iter_matches(combined)
+            if not (match.phrase.isdigit() and self._is_inside_number(combined, match.start, match.end))
+        )
+        for match in matches:
+            entry = found.get(match.label)
+            if entry is None:
+                entry = found[match.label] = {
+                    'model': match.label,
+                    'category': self._get_category(match.label),
+                    'method': 'synonym',
+                    'mentions': [],
+                }
+            if match.phrase == match.label:
+                entry['method'] = 'exact'
+            entry['mentions'].append({
+                'text': combined[match.start:match.end],
+                'start': match.start,
+                'end': match.end,
+            })
+        
+        # Сначала точные совпадения, затем синонимы — в порядке каталога
+        found_models = sorted(
+            found.values(),
+            key=lambda m: (m['method'] != 'exact', self.CATALOGUE_ORDER[m['model']])
+        )
+        for m in found_models:
+            log.debug(f"Найдена модель: {m['model']} ({m['category']}, {m['method']})")
         
         return found_models
     
+    def _is_inside_number(self, text: str, start: int, end: int) -> bool:
+        """Числовой синоним (230, 415) — часть телефона или другого номера"""
+        left = text[max(start - 2, 0):start]
+        right = text[end:end + 2]
+        glued_left = bool(NUMBER_LEFT_RE.search(left))
+        glued_right = bool(NUMBER_RIGHT_RE.match(right))
+        if glued_left and glued_right:
+            return True
+        # Код города в скобках или дефис/скобка вплотную к цифрам — телефон
+        if left.endswith('(') and right.startswith(')'):
+            return True
+        return bool(PHONE_LEFT_RE.search(left) or PHONE_RIGHT_RE.match(right))
+    
     def _get_category(self, model: str) -> str:
         """Определение категории модели"""
-        for category, products in ERIS_PRODUCTS.items():
-            if model in products:
-                return category
-        return "other"
+        return PRODUCT_CATEGORY.get(model, "other")
+    
+    def extract_spans(self, text: str) -> List[Span]:
+        """
+        Все типизированные фрагменты письма с позициями
+        (серийные номера, телефоны, email, ФИО, организация)
+
+        Returns:
+            Список Span, упорядоченный по типу и позиции
+        """
+        return EXTRACTOR.extract(text)
     
     def find_serial_numbers(self, text: str) -> List[str]:
         """
@@ -66,21 +265,10 @@ class Parser:
         Returns:
             Список найденных номеров
         """
-        if not text:
-            return []
-        
-        found_numbers = []
-        
-        for pattern in SERIAL_NUMBER_PATTERNS:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for match in matches:
-                # Очистка номера от лишних символов
-                number = re.sub(r'[^0-9a-fA-F]', '', match)
-                if number and number not in found_numbers:
-                    found_numbers.append(number)
-                    log.debug(f"Найден серийный номер: {number}")
-        
-        return found_numbers
+        numbers = [span.value for span in EXTRACTOR.serial_numbers(text)]
+        for number in numbers:
+            log.debug(f"Найден серийный номер: {number}")
+        return numbers
     
     def find_phone_numbers(self, text: str) -> List[str]:
         """
@@ -89,24 +277,7 @@ class Parser:
         Returns:
             Список найденных телефонов
         """
-        if not text:
-            return []
-        
-        # Паттерн для российских телефонов
-        phone_pattern = r"""
-            (?:\+7|7|8)?      # Код страны
-            [\s\-]?           # Разделитель
-            (?:\(?\d{3}\)?)   # Код города в скобках или без
-            [\s\-]?           # Разделитель
-            \d{3}             # Первые 3 цифры
-            [\s\-]?           # Разделитель
-            \d{2}             # Следующие 2 цифры
-            [\s\-]?           # Разделитель
-            \d{2}             # Последние 2 цифры
-        """
-        
-        matches = re.findall(phone_pattern, text, re.VERBOSE)
-        return [m.strip() for m in matches if m.strip()]
+        return [span.value for span in EXTRACTOR.phones(text)]
     
     def find_emails(self, text: str) -> List[str]:
         """
@@ -115,11 +286,7 @@ class Parser:
         Returns:
             Список найденных email
         """
-        if not text:
-            return []
-        
-        email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-        return re.findall(email_pattern, text)
+        return [span.value for span in EXTRACTOR.emails(text)]
     
     def find_fio(self, text: str, sender_name: str = "") -> Optional[str]:
         """
@@ -132,20 +299,8 @@ class Parser:
         if sender_name and len(sender_name) > 5:
             return sender_name
         
-        # Поиск в тексте (формат: ФИО: ... или в начале письма)
-        fio_pattern = r"""
-            (?:ФИО|От[:\s]|Фамилия[:\s])?   # Префикс
-            \s*
-            ([А-ЯЁ][а-яё]+                  # Фамилия
-            \s+[А-ЯЁ][а-яё]+                # Имя
-            \s+[А-ЯЁ][а-яё]+)               # Отчество
-        """
-        
-        match = re.search(fio_pattern, text, re.IGNORECASE | re.VERBOSE)
-        if match:
-            return match.group(1).strip()
-        
-        return None
+        span = EXTRACTOR.fio(text)
+        return span.value if span else None
     
     def find_object_name(self, text: str) -> Optional[str]:
         """
@@ -154,18 +309,8 @@ class Parser:
         Returns:
             Название организации если найдено
         """
-        # Паттерны для организаций
-        org_patterns = [
-            r'(?:ООО|АО|ЗАО|ПАО|ИП)\s*["«]?([А-ЯЁ][а-яё\-\s]+)["»"]?',
-            r'(?:предприятие|объект|организация|компания)[:\s]+([А-ЯЁ][а-яё\-\s]+)',
-        ]
-        
-        for pattern in org_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
-        
-        return None
+        span = EXTRACTOR.object_name(text)
+        return span.value if span else None
     
     def parse_all(self, text: str, subject: str = "", sender_name: str = "") -> Dict:
         """
@@ -177,11 +322,15 @@ class Parser:
         log.info("🔍 Полный парсинг письма...")
         
         devices = self.find_device_models(text, subject)
-        serials = self.find_serial_numbers(text)
-        phones = self.find_phone_numbers(text)
-        emails = self.find_emails(text)
-        fio = self.find_fio(text, sender_name)
-        object_name = self.find_object_name(text)
+        spans = EXTRACTOR.extract(text)
+        serials = [s.value for s in spans if s.kind == SPAN_SERIAL]
+        phones = [s.value for s in spans if s.kind == SPAN_PHONE]
+        emails = [s.value for s in spans if s.kind == SPAN_EMAIL]
+        if sender_name and len(sender_name) > 5:
+            fio = sender_name
+        else:
+            fio = next((s.value for s in spans if s.kind == SPAN_FIO), None)
+        object_name = next((s.value for s in spans if s.kind == SPAN_ORGANIZATION), None)
         
         result = {
             'devices': devices,
@@ -200,4 +349,4 @@ class Parser:
         log.info(f"   ФИО: {fio}")
         log.info(f"   Организация: {object_name}")
         
-        return result
\ No newline at end of file
+        return result
@@ -0,0 +1,154 @@
+"""
+Конвейер обработки писем: стадии, связанные ограниченными очередями
+"""
+
+import asyncio
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.logger import log
+
+
+class Stage:
+    """
+    Стадия конвейера.
+
+    handler — обычная (блокирующая) функция, выполняется в пуле потоков.
+    При batch_size == 1 получает одно задание и возвращает задание для
+    следующей стадии или None (задание снимается с конвейера). При
+    batch_size > 1 получает список уже накопившихся в очереди заданий
+    (до batch_size) и возвращает список той же длины.
+    """
+
+    def __init__(self, name: str, handler: Callable, concurrency: int = 1,
+                 batch_size: int = 1, queue_size: int = 32,
+                 executor: Optional[Executor] = None):
+        self.name = name
+        self.handler = handler
+        self.concurrency = max(concurrency, 1)
+        self.batch_size = max(batch_size, 1)
+        self.queue_size = queue_size
+        self.executor = executor
+
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.queue: Optional[asyncio.Queue] = None
+
+    def stats(self) -> Dict:
+        return {
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'per_item_ms': round(self.busy_seconds * 1000 / self.processed, 1) if self.processed else None,
+            'queued': self.queue.qsize() if self.queue else 0,
+            'concurrency': self.concurrency,
+        }
+
+
+class Pipeline:
+    """
+    Стадии соединены очередями ограниченного размера: когда медленная стадия
+    не успевает, её очередь заполняется и submit() блокирует источник
+    (обратное давление). Каждая стадия обслуживается concurrency
+    воркерами, поэтому сетевой ввод-вывод одних писем идёт одновременно
+    с инференсом других, а пропускная способность ограничена самой
+    медленной стадией, а не суммой всех.
+
+    on_finished(job, error) вызывается, когда задание покидает конвейер:
+    прошло последнюю стадию, снято стадией (error=None) или упало (error).
+    """
+
+    def __init__(self, stages: List[Stage], on_finished: Optional[Callable[[Any, Optional[Exception]], None]] = None):
+        if not stages:
+            raise ValueError("Конвейер без стадий")
+        self.stages = stages
+        self.on_finished = on_finished
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        """Создание очередей и воркеров (внутри работающего event loop)"""
+        for stage in self.stages:
+            stage.queue = asyncio.Queue(maxsize=stage.queue_size)
+        for index, stage in enumerate(self.stages):
+            outbox = self.stages[index + 1].queue if index + 1 < len(self.stages) else None
+            for n in range(stage.concurrency):
+                self._tasks.append(
+                    asyncio.create_task(self._worker(stage, outbox), name=f"{stage.name}-{n}")
+                )
+        log.info("Конвейер запущен: " + " → ".join(f"{s.name}×{s.concurrency}" for s in self.stages))
+
+    async def submit(self, job: Any) -> None:
+        """Постановка задания; ждёт, пока в первой очереди не появится место"""
+        await self.stages[0].queue.put(job)
+
+    async def join(self) -> None:
+        """Ожидание, пока все поставленные задания пройдут конвейер"""
+        # Воркер кладёт результат дальше до task_done(), поэтому
+        # последовательное ожидание очередей не теряет заданий
+        for stage in self.stages:
+            await stage.queue.join()
+
+    async def stop(self) -> None:
+        """Дообработка поставленных заданий и остановка воркеров"""
+        if not self._tasks:
+            return
+        await self.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        log.info("Конвейер остановлен")
+
+    def stats(self) -> Dict[str, Dict]:
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    async def _worker(self, stage: Stage, outbox: Optional[asyncio.Queue]) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = [await stage.queue.get()]
+            while len(jobs) < stage.batch_size and not stage.queue.empty():
+                jobs.append(stage.queue.get_nowait())
+
+            started = time.perf_counter()
+            try:
+                if stage.batch_size > 1:
+                    results = await loop.run_in_executor(stage.executor, stage.handler, jobs)
+                else:
+                    results = [await loop.run_in_executor(stage.executor, stage.handler, jobs[0])]
+            except Exception as e:
+                log.error(f"Ошибка стадии '{stage.name}': {e}")
+                stage.errors += len(jobs)
+                for job in jobs:
+                    self._finish(job, e)
+                    stage.queue.task_done()
+                continue
+            finally:
+                stage.busy_seconds += time.perf_counter() - started
+
+            for job, result in zip(jobs, results):
+                if result is None:
+                    stage.dropped += 1
+                    self._finish(job, None)
+                else:
+                    stage.processed += 1
+                    if outbox is not None:
+                        await outbox.put(result)
+                    else:
+                        self._finish(result, None)
+                stage.queue.task_done()
+
+    def _finish(self, job: Any, error: Optional[Exception]) -> None:
+        if self.on_finished is None:
+            return
+        try:
+            self.on_finished(job, error)
+        except Exception as e:
+            log.error(f"Ошибка завершения задания конвейера: {e}")
@@ -0,0 +1,154 @@
+"""
+Хранилище ID обработанных писем: журнал дозаписи + словарь в памяти
+
+Формат файла (на примере data/processed_ids.log) — по строке на ID:
+    <unix-время обработки>\t<ключ>
+
+Ключи — "<UIDVALIDITY>:<UID>" и Message-ID письма. Дозапись пачки стоит
+одного fsync; при росте журнала (повторы, устаревшие ID) файл
+переписывается атомарно только с живыми ID.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from app.core.logger import log
+
+
+class ProcessedIdStore:
+    """
+    Множество ID обработанных писем с TTL.
+
+    Проверка принадлежности — O(1) по словарю в памяти; файл только
+    дописывается. ID старше ttl_seconds удаляются при загрузке и не чаще
+    раза в prune_interval при дозаписи (повторная обработка им не грозит:
+    письма ниже UID-отметки заново не запрашиваются).
+    """
+
+    COMPACT_MIN_LINES = 1000
+
+    def __init__(self, path: Path, ttl_seconds: float, legacy_json: Optional[Path] = None,
+                 prune_interval: float = 3600.0):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.prune_interval = prune_interval
+
+        self._ids: Dict[str, float] = {}
+        self._lines = 0  # Строк в файле (живые + повторы + устаревшие)
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+
+        self._load()
+        if legacy_json is not None:
+            self._migrate(Path(legacy_json))
+        self.prune()
+
+    # =========================================================================
+    # ЧТЕНИЕ
+    # =========================================================================
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        end = data.rfind(b'\n') + 1  # Недописанная при сбое строка отбрасывается
+        for line in data[:end].splitlines():
+            try:
+                stamp, key = line.decode('utf-8').split('\t', 1)
+                self._ids[key] = max(float(stamp), self._ids.get(key, 0.0))
+            except ValueError:
+                continue
+            self._lines += 1
+        if end < len(data):
+            log.warning(f"Отброшена недописанная строка {self.path.name}")
+            self._rewrite()
+        log.info(f"Загружено {len(self._ids)} ID обработанных писем")
+
+    def _migrate(self, legacy_json: Path) -> None:
+        """Однократный перенос из processed_emails.json"""
+        if not legacy_json.exists():
+            return
+        try:
+            with open(legacy_json, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            log.warning(f"Ошибка чтения {legacy_json}: {e}")
+            return
+
+        self.add_many(str(key) for key in legacy)
+        os.replace(legacy_json, legacy_json.with_name(legacy_json.name + ".migrated"))
+        log.success(f"Перенесено {len(legacy)} ID из {legacy_json.name}")
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # =========================================================================
+    # ЗАПИСЬ
+    # =========================================================================
+
+    @staticmethod
+    def _clean(key: str) -> str:
+        return str(key).replace('\t', ' ').replace('\r', ' ').replace('\n', ' ').strip()
+
+    def add(self, key: str) -> None:
+        self.add_many([key])
+
+    def add_many(self, keys: Iterable[str]) -> None:
+        """Дозапись пачки ID — один write и один fsync"""
+        keys = [k for k in (self._clean(key) for key in keys if key) if k]
+        if not keys:
+            return
+
+        with self._lock:
+            stamp = time.time()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(f"{stamp:.0f}\t{key}\n" for key in keys))
+                f.flush()
+                os.fsync(f.fileno())
+            for key in keys:
+                self._ids[key] = stamp
+            self._lines += len(keys)
+
+        if time.monotonic() - self._last_prune >= self.prune_interval:
+            self.prune()
+
+    def prune(self) -> int:
+        """Удаление ID старше TTL; файл переписывается, если в нём много лишнего"""
+        with self._lock:
+            self._last_prune = time.monotonic()
+            cutoff = time.time() - self.ttl_seconds
+            expired = [key for key, stamp in self._ids.items() if stamp < cutoff]
+            for key in expired:
+                del self._ids[key]
+            if self._lines >= max(2 * len(self._ids), self.COMPACT_MIN_LINES):
+                self._rewrite()
+        if expired:
+            log.info(f"Удалено {len(expired)} устаревших ID обработанных писем")
+        return len(expired)
+
+    def _rewrite(self) -> None:
+        """Атомарная перезапись файла только живыми ID (под self._lock)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(''.join(f"{stamp:.0f}\t{key}\n" for key, stamp in self._ids.items()))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._lines = len(self._ids)
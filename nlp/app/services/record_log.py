@@ -0,0 +1,194 @@
+"""
+Журнал обработанных записей: append-only сегменты + атомарный снимок
+
+Раскладка файлов (на примере data/records.json):
+    records.json         — снимок {"generation": G, "records": [...]}
+    records.G.jsonl      — сегменты журнала, по одной записи JSON на строку
+
+Снимок поколения G содержит все записи сегментов с номером < G, поэтому
+читатель всегда берёт снимок и только сегменты с номером >= G. Сбой в любой
+момент компактификации оставляет согласованное состояние.
+"""
+
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+from app.core.config import settings
+from app.core.logger import log
+
+
+def write_json_atomic(path: Path, data) -> None:
+    """Запись JSON через временный файл и os.replace — файл либо старый, либо новый"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class RecordLog:
+    """Запись и чтение журнала обработанных обращений"""
+
+    def __init__(self, snapshot_path: Path, compact_every: int = 1000):
+        self.snapshot_path = Path(snapshot_path)
+        self.compact_every = compact_every
+        self._segment_re = re.compile(
+            rf"^{re.escape(self.snapshot_path.stem)}\.(\d+)\.jsonl$"
+        )
+        self._pending = None  # Число записей в сегментах после снимка (лениво)
+
+    # =========================================================================
+    # ЧТЕНИЕ
+    # =========================================================================
+
+    def segment_path(self, generation: int) -> Path:
+        return self.snapshot_path.with_name(f"{self.snapshot_path.stem}.{generation}.jsonl")
+
+    def list_segments(self, min_generation: int = 0) -> List[Tuple[int, Path]]:
+        """Сегменты журнала с номером >= min_generation, по возрастанию"""
+        directory = self.snapshot_path.parent
+        if not directory.exists():
+            return []
+        segments = []
+        for name in os.listdir(directory):
+            match = self._segment_re.match(name)
+            if match and int(match.group(1)) >= min_generation:
+                segments.append((int(match.group(1)), directory / name))
+        return sorted(segments)
+
+    def read_snapshot(self) -> Tuple[int, List[dict]]:
+        """Чтение снимка; старый формат (просто список) считается поколением 0"""
+        if not self.snapshot_path.exists():
+            return 0, []
+        with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            return 0, data
+        return int(data.get('generation', 0)), data.get('records', [])
+
+    @staticmethod
+    def read_segment(path: Path, offset: int = 0) -> Tuple[List[dict], int]:
+        """
+        Чтение сегмента начиная с offset (для инкрементального чтения)
+
+        Returns:
+            (записи, смещение после последней полной строки)
+        """
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            chunk = f.read()
+
+        end = chunk.rfind(b'\n') + 1  # Недописанная строка остаётся на следующий раз
+        records = []
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                log.warning(f"Пропущена повреждённая строка журнала {path.name}: {e}")
+        return records, offset + end
+
+    def _snapshot_generation(self) -> int:
+        """Поколение снимка по началу файла, без разбора всех записей"""
+        if not self.snapshot_path.exists():
+            return 0
+        with open(self.snapshot_path, 'rb') as f:
+            head = f.read(64)
+        # write_json_atomic пишет ключи по порядку: {"generation": G, "records": ...}
+        match = re.match(rb'\{"generation": (\d+),', head)
+        if match:
+            return int(match.group(1))
+        return self.read_snapshot()[0]
+
+    def iter_newest(self) -> Iterator[dict]:
+        """
+        Записи от новых к старым: сначала сегменты журнала (с последнего),
+        снимок читается, только если вызывающему не хватило записей из них
+        """
+        for _, path in reversed(self.list_segments(self._snapshot_generation())):
+            yield from reversed(self.read_segment(path)[0])
+        yield from reversed(self.read_snapshot()[1])
+
+    def read_all(self) -> List[dict]:
+        """Все записи: снимок + сегменты журнала"""
+        generation, records = self.read_snapshot()
+        for _, path in self.list_segments(generation):
+            records.extend(self.read_segment(path)[0])
+        return records
+
+    # =========================================================================
+    # ЗАПИСЬ
+    # =========================================================================
+
+    def _current_generation(self) -> int:
+        segments = self.list_segments()
+        if segments:
+            return segments[-1][0]
+        return self.read_snapshot()[0]
+
+    def append(self, records: List[dict]) -> None:
+        """Дозапись пачки записей — стоимость O(размер пачки)"""
+        if not records:
+            return
+        if self._pending is None:
+            self._pending = self._count_pending()
+
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        payload = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records)
+        with open(self.segment_path(self._current_generation()), 'a', encoding='utf-8') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._pending += len(records)
+        if self._pending >= self.compact_every:
+            self.compact()
+
+    def _count_pending(self) -> int:
+        generation = self.read_snapshot()[0]
+        total = 0
+        for _, path in self.list_segments(generation):
+            with open(path, 'rb') as f:
+                total += sum(1 for _ in f)
+        return total
+
+    def compact(self) -> None:
+        """Слияние сегментов в новый снимок (атомарная замена файла)"""
+        generation, records = self.read_snapshot()
+        segments = self.list_segments(generation)
+        if not segments:
+            return
+
+        # Новые записи с этого момента пишутся в следующий сегмент
+        new_generation = segments[-1][0] + 1
+        self.segment_path(new_generation).touch()
+
+        for _, path in segments:
+            records.extend(self.read_segment(path)[0])
+
+        write_json_atomic(self.snapshot_path, {'generation': new_generation, 'records': records})
+
+        for _, path in segments:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+        self._pending = 0
+        log.info(f"Журнал записей сжат: {len(records)} записей, поколение {new_generation}")
+
+
+record_log = RecordLog(settings.records_file, compact_every=settings.records_compact_every)
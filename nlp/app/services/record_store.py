@@ -0,0 +1,216 @@
+"""
+Индексированное хранилище обработанных обращений для API
+"""
+
+import base64
+import json
+import os
+import threading
+from bisect import bisect_left, insort
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.core.logger import log
+from app.services.record_log import RecordLog, record_log
+from app.services.search_index import SearchIndex
+
+# Ключ сортировки: (processed_at, номер строки) — уникален и стабилен при дозаписи
+SortKey = Tuple[str, int]
+
+
+class RecordStore:
+    """
+    Хранилище записей с индексами в памяти:
+    - первичный индекс email_id → запись (O(1) поиск)
+    - вторичные индексы sentiment / category → отсортированные ключи
+    - упорядоченный индекс по processed_at для курсорной пагинации
+    - полнотекстовый индекс для параметра search
+
+    Снимок перечитывается целиком только после компактификации журнала,
+    в остальное время из сегментов дочитываются лишь новые строки.
+    """
+
+    INDEXED_FIELDS = ("sentiment", "category")
+
+    def __init__(self, records_log: RecordLog):
+        self.records_log = records_log
+        self._lock = threading.RLock()
+        self._snapshot_signature: Optional[Tuple[float, int]] = None
+        self._generation = 0
+        self._offsets: Dict[int, int] = {}
+        self._reset()
+
+    def _reset(self) -> None:
+        self._rows: List[dict] = []
+        self._keys: List[SortKey] = []
+        self._by_id: Dict[str, int] = {}
+        self._order: List[SortKey] = []
+        self._secondary: Dict[str, Dict[str, List[SortKey]]] = {f: {} for f in self.INDEXED_FIELDS}
+        self._search_index = SearchIndex()
+
+    # =========================================================================
+    # ЗАГРУЗКА И ИНДЕКСАЦИЯ
+    # =========================================================================
+
+    def refresh(self) -> None:
+        """Подхват изменений: перестроение после компактификации, иначе дочитывание хвоста"""
+        try:
+            stat = os.stat(self.records_log.snapshot_path)
+            signature: Optional[Tuple[float, int]] = (stat.st_mtime, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+
+        with self._lock:
+            try:
+                if signature != self._snapshot_signature:
+                    self._rebuild(signature)
+                self._tail()
+            except Exception as e:
+                log.error(f"Ошибка загрузки записей: {e}")
+                self._snapshot_signature = None  # Полное перечитывание в следующий раз
+
+    def _rebuild(self, signature: Optional[Tuple[float, int]]) -> None:
+        self._reset()
+        self._generation, records = self.records_log.read_snapshot()
+        self._offsets = {}
+        for record in records:
+            self._index(record)
+        self._snapshot_signature = signature
+        log.debug(f"Индекс записей перестроен: {len(self._rows)} записей")
+
+    def _tail(self) -> None:
+        for generation, path in self.records_log.list_segments(self._generation):
+            offset = self._offsets.get(generation, 0)
+            try:
+                if os.path.getsize(path) == offset:
+                    continue
+                records, self._offsets[generation] = self.records_log.read_segment(path, offset)
+            except FileNotFoundError:
+                continue  # Сегмент удалён компактификацией — снимок уже сменился
+            for record in records:
+                self._index(record)
+
+    def _index(self, record: dict) -> None:
+        row = len(self._rows)
+        self._rows.append(record)
+        key: SortKey = (str(record.get('processed_at') or ''), row)
+        self._keys.append(key)
+
+        email_id = record.get('email_id')
+        if email_id is not None:
+            self._by_id.setdefault(str(email_id), row)
+
+        insort(self._order, key)
+        for field in self.INDEXED_FIELDS:
+            value = record.get(field)
+            if value is not None:
+                insort(self._secondary[field].setdefault(str(value), []), key)
+        self._search_index.add(row, record)
+
+    # =========================================================================
+    # ЧТЕНИЕ
+    # =========================================================================
+
+    def get(self, email_id: str) -> Optional[dict]:
+        """Поиск записи по email_id"""
+        self.refresh()
+        with self._lock:
+            row = self._by_id.get(email_id)
+            return self._rows[row] if row is not None else None
+
+    def all(self) -> List[dict]:
+        self.refresh()
+        with self._lock:
+            return list(self._rows)
+
+    def count(self) -> int:
+        self.refresh()
+        with self._lock:
+            return len(self._rows)
+
+    def query(
+        self,
+        sentiment: Optional[str] = None,
+        category: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        search: Optional[str] = None,
+        predicate: Optional[Callable[[dict], bool]] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Выборка записей (новые сначала) с фильтрами и курсором
+
+        Returns:
+            (записи, курсор следующей страницы или None)
+        """
+        self.refresh()
+        after = self.decode_cursor(cursor) if cursor else None
+
+        with self._lock:
+            filters = {'sentiment': sentiment, 'category': category}
+            candidates = [
+                self._secondary[field].get(value, [])
+                for field, value in filters.items() if value
+            ]
+            matched = None
+            if search:
+                matched = self._search_index.search(search)
+                candidates.append(sorted(self._keys[row] for row in matched))
+            # Обходим самый короткий индекс, остальные фильтры проверяем по записи
+            keys = min(candidates, key=len) if candidates else self._order
+
+            end = bisect_left(keys, after) if after else len(keys)
+            result: List[dict] = []
+            last_key: Optional[SortKey] = None
+            for i in range(end - 1, -1, -1):
+                key = keys[i]
+                record = self._rows[key[1]]
+                if sentiment and record.get('sentiment') != sentiment:
+                    continue
+                if category and record.get('category') != category:
+                    continue
+                if matched is not None and key[1] not in matched:
+                    continue
+                if predicate and not predicate(record):
+                    continue
+                if len(result) == limit:
+                    return result, self.encode_cursor(last_key)
+                result.append(record)
+                last_key = key
+            return result, None
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[dict, float, Dict[str, str]]]:
+        """
+        Ранжированный полнотекстовый поиск
+
+        Returns:
+            [(запись, релевантность, подсвеченные фрагменты полей)]
+        """
+        self.refresh()
+        with self._lock:
+            scores = self._search_index.search(query)
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]
+            return [
+                (self._rows[row], score, self._search_index.highlight(self._rows[row], query))
+                for row, score in ranked
+            ]
+
+    # =========================================================================
+    # КУРСОР
+    # =========================================================================
+
+    @staticmethod
+    def encode_cursor(key: SortKey) -> str:
+        raw = json.dumps(list(key), ensure_ascii=False).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> SortKey:
+        """Декодирование курсора; ValueError при некорректном значении"""
+        try:
+            processed_at, row = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return str(processed_at), int(row)
+        except Exception as e:
+            raise ValueError(f"Некорректный курсор: {cursor}") from e
+
+
+record_store = RecordStore(record_log)
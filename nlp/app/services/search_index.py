@@ -0,0 +1,157 @@
+"""
+Полнотекстовый индекс обращений (инвертированный индекс со стеммингом)
+"""
+
+import html
+import math
+import re
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from nltk.stem.snowball import SnowballStemmer
+
+
+class SearchIndex:
+    """
+    Инвертированный индекс по полям записи.
+
+    Токены приводятся к нижнему регистру (ё → е), кириллица стеммится
+    Snowball-стеммером для русского языка. Терм запроса совпадает со всеми
+    основами, начинающимися с его основы (префиксный поиск), все термы
+    запроса должны встретиться в записи. Ранжирование — TF-IDF с весами полей.
+    """
+
+    # Поле записи → вес при ранжировании
+    FIELDS = {
+        'description': 3.0,
+        'fio': 2.0,
+        'object_name': 2.0,
+        'text': 1.0,
+        'response_body': 0.5,
+    }
+
+    TOKEN_RE = re.compile(r"[0-9a-zа-яё]+", re.IGNORECASE)
+    CYRILLIC_RE = re.compile(r"[а-я]")
+    SNIPPET_RADIUS = 60
+
+    def __init__(self):
+        self._stemmer = SnowballStemmer("russian")
+        self._stem_cache: Dict[str, str] = {}
+        self._postings: Dict[str, Dict[int, float]] = {}  # основа → {строка: взвешенная частота}
+        self._vocabulary: List[str] = []  # Отсортированные основы для префиксного поиска
+        self._doc_count = 0
+
+    # =========================================================================
+    # ТОКЕНИЗАЦИЯ
+    # =========================================================================
+
+    def _stem(self, token: str) -> str:
+        stem = self._stem_cache.get(token)
+        if stem is None:
+            stem = self._stemmer.stem(token) if self.CYRILLIC_RE.search(token) else token
+            self._stem_cache[token] = stem
+        return stem
+
+    def tokenize(self, text: str) -> List[Tuple[str, int, int]]:
+        """Токены текста: (основа, начало, конец)"""
+        tokens = []
+        for match in self.TOKEN_RE.finditer(text):
+            token = match.group().lower().replace('ё', 'е')
+            tokens.append((self._stem(token), match.start(), match.end()))
+        return tokens
+
+    def _query_stems(self, query: str) -> List[str]:
+        return list(dict.fromkeys(stem for stem, _, _ in self.tokenize(query)))
+
+    def _expand(self, stem: str) -> List[str]:
+        """Все основы словаря с данным префиксом"""
+        start = bisect_left(self._vocabulary, stem)
+        matched = []
+        for i in range(start, len(self._vocabulary)):
+            if not self._vocabulary[i].startswith(stem):
+                break
+            matched.append(self._vocabulary[i])
+        return matched
+
+    # =========================================================================
+    # ИНДЕКСАЦИЯ
+    # =========================================================================
+
+    def add(self, row: int, record: dict) -> None:
+        """Добавление записи (вызывается по мере поступления записей)"""
+        self._doc_count += 1
+        for field, weight in self.FIELDS.items():
+            value = record.get(field)
+            if not value:
+                continue
+            for stem, _, _ in self.tokenize(str(value)):
+                postings = self._postings.get(stem)
+                if postings is None:
+                    postings = self._postings[stem] = {}
+                    insort(self._vocabulary, stem)
+                postings[row] = postings.get(row, 0.0) + weight
+
+    # =========================================================================
+    # ПОИСК
+    # =========================================================================
+
+    def search(self, query: str) -> Dict[int, float]:
+        """
+        Поиск по запросу
+
+        Returns:
+            {номер строки: релевантность} для записей, содержащих все термы
+        """
+        stems = self._query_stems(query)
+        if not stems:
+            return {}
+
+        scores: Optional[Dict[int, float]] = None
+        for stem in stems:
+            term_scores: Dict[int, float] = {}
+            for variant in self._expand(stem):
+                postings = self._postings[variant]
+                idf = math.log(1 + self._doc_count / len(postings))
+                for row, tf in postings.items():
+                    term_scores[row] = term_scores.get(row, 0.0) + (1 + math.log(tf)) * idf
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {row: s + term_scores[row] for row, s in scores.items() if row in term_scores}
+            if not scores:
+                return {}
+        return scores or {}
+
+    def highlight(self, record: dict, query: str, mark: Tuple[str, str] = ("<mark>", "</mark>")) -> Dict[str, str]:
+        """
+        Фрагменты полей записи с выделенными совпадениями.
+
+        Текст писем приходит от внешних отправителей, поэтому фрагменты
+        экранируются (html.escape) — размечены только теги mark.
+        """
+        stems = self._query_stems(query)
+        highlights = {}
+        for field in self.FIELDS:
+            value = record.get(field)
+            if not value or not stems:
+                continue
+            value = str(value)
+            spans = [(start, end) for stem, start, end in self.tokenize(value)
+                     if any(stem.startswith(q) for q in stems)]
+            if not spans:
+                continue
+
+            left = max(spans[0][0] - self.SNIPPET_RADIUS, 0)
+            right = min(spans[0][1] + self.SNIPPET_RADIUS, len(value))
+            parts = ["..." if left > 0 else ""]
+            cursor = left
+            for start, end in spans:
+                if start < cursor or end > right:
+                    continue
+                parts.append(html.escape(value[cursor:start]))
+                parts.append(f"{mark[0]}{html.escape(value[start:end])}{mark[1]}")
+                cursor = end
+            parts.append(html.escape(value[cursor:right]))
+            parts.append("..." if right < len(value) else "")
+            highlights[field] = "".join(parts)
+        return highlights
@@ -0,0 +1,120 @@
+"""
+Агрегаты статистики, поддерживаемые при записи обращений
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from app.core.config import settings
+from app.core.logger import log
+from app.services.record_log import write_json_atomic
+
+
+class StatsAggregator:
+    """
+    Счётчики для /stats: обновляются EmailWorker'ом по мере сохранения записей
+    и хранятся в JSON-файле рядом с журналом записей. API только читает файл
+    (повторно — лишь при его изменении), поэтому ответ не зависит от объёма истории.
+    """
+
+    # Поле ответа → поле записи
+    DIMENSIONS = {
+        'by_sentiment': 'sentiment',
+        'by_category': 'category',
+        'by_response_method': 'response_method',
+        'by_device_type': 'device_type',
+    }
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple[float, int]] = None
+        self._rebuilt = False  # Счётчики пересчитаны в памяти (файла ещё нет)
+        self._data = self._empty()
+
+    def _empty(self) -> Dict:
+        data = {'total_processed': 0, 'by_day': {}, 'last_updated': None}
+        for key in self.DIMENSIONS:
+            data[key] = {}
+        return data
+
+    # =========================================================================
+    # ОБНОВЛЕНИЕ (сторона записи)
+    # =========================================================================
+
+    def add(self, records: Iterable[dict]) -> None:
+        """Учёт новых записей в счётчиках"""
+        with self._lock:
+            self._add(records)
+
+    def _add(self, records: Iterable[dict]) -> None:
+        data = self._data
+        for record in records:
+            data['total_processed'] += 1
+            for key, field in self.DIMENSIONS.items():
+                value = str(record.get(field) or 'unknown')
+                data[key][value] = data[key].get(value, 0) + 1
+            day = str(record.get('processed_at') or '')[:10] or 'unknown'
+            data['by_day'][day] = data['by_day'].get(day, 0) + 1
+        data['last_updated'] = datetime.now().isoformat()
+
+    def rebuild(self, records: Iterable[dict]) -> None:
+        """Полный пересчёт счётчиков по всем записям"""
+        with self._lock:
+            self._data = self._empty()
+            self._add(records)
+            self._rebuilt = True
+        log.info(f"Статистика пересчитана: {self._data['total_processed']} записей")
+
+    def save(self) -> None:
+        with self._lock:
+            write_json_atomic(self.path, self._data)
+            stat = os.stat(self.path)
+            self._signature = (stat.st_mtime, stat.st_size)
+
+    # =========================================================================
+    # ЧТЕНИЕ
+    # =========================================================================
+
+    def load(self) -> bool:
+        """
+        Подхват файла агрегатов, если он изменился.
+
+        False — файла нет и счётчики ещё не пересчитаны. Пока файла нет
+        (API запущен раньше первого сохранения EmailWorker'а или без
+        него), используется однажды пересчитанный результат; файл
+        EmailWorker'а подхватывается, как только появится.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return self._rebuilt
+
+        signature = (stat.st_mtime, stat.st_size)
+        with self._lock:
+            if signature == self._signature:
+                return True
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                log.error(f"Ошибка загрузки статистики: {e}")
+                return False
+            self._data = {**self._empty(), **data}
+            self._signature = signature
+        return True
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {k: dict(v) if isinstance(v, dict) else v for k, v in self._data.items()}
+
+    @property
+    def total(self) -> int:
+        return self._data['total_processed']
+
+
+stats_aggregator = StatsAggregator(settings.stats_file)
@@ -0,0 +1,172 @@
+"""
+Сравнение бэкендов инференса (fp32 PyTorch, int8 PyTorch, int8 ONNX Runtime)
+на фиксированном наборе писем: совпадение выходов с fp32, время и память
+
+Каждый бэкенд загружается в отдельном процессе, чтобы прирост RSS
+относился только к его моделям. Код завершения 1 — точность int8 ниже
+порога (--min-agreement), так что запуск годится как регрессионная проверка.
+
+Запуск из каталога nlp:
+    python -m benchmarks.backend_benchmark
+    python -m benchmarks.backend_benchmark --backends torch torch_int8 --llm --new-tokens 32
+"""
+
+import argparse
+import multiprocessing
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.models.backends import BACKENDS, TORCH
+from benchmarks.email_corpus import EMAILS
+
+
+def _rss_mb() -> float:
+    import psutil
+    return psutil.Process().memory_info().rss / 2**20
+
+
+def _timed(func, repeat: int):
+    timings, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, statistics.mean(timings)
+
+
+def run_backend(backend: str, repeat: int, llm: bool, new_tokens: int) -> dict:
+    """Выполняется в дочернем процессе: выходы и метрики одного бэкенда"""
+    import torch
+
+    from app.core.config import settings
+    from app.core.logger import log
+
+    log.remove()
+    settings.inference_backend = backend
+    settings.embedding_enabled = False  # Сравнивается только NLI-модель
+
+    from app.models.classifier_model import Classifier
+    from app.models.sentiment_model import SentimentAnalyzer
+
+    texts = [email["body"] for email in EMAILS]
+    subjects = [email["subject"] for email in EMAILS]
+    report = {"backend": backend, "models": {}}
+
+    rss = _rss_mb()
+    sentiment = SentimentAnalyzer()
+    outputs, ms = _timed(lambda: sentiment.predict_batch(texts, subjects), repeat)
+    report["models"]["sentiment"] = {
+        "labels": [o["sentiment"] for o in outputs],
+        "scores": [o["confidence"] for o in outputs],
+        "ms_per_email": ms / len(texts),
+        "rss_mb": _rss_mb() - rss,
+    }
+
+    rss = _rss_mb()
+    classifier = Classifier()
+    inputs = [f"{s} {t}"[:Classifier.MAX_INPUT_CHARS] for t, s in zip(texts, subjects)]
+    outputs, ms = _timed(lambda: classifier._classify_batch_by_model(inputs), repeat)
+    report["models"]["classifier"] = {
+        "labels": [category for category, _, _ in outputs],
+        "scores": [score for _, score, _ in outputs],
+        "ms_per_email": ms / len(texts),
+        "rss_mb": _rss_mb() - rss,
+    }
+
+    if llm:
+        from app.models.response_generator import ResponseGenerator
+
+        rss = _rss_mb()
+        generator = ResponseGenerator()
+        model = generator.generation_model.model
+        tokenizer = generator.generation_model.tokenizer
+        # Жадная генерация фиксированной длины: выходы бэкендов сравнимы потокенно
+        kwargs = {
+            **generator._generation_kwargs(),
+            "do_sample": False, "temperature": None, "top_p": None, "top_k": None,
+            "max_new_tokens": new_tokens, "min_new_tokens": new_tokens,
+        }
+        records = [{"description": email["body"], "category": ""} for email in EMAILS[:5]]
+
+        def generate():
+            tokens = []
+            for record in records:
+                input_ids = tokenizer("".join(generator._build_prompt(record)), return_tensors="pt")["input_ids"]
+                with torch.inference_mode():
+                    output = model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids), **kwargs)
+                tokens.append(output[0, input_ids.shape[1]:].tolist())
+            return tokens
+
+        tokens, ms = _timed(generate, 1)
+        report["models"]["generator"] = {
+            "tokens": tokens,
+            "ms_per_email": ms / len(records),
+            "rss_mb": _rss_mb() - rss,
+        }
+    return report
+
+
+def compare(reference: dict, candidate: dict) -> dict:
+    """Доля совпадений с fp32 и расхождение уверенности"""
+    if "tokens" in reference:
+        # Доля совпавших токенов до первого расхождения
+        agreements = []
+        for ref, cand in zip(reference["tokens"], candidate["tokens"]):
+            same = next((i for i, (a, b) in enumerate(zip(ref, cand)) if a != b), min(len(ref), len(cand)))
+            agreements.append(same / max(len(ref), 1))
+        return {"agreement": statistics.mean(agreements), "max_score_delta": None}
+
+    pairs = list(zip(reference["labels"], candidate["labels"]))
+    deltas = [abs(a - b) for a, b in zip(reference["scores"], candidate["scores"])]
+    return {
+        "agreement": sum(a == b for a, b in pairs) / len(pairs),
+        "max_score_delta": max(deltas),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--llm", action="store_true", help="Сравнить и генератор ответов (долго)")
+    arg_parser.add_argument("--new-tokens", type=int, default=32)
+    arg_parser.add_argument("--min-agreement", type=float, default=0.9,
+                            help="Минимальная доля совпадений с fp32 для классификаторов")
+    args = arg_parser.parse_args()
+
+    backends = [TORCH] + [b for b in args.backends if b != TORCH]
+    reports = {}
+    context = multiprocessing.get_context("spawn")
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                reports[backend] = executor.submit(run_backend, backend, args.repeat, args.llm, args.new_tokens).result()
+            except Exception as e:
+                print(f"{backend}: не удалось запустить — {e}")
+
+    if TORCH not in reports:
+        raise SystemExit("Нет результатов fp32 для сравнения")
+
+    print(f"\n{'модель':<12} {'бэкенд':<12} {'мс/письмо':>10} {'ускорение':>10} {'RSS, МБ':>9} "
+          f"{'совпадение':>11} {'max Δ увер.':>12}")
+    failed = []
+    for name, reference in reports[TORCH]["models"].items():
+        for backend, report in reports.items():
+            result = report["models"][name]
+            diff = compare(reference, result)
+            delta = "" if diff["max_score_delta"] is None else f"{diff['max_score_delta']:.4f}"
+            print(f"{name:<12} {backend:<12} {result['ms_per_email']:>10.1f} "
+                  f"{reference['ms_per_email'] / result['ms_per_email']:>9.2f}× {result['rss_mb']:>9.0f} "
+                  f"{diff['agreement']:>10.0%} {delta:>12}")
+            if name != "generator" and diff["agreement"] < args.min_agreement:
+                failed.append(f"{name}/{backend}: {diff['agreement']:.0%}")
+
+    if failed:
+        print(f"\nРегрессия точности (< {args.min_agreement:.0%}): {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+Фиксированный набор писем для сравнения бэкендов инференса
+"""
+
+EMAILS = [
+    {"subject": "Калибровка", "body": "Добрый день! Какой межкалибровочный интервал у датчика метана ДГС ЭРИС-230?"},
+    {"subject": "Срочно! Не работает прибор",
+     "body": "После скачка напряжения ПКГ ЭРИС-411 не выходит на режим, горит ошибка датчика. Объект стоит!"},
+    {"subject": "Подключение", "body": "Как подключить газоанализатор к контроллеру по RS-485 и какой протокол используется?"},
+    {"subject": "Спасибо", "body": "Благодарим за оперативную помощь, прибор после ремонта работает отлично."},
+    {"subject": "Жалоба", "body": "Третий раз отправляем прибор в ремонт, и снова та же неисправность. Это недопустимо."},
+    {"subject": "Документы", "body": "Пришлите, пожалуйста, паспорт и руководство по эксплуатации на ДГС ЭРИС-210."},
+    {"subject": "Поверка", "body": "Подскажите стоимость и сроки поверки пяти газоанализаторов, свидетельства истекают в мае."},
+    {"subject": "Счёт", "body": "Прошу выставить счёт на поставку двух сенсоров и блока питания, реквизиты во вложении."},
+    {"subject": "Ошибка E05", "body": "На дисплее код ошибки E05, сигнализация срабатывает без причины при чистом воздухе."},
+    {"subject": "Гарантия", "body": "Прибор куплен полгода назад, сломался разъём. Это гарантийный случай?"},
+    {"subject": "Монтаж", "body": "На какой высоте монтировать датчик пропана в котельной и нужна ли защита от брызг?"},
+    {"subject": "Обновление ПО", "body": "Где скачать последнюю версию программы конфигурирования и как обновить прошивку?"},
+    {"subject": "Доставка", "body": "Заказ оплачен две недели назад, а отгрузки до сих пор нет. Когда ждать?"},
+    {"subject": "Замена сенсора", "body": "Можно ли самостоятельно заменить электрохимический сенсор сероводорода?"},
+    {"subject": "Вопрос", "body": "Работает ли прибор при температуре минус сорок градусов на открытой площадке?"},
+    {"subject": "Дрейф показаний", "body": "Показания по CO плавают от 0 до 15 мг/м3 без видимых причин, калибровку делали месяц назад."},
+    {"subject": "Обучение", "body": "Проводите ли вы обучение персонала работе с системой газового контроля?"},
+    {"subject": "Отлично", "body": "Хотим отметить качественную работу сервисного инженера на выезде, всё чётко и быстро."},
+    {"subject": "Не отвечаете", "body": "Неделю не можем дозвониться в сервис, письма остаются без ответа. Очень плохо."},
+    {"subject": "Аналог", "body": "Снят с производства старый датчик, подберите современный аналог с тем же выходом 4-20 мА."},
+]
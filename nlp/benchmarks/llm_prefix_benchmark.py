@@ -0,0 +1,90 @@
+"""
+Бенчмарк генератора ответов: время до первого токена (TTFT) с полным
+промптом и с KV-кэшем неизменного начала промпта
+
+Запуск из каталога nlp:
+    python -m benchmarks.llm_prefix_benchmark --repeat 5
+    python -m benchmarks.llm_prefix_benchmark --new-tokens 64   # время ответа целиком
+"""
+
+import argparse
+import statistics
+import time
+
+import torch
+
+from app.core.logger import log
+from app.models.prompt_cache import PromptPrefixCache
+from app.models.response_generator import ResponseGenerator
+
+RECORDS = [
+    {"fio": "Иванов Иван", "device_type": "ДГС ЭРИС-230", "category": "калибровка",
+     "description": "Какой межкалибровочный интервал у датчика метана?"},
+    {"fio": "Петрова Анна", "device_type": "ПКГ ЭРИС-411", "category": "неисправность",
+     "description": "После скачка напряжения прибор не выходит на режим, горит ошибка датчика."},
+    {"fio": "Сидоров Пётр", "device_type": "", "category": "подключение",
+     "description": "Как подключить газоанализатор к контроллеру по RS-485 и какой протокол используется?"},
+]
+
+
+def measure(func, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'mean_ms': round(statistics.mean(timings), 1),
+        'p95_ms': round(timings[max(int(len(timings) * 0.95) - 1, 0)], 1),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--new-tokens", type=int, default=1,
+                            help="Токенов генерации (1 — время до первого токена)")
+    args = arg_parser.parse_args()
+
+    generator = ResponseGenerator()
+    if generator.generation_model is None:
+        raise SystemExit("Модель генерации не загружена")
+    log.remove()
+
+    model = generator.generation_model.model
+    tokenizer = generator.generation_model.tokenizer
+    # Жадная генерация фиксированной длины: сравнивается только стоимость prefill
+    generate_kwargs = {
+        **generator._generation_kwargs(),
+        "do_sample": False, "temperature": None, "top_p": None, "top_k": None,
+        "max_new_tokens": args.new_tokens, "min_new_tokens": args.new_tokens,
+    }
+    cache = PromptPrefixCache(model, tokenizer)
+
+    def full_prompt(prompt: str):
+        input_ids = tokenizer(prompt, return_tensors="pt")["input_ids"].to(model.device)
+        with torch.inference_mode():
+            model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids), **generate_kwargs)
+
+    print(f"{'письмо':<8} {'токенов':>14} {'режим':<14} {'mean, мс':>10} {'p95, мс':>10}")
+    speedups = []
+    for n, record in enumerate(RECORDS, 1):
+        prefix, suffix = generator._build_prompt(record)
+        prefix_ids, _ = cache.get(prefix)  # Вычисляется один раз при старте сервиса
+        suffix_tokens = len(tokenizer(suffix, add_special_tokens=False)["input_ids"])
+        tokens = f"{len(prefix_ids)}+{suffix_tokens}"
+
+        full = measure(lambda: full_prompt(prefix + suffix), args.repeat)
+        cached = measure(lambda: cache.generate(prefix, suffix, **generate_kwargs), args.repeat)
+        speedups.append(full['mean_ms'] / cached['mean_ms'])
+
+        print(f"{n:<8} {tokens:>14} {'полный':<14} {full['mean_ms']:>10} {full['p95_ms']:>10}")
+        print(f"{'':<8} {'':>14} {'кэш префикса':<14} {cached['mean_ms']:>10} {cached['p95_ms']:>10}")
+
+    print(f"\nУскорение (по mean): ×{statistics.mean(speedups):.2f}; "
+          f"prefill префикса один раз: {cache.stats()['prefill_seconds'] * 1000:.0f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Микробенчмарк парсера: время разбора одного письма на больших телах
+
+Запуск из каталога nlp:
+    python -m benchmarks.parser_benchmark --sizes 1000 10000 100000 --repeat 50
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from app.core.logger import log
+from app.services.parser import EXTRACTOR, Parser
+
+FRAGMENTS = [
+    "Добрый день! Газоанализатор СН-415 не включается после поверки.",
+    "Заводской № 12345678, S/N: 7654321, ID: d88bb1b8978b.",
+    "Контактный телефон +7 (912) 230-41-55, резервный 8-912-230-41-56.",
+    "Пишите на ivanov@example.ru или support@example.org.",
+    "Иванов Иван Иванович, ООО «Ромашка», объект: Котельная номер два.",
+    "Прибор ДГС ЭРИС-230 показывает ошибку датчика, нужна консультация.",
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit.",
+]
+
+
+def make_body(size: int, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    parts, length = [], 0
+    while length < size:
+        fragment = rnd.choice(FRAGMENTS)
+        parts.append(fragment)
+        length += len(fragment) + 1
+    return " ".join(parts)[:size]
+
+
+def measure(func, body: str, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(body)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'mean_ms': round(statistics.mean(timings), 3),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 3),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    arg_parser.add_argument("--repeat", type=int, default=50)
+    args = arg_parser.parse_args()
+
+    log.remove()  # parse_all пишет в лог на каждое письмо — в замер это не входит
+    parser = Parser()
+
+    print(f"{'размер':>10} {'этап':<18} {'mean, мс':>10} {'p95, мс':>10}")
+    for size in args.sizes:
+        body = make_body(size)
+        for name, func in (
+            ("spans", EXTRACTOR.extract),
+            ("devices", parser.find_device_models),
+            ("parse_all", parser.parse_all),
+        ):
+            result = measure(func, body, args.repeat)
+            print(f"{size:>10} {name:<18} {result['mean_ms']:>10} {result['p95_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
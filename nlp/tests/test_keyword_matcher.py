@@ -0,0 +1,60 @@
+import random
+
+from app.services.keyword_matcher import KeywordMatcher
+
+ALPHABET = "аб в1"
+
+
+def naive_matches(patterns, text, word_boundaries=False):
+    """Все вхождения простым поиском str.find по каждой фразе"""
+    found = set()
+    for label, phrases in patterns.items():
+        for phrase in phrases:
+            start = text.find(phrase)
+            while start >= 0:
+                end = start + len(phrase)
+                if not word_boundaries or KeywordMatcher._on_boundaries(text, start, end):
+                    found.add((label, phrase, start, end))
+                start = text.find(phrase, start + 1)
+    return found
+
+
+def random_patterns(rnd):
+    phrases = {"".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(1, 4))).strip() for _ in range(8)}
+    phrases = sorted(p for p in phrases if p)
+    return {"x": phrases[::2], "y": phrases[1::2]}
+
+
+def test_find_all_matches_naive_scan():
+    rnd = random.Random(0)
+    for _ in range(300):
+        patterns = random_patterns(rnd)
+        text = "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(0, 40)))
+        for word_boundaries in (False, True):
+            matcher = KeywordMatcher(patterns, word_boundaries=word_boundaries)
+            assert set(matcher.find_all(text)) == naive_matches(patterns, text, word_boundaries)
+
+
+def test_count_by_label_matches_naive_count():
+    rnd = random.Random(1)
+    for _ in range(300):
+        patterns = random_patterns(rnd)
+        text = "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(0, 40)))
+        expected = {label: sum(1 for p in phrases if p in text) for label, phrases in patterns.items()}
+        counts = KeywordMatcher(patterns).count_by_label(text)
+        assert {label: counts.get(label, 0) for label in patterns} == expected
+
+
+def test_normalization_and_reload():
+    matcher = KeywordMatcher({"калибровка": ["Поверка"]})
+    assert matcher.contains("Нужна ПОВЕРКА прибора")
+
+    matcher.reload({"ремонт": ["сломался"]})
+    assert not matcher.contains("нужна поверка")
+    assert matcher.count_by_label("прибор сломался") == {"ремонт": 1}
+
+
+def test_word_boundaries_skip_digits_inside_numbers():
+    matcher = KeywordMatcher({"model": ["230"]}, word_boundaries=True)
+    assert not matcher.contains("тел. 8912230415")
+    assert [m.start for m in matcher.find_all("ЭРИС-230 и 230")] == [5, 11]
@@ -0,0 +1,92 @@
+import json
+import time
+
+import pytest
+
+from app.services import outbox as outbox_module
+from app.services.outbox import Outbox, TokenBucket
+
+
+class FakeSender:
+    smtp_host = "smtp.example.ru"
+
+    def __init__(self, results=None):
+        self.results = results
+        self.sent = []
+
+    def send_many(self, messages):
+        self.sent.extend(messages)
+        if self.results is None:
+            return [True] * len(messages)
+        return [self.results.pop(0) for _ in messages]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(outbox_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_token_bucket_burst_and_refill(clock):
+    bucket = TokenBucket(rate_per_minute=60, burst=3)
+    assert bucket.take(5) == 3
+    assert bucket.take(1) == 0
+    assert bucket.wait_time() == pytest.approx(1.0)
+
+    clock[0] += 2.5
+    assert bucket.take(5) == 2
+    clock[0] += 100
+    assert bucket.take(10) == 3  # Не больше ёмкости
+
+
+def test_enqueued_items_survive_restart(tmp_path):
+    box = Outbox(tmp_path, FakeSender())
+    item_id = box.enqueue("client@example.ru", "RE: 1", "Ответ", email_id="1")
+
+    with open(tmp_path / "pending" / f"{item_id}.json", encoding="utf-8") as f:
+        item = json.load(f)
+    assert item["attempts"] == 0 and item["provider"] == "smtp.example.ru"
+    assert Outbox(tmp_path, FakeSender()).depth == 1
+
+
+def test_successful_send_removes_file(tmp_path):
+    sender = FakeSender()
+    box = Outbox(tmp_path, sender)
+    box.enqueue("client@example.ru", "RE: 1", "Ответ", email_id="1")
+
+    due, _ = box._due()
+    box._send(due)
+    assert box.depth == 0
+    assert list((tmp_path / "pending").iterdir()) == []
+    assert sender.sent[0]["to_email"] == "client@example.ru"
+
+
+def test_failed_send_is_rescheduled_with_backoff(tmp_path):
+    box = Outbox(tmp_path, FakeSender([False, False]), backoff_base=30, backoff_max=50)
+    item_id = box.enqueue("client@example.ru", "RE: 1", "Ответ", email_id="1")
+    path = tmp_path / "pending" / f"{item_id}.json"
+
+    started = time.time()
+    box._send(box._due()[0])
+    item = json.loads(path.read_text(encoding="utf-8"))
+    assert item["attempts"] == 1
+    assert started + 30 * 0.8 <= item["next_attempt_at"] <= time.time() + 30 * 1.2
+    assert box._due()[0] == []  # Отложено
+
+    box._send([box._items[item_id]])
+    item = json.loads(path.read_text(encoding="utf-8"))
+    assert item["next_attempt_at"] <= time.time() + 50 * 1.2  # Задержка упирается в backoff_max
+
+
+def test_exhausted_item_moves_to_dead_letter(tmp_path):
+    box = Outbox(tmp_path, FakeSender([False, False]), max_attempts=2)
+    item_id = box.enqueue("client@example.ru", "RE: 1", "Ответ", email_id="1")
+
+    box._send(box._due()[0])
+    box._send([box._items[item_id]])
+    assert box.depth == 0
+    assert not (tmp_path / "pending" / f"{item_id}.json").exists()
+    dead = json.loads((tmp_path / "dead" / f"{item_id}.json").read_text(encoding="utf-8"))
+    assert dead["attempts"] == 2
+    assert Outbox(tmp_path, FakeSender()).stats()["dead_lettered"] == 1
@@ -0,0 +1,32 @@
+from app.services.keyword_matcher import KeywordMatch, KeywordMatcher
+from app.services.parser import Parser
+
+
+def mentions(text):
+    return {m['model']: [(x['text'], x['start'], x['end']) for x in m['mentions']]
+            for m in Parser().find_device_models(text)}
+
+
+def test_nested_synonyms_give_one_mention():
+    text = "Датчик ДГС ЭРИС-230 не работает"
+    assert mentions(text) == {"ДГС ЭРИС-230": [("ДГС ЭРИС-230", 8, 20)]}
+
+
+def test_separate_mentions_are_kept():
+    found = mentions("ДГС ЭРИС-230, ещё один ЭРИС-230 и 230")
+    assert found["ДГС ЭРИС-230"] == [("ДГС ЭРИС-230", 1, 13), ("ЭРИС-230", 24, 32), ("230", 35, 38)]
+
+
+def test_number_inside_phone_is_not_a_mention():
+    assert mentions("Позвоните 8 (912) 230-41-55") == {}
+
+
+def test_longest_is_leftmost_longest():
+    matches = [
+        KeywordMatch("a", "bcd", 1, 4),
+        KeywordMatch("a", "abc", 0, 3),
+        KeywordMatch("a", "ab", 0, 2),
+        KeywordMatch("b", "de", 3, 5),
+        KeywordMatch("b", "e", 4, 5),
+    ]
+    assert KeywordMatcher.longest(matches) == [matches[1], matches[3]]
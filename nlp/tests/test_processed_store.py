@@ -0,0 +1,66 @@
+import json
+import time
+
+from app.services.processed_store import ProcessedIdStore
+
+DAY = 86400
+
+
+def test_ids_survive_reload(tmp_path):
+    path = tmp_path / "processed_ids.log"
+    store = ProcessedIdStore(path, ttl_seconds=DAY)
+    store.add_many(["1:10", "<msg@example>", ""])
+
+    reloaded = ProcessedIdStore(path, ttl_seconds=DAY)
+    assert "1:10" in reloaded and "<msg@example>" in reloaded
+    assert len(reloaded) == 2
+
+
+def test_keys_with_separators_are_cleaned(tmp_path):
+    path = tmp_path / "processed_ids.log"
+    ProcessedIdStore(path, ttl_seconds=DAY).add("a\tb\nc")
+
+    assert "a b c" in ProcessedIdStore(path, ttl_seconds=DAY)
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 1
+
+
+def test_expired_ids_are_dropped_on_load(tmp_path):
+    path = tmp_path / "processed_ids.log"
+    now = time.time()
+    path.write_text(f"{now - 2 * DAY:.0f}\told\n{now:.0f}\tfresh\n", encoding="utf-8")
+
+    store = ProcessedIdStore(path, ttl_seconds=DAY)
+    assert "old" not in store and "fresh" in store
+
+
+def test_partial_last_line_is_dropped_and_file_rewritten(tmp_path):
+    path = tmp_path / "processed_ids.log"
+    path.write_bytes(f"{time.time():.0f}\tdone\n12345\thalf".encode())
+
+    store = ProcessedIdStore(path, ttl_seconds=DAY)
+    assert "done" in store and "half" not in store
+    assert path.read_text(encoding="utf-8").endswith("\tdone\n")
+
+
+def test_rewrite_keeps_only_live_ids(tmp_path, monkeypatch):
+    monkeypatch.setattr(ProcessedIdStore, "COMPACT_MIN_LINES", 4)
+    path = tmp_path / "processed_ids.log"
+    store = ProcessedIdStore(path, ttl_seconds=DAY)
+    for _ in range(4):
+        store.add("same")  # Повторы одного ID раздувают файл
+    store.prune()
+
+    assert path.read_text(encoding="utf-8").count("\tsame\n") == 1
+    assert "same" in ProcessedIdStore(path, ttl_seconds=DAY)
+
+
+def test_legacy_json_is_migrated_once(tmp_path):
+    path = tmp_path / "processed_ids.log"
+    legacy = tmp_path / "processed_emails.json"
+    legacy.write_text(json.dumps(["1", "2"]), encoding="utf-8")
+
+    store = ProcessedIdStore(path, ttl_seconds=DAY, legacy_json=legacy)
+    assert "1" in store and "2" in store
+    assert not legacy.exists()
+    assert (tmp_path / "processed_emails.json.migrated").exists()
+    assert len(ProcessedIdStore(path, ttl_seconds=DAY, legacy_json=legacy)) == 2
@@ -0,0 +1,88 @@
+import json
+
+from app.services.record_log import RecordLog, write_json_atomic
+
+
+def make_log(tmp_path, compact_every=1000):
+    return RecordLog(tmp_path / "records.json", compact_every=compact_every)
+
+
+def test_append_and_read_all_in_order(tmp_path):
+    records = make_log(tmp_path)
+    records.append([{"id": 1}, {"id": 2}])
+    records.append([{"id": 3}])
+
+    assert [r["id"] for r in records.read_all()] == [1, 2, 3]
+    assert records.list_segments() == [(0, tmp_path / "records.0.jsonl")]
+
+
+def test_compaction_writes_snapshot_and_next_segment(tmp_path):
+    records = make_log(tmp_path, compact_every=3)
+    records.append([{"id": 1}, {"id": 2}])
+    records.append([{"id": 3}])  # Третья запись — сжатие
+    records.append([{"id": 4}])
+
+    with open(tmp_path / "records.json", encoding="utf-8") as f:
+        snapshot = json.load(f)
+    assert snapshot == {"generation": 1, "records": [{"id": 1}, {"id": 2}, {"id": 3}]}
+    assert [generation for generation, _ in records.list_segments()] == [1]
+    assert [r["id"] for r in records.read_all()] == [1, 2, 3, 4]
+
+
+def test_legacy_list_snapshot_is_generation_zero(tmp_path):
+    write_json_atomic(tmp_path / "records.json", [{"id": 1}])
+    records = make_log(tmp_path)
+    records.append([{"id": 2}])
+
+    assert records.read_snapshot() == (0, [{"id": 1}])
+    assert [r["id"] for r in records.read_all()] == [1, 2]
+
+
+def test_crash_before_snapshot_replace_loses_nothing(tmp_path):
+    records = make_log(tmp_path)
+    records.append([{"id": 1}])
+    # Сбой сразу после создания сегмента следующего поколения
+    records.segment_path(1).touch()
+    records.append([{"id": 2}])
+
+    assert [r["id"] for r in make_log(tmp_path).read_all()] == [1, 2]
+
+
+def test_crash_before_segment_cleanup_does_not_duplicate(tmp_path):
+    records = make_log(tmp_path)
+    records.append([{"id": 1}, {"id": 2}])
+    old_segment = records.segment_path(0).read_bytes()
+    records.compact()
+    # Сбой до удаления сжатых сегментов: старый сегмент остался
+    records.segment_path(0).write_bytes(old_segment)
+
+    assert [r["id"] for r in make_log(tmp_path).read_all()] == [1, 2]
+
+
+def test_read_segment_skips_partial_line(tmp_path):
+    path = tmp_path / "records.0.jsonl"
+    path.write_bytes(b'{"id": 1}\n{"id": 2}\n{"id": 3')
+
+    records, offset = RecordLog.read_segment(path)
+    assert records == [{"id": 1}, {"id": 2}]
+    assert offset == len(b'{"id": 1}\n{"id": 2}\n')
+
+    with open(path, "ab") as f:
+        f.write(b'}\n')
+    assert RecordLog.read_segment(path, offset) == ([{"id": 3}], path.stat().st_size)
+
+
+def test_iter_newest_reads_snapshot_only_when_needed(tmp_path, monkeypatch):
+    records = make_log(tmp_path, compact_every=3)
+    records.append([{"id": 1}, {"id": 2}, {"id": 3}])
+    records.append([{"id": 4}, {"id": 5}])
+    # Сегмент, оставшийся от сбоя перед удалением: его записи уже в снимке
+    (tmp_path / "records.0.jsonl").write_text('{"id": 3}\n', encoding="utf-8")
+
+    assert [r["id"] for r in records.iter_newest()] == [5, 4, 3, 2, 1]
+
+    def no_snapshot():
+        raise AssertionError("снимок не должен читаться")
+    monkeypatch.setattr(records, "read_snapshot", no_snapshot)
+    newest = records.iter_newest()
+    assert [next(newest)["id"], next(newest)["id"]] == [5, 4]
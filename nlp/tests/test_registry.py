@@ -0,0 +1,45 @@
+import pytest
+
+from app.models.registry import ModelEntry, ModelRegistry
+
+
+class Degraded:
+    load_error = "NLI-модель не загружена: нет файла"
+
+
+def test_model_reporting_load_error_is_not_ready_but_usable():
+    registry = ModelRegistry()
+    calls = []
+    registry.register("classifier", lambda: calls.append(1) or Degraded())
+
+    instance = registry.get("classifier")
+    assert registry.get("classifier") is instance
+    assert len(calls) == 1
+    assert not registry.is_ready("classifier")
+    status = registry.status()["classifier"]
+    assert status["state"] == ModelEntry.ERROR
+    assert status["error"] == Degraded.load_error
+
+
+def test_failed_factory_is_retried_and_healthy_model_is_ready():
+    registry = ModelRegistry()
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("нет памяти")
+        return object()
+
+    registry.register("sentiment", flaky)
+    registry.load_all()
+    assert registry.status()["sentiment"]["state"] == ModelEntry.ERROR
+
+    registry.get("sentiment")
+    assert registry.is_ready("sentiment")
+    assert registry.status()["sentiment"]["error"] is None
+
+
+def test_unknown_model():
+    with pytest.raises(KeyError):
+        ModelRegistry().load("missing")
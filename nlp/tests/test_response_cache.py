@@ -0,0 +1,84 @@
+import time
+
+import numpy as np
+
+from app.models.response_cache import SemanticResponseCache
+
+RECORD = {"category": "Калибровка", "device_type": "ДГС", "fio": "Иванов Иван Иванович",
+          "phone": "+79120000000", "description": "интервал калибровки датчика"}
+OTHER = {**RECORD, "fio": "Петрова Анна Сергеевна", "description": "интервал калибровки датчика метана"}
+REPLY = "Уважаемый Иван Иванович!\nИнтервал калибровки — 6 месяцев."
+
+
+def encode(texts):
+    # Одинаковый вектор для всех описаний: близость всегда 1
+    return np.ones((len(texts), 4), dtype=np.float32) / 2
+
+
+def make_cache(path=None, **kwargs):
+    return SemanticResponseCache(encode, path, "test-encoder", **kwargs)
+
+
+def test_reply_is_depersonalized_and_personalized():
+    cache = make_cache()
+    vector, = cache.embed([RECORD])
+    assert cache.put(RECORD, vector, REPLY, generation_seconds=3.0)
+
+    reply = cache.get(OTHER, cache.embed([OTHER])[0])
+    assert reply == "Уважаемый(ая) Анна Сергеевна!\nИнтервал калибровки — 6 месяцев."
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["saved_generation_seconds"] == 3.0
+
+
+def test_reply_with_personal_data_is_not_cached():
+    cache = make_cache()
+    vector, = cache.embed([RECORD])
+    assert not cache.put(RECORD, vector, REPLY + "\nПерезвоним на +79120000000.", 1.0)
+    assert not cache.put(RECORD, vector, "Иванов, интервал — 6 месяцев.", 1.0)
+    assert cache.stats()["rejected"] == 2
+    assert cache.get(OTHER, vector) is None
+
+
+def test_lookup_is_scoped_by_category_and_device():
+    cache = make_cache()
+    vector, = cache.embed([RECORD])
+    cache.put(RECORD, vector, REPLY, 1.0)
+    assert cache.get({**OTHER, "device_type": "ПКГ"}, vector) is None
+    assert cache.get({**OTHER, "description": ""}, None) is None
+
+
+def test_ttl_and_lru_eviction(monkeypatch):
+    cache = make_cache(max_entries=2, ttl=100)
+    vector, = cache.embed([RECORD])
+    for device in ("a", "b", "c"):
+        cache.put({**RECORD, "device_type": device}, vector, REPLY, 1.0)
+    assert cache.stats()["entries"] == 2
+    assert cache.get({**OTHER, "device_type": "a"}, vector) is None
+
+    now = time.time()
+    monkeypatch.setattr("app.models.response_cache.time.time", lambda: now + 101)
+    assert cache.get({**OTHER, "device_type": "c"}, vector) is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_flush_merges_entries_of_other_processes(tmp_path):
+    path = tmp_path / "response_cache.json"
+    first, second = make_cache(path), make_cache(path)
+    vector, = first.embed([RECORD])
+    first.put(RECORD, vector, REPLY, 1.0)
+    second.put({**RECORD, "device_type": "ПКГ"}, vector, REPLY, 2.0)
+    first.flush()
+    second.flush()
+
+    reloaded = make_cache(path)
+    assert reloaded.stats()["entries"] == 2
+    assert reloaded.get(OTHER, vector) is not None
+    assert not path.with_name(path.name + ".lock").exists()
+
+
+def test_file_of_other_encoder_is_ignored(tmp_path):
+    path = tmp_path / "response_cache.json"
+    cache = make_cache(path)
+    cache.put(RECORD, cache.embed([RECORD])[0], REPLY, 1.0)
+    cache.flush()
+    assert SemanticResponseCache(encode, path, "other-encoder").stats()["entries"] == 0
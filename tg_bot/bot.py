@@ -2,9 +2,10 @@ import asyncio
 import aiohttp
 import json
 import os
+import time
 from datetime import datetime
 from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from config import BOT_TOKEN, ADMIN_ID, POLL_INTERVAL, API_URL, STATE_FILE
 
 bot = Bot(token=BOT_TOKEN)
@@ -12,6 +13,10 @@ dp = Dispatcher()
 
 sent_ids = set()
 
+# Не чаще раза в столько секунд правим сообщение при потоковом ответе (лимиты Telegram)
+STREAM_EDIT_INTERVAL = 1.5
+TELEGRAM_TEXT_LIMIT = 4000
+
 
 def load_state():
     """Загрузка ID отправленных тикетов из файла"""
@@ -188,6 +193,53 @@ async def cmd_check(message: types.Message):
         await message.answer("Доступ запрещён")
 
 
+async def stream_reply(email_id: str, msg: types.Message):
+    """Потоковая генерация ответа через API: сообщение дописывается по мере генерации"""
+    url = f"{API_URL}/{email_id}/response/stream"
+    text, shown, last_edit = "", "", 0.0
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, timeout=aiohttp.ClientTimeout(total=600)) as response:
+            if response.status != 200:
+                await msg.edit_text(f"⚠️ Ошибка API: {response.status}")
+                return
+            async for raw_line in response.content:
+                line = raw_line.decode('utf-8').strip()
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):])
+
+                if event['event'] == 'delta':
+                    text += event['text']
+                    if time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL and text.strip() != shown:
+                        shown = text.strip()
+                        await msg.edit_text(shown[-TELEGRAM_TEXT_LIMIT:] + " ▌")
+                        last_edit = time.monotonic()
+                elif event['event'] == 'done':
+                    await msg.edit_text(
+                        f"✅ Ответ на #{email_id} ({event.get('method')}):\n\n"
+                        f"{(event.get('body') or '')[:TELEGRAM_TEXT_LIMIT]}"
+                    )
+
+
+@dp.message(Command("reply"))
+async def cmd_reply(message: types.Message, command: CommandObject):
+    """Команда /reply <email_id> - сгенерировать ответ заново с потоковым выводом"""
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("Доступ запрещён")
+        return
+    email_id = (command.args or "").strip()
+    if not email_id:
+        await message.answer("Использование: /reply <email_id>")
+        return
+
+    msg = await message.answer(f"✍️ Генерирую ответ на #{email_id}...")
+    try:
+        await stream_reply(email_id, msg)
+    except Exception as e:
+        print(f"Ошибка потокового ответа: {e}")
+        await msg.edit_text(f"⚠️ Ошибка генерации ответа: {e}")
+
+
 async def background_polling():
     """Периодическая проверка новых тикетов"""
     while True: